@@ -0,0 +1,94 @@
+// Clientside callbacks, registered in main.py with `ClientsideFunction(namespace, function_name)`.
+window.dash_clientside = window.dash_clientside || {};
+
+window.dash_clientside.timeseries = {
+  // Render a timeseries figure from the base figure the server sends to its store, in absolute numbers
+  // on a linear scale (see `elements.get_timeseries_base`). Switching to log scale or per-capita values
+  // only rescales what the browser already has, so it needs no request to the server.
+  render: function(base, scale, per_capita) {
+    if (!base) {
+      return {data: [], layout: {}};
+    }
+    // rates aren't shown per capita
+    per_capita = base.per_capita ? per_capita : 'absolute';
+    var factor = per_capita === 'per_capita' ? base.per_what / base.population : 1;
+    var log = scale === 'Log' && base.log_scale;
+    var rescale = function(values) {
+      return values.map(function(value) { return value === null ? null : value * factor; });
+    };
+
+    var data = base.figure.data.map(function(trace) {
+      return Object.assign({}, trace, {y: rescale(trace.y)});
+    });
+    var layout = Object.assign({}, base.figure.layout);
+    layout.yaxis = Object.assign({}, layout.yaxis, {type: log ? 'log' : 'linear'});
+    // annotations sit a fixed offset above the value they mark
+    layout.annotations = layout.annotations.map(function(annotation, i) {
+      var y = (annotation.y - base.offsets[i]) * factor + base.offsets[i];
+      return Object.assign({}, annotation, {y: log ? Math.log10(y) : y});
+    });
+    layout.title = base.title;
+    if (per_capita === 'per_capita') {
+      layout.title += ', per ' + base.per_what.toLocaleString('en-US');
+    }
+    return {data: data, layout: layout};
+  }
+};
+
+window.dash_clientside.choropleth = {
+  // Recolor the choropleth for another date, from the values the server sends for it (see
+  // `elements.get_counties_colors`), keeping the geometry already in the browser. `base` has the region
+  // and color of the map the server last sent, with its figure unless it's the one the page loaded
+  // with, and `figure` is the one shown now.
+  recolor: function(base, colors, figure) {
+    var fig = base.figure || figure;
+    if (!colors || colors.region !== base.region || colors.color !== base.color ||
+        colors.z.length !== fig.data[0].z.length) {
+      return fig;
+    }
+    var trace = Object.assign({}, fig.data[0], {z: colors.z});
+    if (trace.customdata) {
+      trace.customdata = trace.customdata.map(function(row, i) { return [row[0], colors.infections[i]]; });
+    }
+    var layout = Object.assign({}, fig.layout, {title: Object.assign({}, fig.layout.title, {text: colors.title})});
+    return {data: [trace].concat(fig.data.slice(1)), layout: layout};
+  }
+};
+
+// Unpack the arrays packed by `serialize.typed_array`, {dtype: 'f4', bdata: <base64>}, anywhere in an
+// object, into typed arrays, which plotly draws without copying.
+var typedArrays = {
+  i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array,
+  i4: Int32Array, u4: Uint32Array, f4: Float32Array, f8: Float64Array
+};
+
+function unpackTypedArrays(value) {
+  if (value === null || typeof value !== 'object') {
+    return value;
+  }
+  if (Array.isArray(value)) {
+    return value.map(unpackTypedArrays);
+  }
+  if (typeof value.bdata === 'string' && typedArrays[value.dtype]) {
+    var binary = atob(value.bdata);
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+      bytes[i] = binary.charCodeAt(i);
+    }
+    return new typedArrays[value.dtype](bytes.buffer);
+  }
+  var unpacked = {};
+  Object.keys(value).forEach(function(key) { unpacked[key] = unpackTypedArrays(value[key]); });
+  return unpacked;
+}
+
+window.dash_clientside.embedding = {
+  // Render the embedding scatter plot from the figure the server sends to its store (see
+  // `elements.get_counties_embedding_figure`), with its coordinates and cluster indices packed.
+  render: function(figure) {
+    if (!figure) {
+      return {data: [], layout: {}};
+    }
+    return {data: unpackTypedArrays(figure.data), layout: figure.layout};
+  }
+};
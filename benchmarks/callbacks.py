@@ -0,0 +1,60 @@
+"""Build `/_dash-update-component` request bodies for the callbacks in `main.py`."""
+
+# input values for the initial state of the dashboard, by '{id}.{property}'
+default_values = {
+  # a click on Washington, on the map of the states, so the region callback has a state to drill into
+  'counties-display.clickData': {'points': [{'customdata': ['53000']}]},
+  'region-dropdown.value': None,
+  'counties-date-slider.value': -1,
+  'counties-color-radioitems.value': 'infections_per_capita',
+  'counties-embedding-display.clickData': None,
+  'similar-counties-display.clickData': None,
+  'similar-counties-space-radioitems.value': 'features',
+  'growth-ranking-display.clickData': None,
+  'growth-window-dropdown.value': 7,
+  'growth-measure-radioitems.value': 'absolute',
+  'effect-intervention-dropdown.value': 'stay at home',
+  'effect-window-dropdown.value': 14,
+  'effect-group-radioitems.value': 'state',
+  'embedding-features-dropdown.value': None,
+  'embedding-jobs-interval.n_intervals': None,
+  'embedding-features-store.data': None,
+  'counties-dropdown.value': '53033',
+  'timeseries-type-dropdown.value': 'infections',
+  'interventions-dropdown.value': 'stay at home',
+  'timeseries-mode-radioitems.value': 'Date',
+  'timeseries-scale-radioitems.value': 'Linear',
+  'timeseries-percapita-radioitems.value': 'absolute',
+  'timeseries-display.relayoutData': None,
+  'timeseries-gradient-display.relayoutData': None,
+}
+
+
+def get_callback_body(app, output, values=None, changed=None):
+  """Get the json body Dash's renderer would POST for a callback.
+
+  :param app: the dash app.
+  :param output: the callback id, e.g. 'timeseries-store.data'.
+  :param values: input values by '{id}.{property}', overriding `default_values`.
+  :param changed: the '{id}.{property}' that triggered the callback. Defaults to the first input.
+  :returns: request body
+  :rtype: dict
+
+  """
+  all_values = dict(default_values)
+  if values is not None:
+    all_values.update(values)
+
+  spec = app.callback_map[output]
+  inputs = [dict(id=i['id'], property=i['property'], value=all_values.get(f"{i['id']}.{i['property']}"))
+            for i in spec['inputs']]
+  state = [dict(id=s['id'], property=s['property'], value=all_values.get(f"{s['id']}.{s['property']}"))
+           for s in spec['state']]
+  if changed is None:
+    changed = f"{inputs[0]['id']}.{inputs[0]['property']}"
+  return dict(output=output, inputs=inputs, state=state, changedPropIds=[changed])
+
+
+def get_callback_outputs(app):
+  """List the ids of the callbacks run on the server, in the order they were registered."""
+  return [output for output, spec in app.callback_map.items() if 'callback' in spec]
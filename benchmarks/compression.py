@@ -0,0 +1,102 @@
+"""Measure response sizes and latencies with and without compression and ETag revalidation.
+
+Run from the repository root, with the data folder linked:
+```sh
+python -m benchmarks.compression --output compression.json
+```
+
+"""
+
+import json
+import time
+import argparse
+import numpy as np
+
+from benchmarks.callbacks import get_callback_body, get_callback_outputs
+
+
+def time_request(client, method, path, repeat, **kwargs):
+  """Issue a request `repeat` times.
+
+  :returns: (last response, median latency in milliseconds)
+
+  """
+  times = []
+  for _ in range(repeat):
+    t = time.perf_counter()
+    response = getattr(client, method)(path, **kwargs)
+    times.append(1000 * (time.perf_counter() - t))
+  return response, float(np.median(times))
+
+
+def measure(client, responses, name, method, path, repeat, body=None):
+  """Measure one payload in each encoding, uncached, cached and revalidated."""
+  kwargs = {} if body is None else dict(json=body)
+  result = dict(name=name)
+  for encoding in ['identity', 'gzip', 'br']:
+    responses.cache.clear()
+    response = getattr(client, method)(path, headers={'Accept-Encoding': encoding}, **kwargs)
+    assert response.status_code == 200, f'{name}: {response.status_code}'
+    actual_encoding = response.headers.get('Content-Encoding', 'identity')
+    result[f'{encoding}_bytes'] = len(response.get_data()) if actual_encoding == encoding else None
+
+  etag = response.get_etag()[0]
+  headers = {'Accept-Encoding': 'gzip, br'}
+
+  def uncached():
+    responses.cache.clear()
+    return getattr(client, method)(path, headers=headers, **kwargs)
+
+  times = []
+  for _ in range(repeat):
+    t = time.perf_counter()
+    uncached()
+    times.append(1000 * (time.perf_counter() - t))
+  result['uncached_ms'] = float(np.median(times))
+  _, result['cached_ms'] = time_request(client, method, path, repeat, headers=headers, **kwargs)
+  if etag is None:
+    # no validator, since the response depends on server state
+    result['not_modified_ms'] = None
+    return result
+
+  response, result['not_modified_ms'] = time_request(
+    client, method, path, repeat, headers=dict(headers, **{'If-None-Match': f'"{etag}"'}), **kwargs)
+  assert response.status_code == 304, f'{name}: expected 304, got {response.status_code}'
+  return result
+
+
+def main(*, repeat, output):
+  import main as dashboard
+
+  client = dashboard.app.server.test_client()
+  results = [measure(client, dashboard.responses, 'layout', 'get', '/_dash-layout', repeat)]
+  for callback in get_callback_outputs(dashboard.app):
+    body = get_callback_body(dashboard.app, callback)
+    results.append(measure(client, dashboard.responses, callback, 'post', '/_dash-update-component', repeat,
+                           body=body))
+
+  print(f"{'payload':40s} {'identity':>10s} {'gzip':>10s} {'br':>10s} {'saved':>7s} "
+        f"{'uncached':>10s} {'cached':>8s} {'304':>8s}")
+  for result in results:
+    compressed = [b for b in [result['br_bytes'], result['gzip_bytes']] if b is not None]
+    saved = 1 - min(compressed) / result['identity_bytes'] if compressed else 0.
+    result['saved'] = saved
+    sizes = [f"{b:10,d}" if b is not None else f"{'-':>10s}"
+             for b in [result['identity_bytes'], result['gzip_bytes'], result['br_bytes']]]
+    not_modified = f"{result['not_modified_ms']:6.2f}ms" if result['not_modified_ms'] is not None else f"{'-':>8s}"
+    print(f"{result['name']:40s} {' '.join(sizes)} {saved:7.1%} "
+          f"{result['uncached_ms']:8.2f}ms {result['cached_ms']:6.2f}ms {not_modified}")
+
+  if output is not None:
+    with open(output, 'w') as file:
+      json.dump(dict(version=dashboard.data.version, results=results), file, indent=2)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--repeat', default=10, type=int, help='number of requests to time per payload')
+  parser.add_argument('--output', default=None, help='json file to write the results to')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
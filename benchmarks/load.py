@@ -0,0 +1,433 @@
+"""Load-test a running dashboard by replaying user sessions against its callback endpoint.
+
+Each virtual user loads the page (the layout and every callback the renderer fires on load) and then
+makes random interactions: clicking a county on the map, the embedding or the growth ranking, picking
+a region, a date, a county or a timeseries type, and toggling the radio items. Each interaction POSTs
+to `/_dash-update-component` every server callback that depends on what changed, and then the
+callbacks that depend on their outputs in turn, as the Dash renderer does. Only HTTP is used, the
+callbacks and input values are read from `/_dash-dependencies` and `/_dash-layout`, so it runs
+against any server, e.g. gunicorn with several workers:
+```sh
+gunicorn -c gunicorn.conf.py main:server
+python -m benchmarks.load --url http://127.0.0.1:8050 --concurrency 1,2,4,8 --output load.json
+```
+or, to start gunicorn itself, `--workers 4`.
+
+Concurrency is ramped through the given levels, with the same number of sessions per user at each,
+and the latency of each callback (p50/p95/p99) and the throughput are reported per level. The sessions
+are seeded, so runs with the same arguments make the same requests. `--baseline` compares against an
+earlier `--output` and exits with status 1 if any callback's p95 latency or the throughput regressed
+by more than `--tolerance`. The server caches callback responses, so compare runs against freshly
+started servers, as `--workers` does.
+
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import argparse
+import threading
+import subprocess
+import http.client
+import collections
+import urllib.parse
+import numpy as np
+
+from benchmarks.timing import write_results
+
+
+class Client(object):
+  """A keep-alive HTTP connection to the dashboard, one per virtual user."""
+  def __init__(self, url, timeout=60):
+    url = urllib.parse.urlsplit(url)
+    self.prefix = url.path.rstrip('/')
+    self.connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+
+  def request(self, method, path, body=None):
+    """Make a request.
+
+    :returns: (status, decoded json body or None, latency in seconds)
+    :rtype: tuple
+
+    """
+    headers = {'Accept-Encoding': 'gzip'}
+    if body is not None:
+      body = json.dumps(body)
+      headers['Content-Type'] = 'application/json'
+    t = time.perf_counter()
+    try:
+      self.connection.request(method, self.prefix + path, body=body, headers=headers)
+      response = self.connection.getresponse()
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+      # the server closed the kept-alive connection, so open a new one
+      self.connection.close()
+      self.connection.request(method, self.prefix + path, body=body, headers=headers)
+      response = self.connection.getresponse()
+    content = response.read()
+    latency = time.perf_counter() - t
+    if response.status != 200:
+      return response.status, None, latency
+    if response.getheader('Content-Encoding') == 'gzip':
+      content = gzip.decompress(content)
+    return response.status, json.loads(content), latency
+
+  def close(self):
+    self.connection.close()
+
+
+def get_layout_values(layout):
+  """Get the value of every prop of every component with an id in a layout, by '{id}.{property}'."""
+  values = {}
+  stack = [layout]
+  while stack:
+    node = stack.pop()
+    if isinstance(node, list):
+      stack += node
+    elif isinstance(node, dict) and 'props' in node:
+      props = node['props']
+      if isinstance(props.get('id'), str):
+        values.update({f"{props['id']}.{prop}": value for prop, value in props.items()})
+      stack.append(props.get('children'))
+  return values
+
+
+def get_option_values(values, component_id):
+  return [option['value'] for option in values.get(f'{component_id}.options') or []]
+
+
+def get_initial_order(callbacks):
+  """Order callbacks so each comes after the callbacks that output its inputs."""
+  outputs = {callback['output']: {f"{o['id']}.{o['property']}" for o in get_outputs(callback)}
+             for callback in callbacks}
+  ordered = []
+  pending = list(callbacks)
+  while pending:
+    pending_outputs = set().union(*(outputs[callback['output']] for callback in pending))
+    ready = [callback for callback in pending
+             if not any(f"{i['id']}.{i['property']}" in pending_outputs - outputs[callback['output']]
+                        for i in callback['inputs'])]
+    if not ready:
+      # a cycle, which dash doesn't allow anyway
+      ready = pending
+    ordered += ready
+    pending = [callback for callback in pending if callback not in ready]
+  return ordered
+
+
+class Dashboard(object):
+  """The callbacks of a dashboard and the choices its controls offer, as read from the server."""
+  # controls whose value is picked from their options
+  option_controls = [
+    'region-dropdown',
+    'counties-color-radioitems',
+    'counties-dropdown',
+    'timeseries-type-dropdown',
+    'interventions-dropdown',
+    'timeseries-mode-radioitems',
+    'growth-window-dropdown',
+    'growth-measure-radioitems',
+    'effect-intervention-dropdown',
+    'effect-window-dropdown',
+    'effect-group-radioitems',
+    'similar-counties-space-radioitems']
+
+  # graphs whose clicks select a county, and the customdata of a click on one
+  click_graphs = {
+    'counties-display': lambda fips: [fips],
+    'counties-embedding-display': lambda fips: fips,
+    'growth-ranking-display': lambda fips: fips}
+
+  def __init__(self, client):
+    status, layout, _ = client.request('GET', '/_dash-layout')
+    if status != 200:
+      raise RuntimeError(f'GET /_dash-layout: {status}')
+    status, dependencies, _ = client.request('GET', '/_dash-dependencies')
+    if status != 200:
+      raise RuntimeError(f'GET /_dash-dependencies: {status}')
+
+    self.initial_values = get_layout_values(layout)
+    # clientside callbacks run in the browser
+    self.callbacks = [d for d in dependencies if not d.get('clientside_function')]
+    self.dependents = collections.defaultdict(list)
+    for callback in self.callbacks:
+      for i in callback['inputs']:
+        self.dependents[f"{i['id']}.{i['property']}"].append(callback)
+
+    self.initial_order = get_initial_order(self.callbacks)
+    self.options = {component_id: get_option_values(self.initial_values, component_id)
+                    for component_id in self.option_controls}
+    self.options = {component_id: options for component_id, options in self.options.items() if options}
+    self.fips_codes = self.options.get('counties-dropdown', [])
+    slider_min = self.initial_values.get('counties-date-slider.min')
+    slider_max = self.initial_values.get('counties-date-slider.max')
+    self.date_indices = None if slider_max is None else range(slider_min, slider_max + 1)
+
+  def get_interactions(self):
+    """List the names of the interactions a user can make."""
+    interactions = [f'pick {component_id}' for component_id in self.options]
+    if self.fips_codes:
+      interactions += [f'click {graph_id}' for graph_id in self.click_graphs]
+    if self.date_indices is not None:
+      interactions.append('drag counties-date-slider')
+    return interactions
+
+  def interact(self, interaction, rng):
+    """Make the change to the inputs an interaction makes.
+
+    :returns: the new values, by '{id}.{property}'
+    :rtype: dict
+
+    """
+    action, component_id = interaction.split(' ')
+    if action == 'pick':
+      options = self.options[component_id]
+      return {f'{component_id}.value': options[rng.integers(len(options))]}
+    if action == 'click':
+      fips = self.fips_codes[rng.integers(len(self.fips_codes))]
+      return {f'{component_id}.clickData': {'points': [{'customdata': self.click_graphs[component_id](fips)}]}}
+    return {f'{component_id}.value': int(self.date_indices[rng.integers(len(self.date_indices))])}
+
+
+def get_outputs(callback):
+  # '..a.b...c.d..' for multi-output callbacks, 'a.b' otherwise
+  output = callback['output']
+  if output.startswith('..'):
+    parts = output[2:-2].split('...')
+  else:
+    parts = [output]
+  return [dict(zip(['id', 'property'], part.rsplit('.', 1))) for part in parts]
+
+
+def get_body(callback, values, changed):
+  """Get the body the renderer POSTs to run a callback, with the inputs in `values`."""
+  def get_values(specs):
+    return [dict(id=s['id'], property=s['property'], value=values.get(f"{s['id']}.{s['property']}"))
+            for s in specs]
+  return dict(output=callback['output'], inputs=get_values(callback['inputs']),
+              state=get_values(callback['state']), changedPropIds=changed)
+
+
+class Recorder(object):
+  """Latencies and errors by request name, shared by the users."""
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.latencies = collections.defaultdict(list)
+    self.errors = collections.Counter()
+
+  def record(self, name, status, latency):
+    with self.lock:
+      self.latencies[name].append(latency)
+      if status not in (200, 204):
+        self.errors[name] += 1
+
+
+def fire(client, dashboard, values, changed, recorder, max_rounds=10):
+  """Run the server callbacks that depend on the `changed` inputs, then those that depend on their
+  outputs, and so on, updating `values` with their outputs."""
+  for _ in range(max_rounds):
+    callbacks = {}
+    for prop_id in changed:
+      for callback in dashboard.dependents.get(prop_id, []):
+        callbacks[callback['output']] = callback
+    if not callbacks:
+      return
+    outputs = []
+    for callback in callbacks.values():
+      inputs = {f"{i['id']}.{i['property']}" for i in callback['inputs']}
+      outputs += run_callback(client, callback, values, [prop_id for prop_id in changed if prop_id in inputs],
+                              recorder)
+    changed = outputs
+
+
+def run_callback(client, callback, values, changed, recorder):
+  """POST a callback, updating `values` with its outputs.
+
+  :returns: the '{id}.{property}' it output
+  :rtype: list
+
+  """
+  status, response, latency = client.request('POST', '/_dash-update-component', get_body(callback, values, changed))
+  recorder.record(callback['output'], status, latency)
+  if response is None:
+    return []
+  outputs = []
+  for component_id, props in response['response'].items():
+    for prop, value in props.items():
+      values[f'{component_id}.{prop}'] = value
+      outputs.append(f'{component_id}.{prop}')
+  return outputs
+
+
+def run_session(client, dashboard, interactions, recorder, rng, think_s):
+  """Load the page and make `interactions` random interactions."""
+  status, _, latency = client.request('GET', '/_dash-layout')
+  recorder.record('layout', status, latency)
+  values = dict(dashboard.initial_values)
+  # on load, the renderer fires every callback once, after the callbacks that output its inputs
+  for callback in dashboard.initial_order:
+    run_callback(client, callback, values, [f"{i['id']}.{i['property']}" for i in callback['inputs']], recorder)
+
+  choices = dashboard.get_interactions()
+  for _ in range(interactions):
+    if think_s > 0:
+      time.sleep(think_s)
+    changed = dashboard.interact(choices[rng.integers(len(choices))], rng)
+    values.update(changed)
+    fire(client, dashboard, values, list(changed), recorder)
+
+
+def percentiles(latencies):
+  latencies = 1000 * np.array(latencies)
+  p50, p95, p99 = np.quantile(latencies, [0.5, 0.95, 0.99])
+  return dict(n=len(latencies), p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99),
+              mean_ms=float(latencies.mean()), max_ms=float(latencies.max()))
+
+
+def run_level(url, dashboard, concurrency, sessions, interactions, seed, think_s):
+  """Run `concurrency` users at once, each making `sessions` sessions.
+
+  :returns: one result per request name, and one for all of them with the throughput
+  :rtype: list
+
+  """
+  recorder = Recorder()
+  failures = []
+
+  def user(index):
+    client = Client(url)
+    rng = np.random.default_rng((seed, concurrency, index))
+    try:
+      for _ in range(sessions):
+        run_session(client, dashboard, interactions, recorder, rng, think_s)
+    except Exception as e:
+      failures.append(e)
+    finally:
+      client.close()
+
+  threads = [threading.Thread(target=user, args=(index,)) for index in range(concurrency)]
+  t = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  wall_s = time.perf_counter() - t
+  if failures:
+    raise failures[0]
+
+  results = [dict(concurrency=concurrency, name=name, errors=recorder.errors[name], **percentiles(latencies))
+             for name, latencies in sorted(recorder.latencies.items())]
+  all_latencies = [latency for latencies in recorder.latencies.values() for latency in latencies]
+  results.append(dict(concurrency=concurrency, name='all', errors=sum(recorder.errors.values()),
+                      wall_s=wall_s, requests_per_s=len(all_latencies) / wall_s,
+                      sessions_per_s=concurrency * sessions / wall_s, **percentiles(all_latencies)))
+  return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms, min_requests=20):
+  """Find the callbacks whose p95 latency, and the levels whose throughput, regressed against a baseline.
+
+  :param min_delta_ms: ignore p95 differences smaller than this, which are noise.
+  :param min_requests: ignore the p95 of callbacks requested fewer times than this, which is about
+    their maximum.
+  :returns: descriptions of the regressions
+  :rtype: list
+
+  """
+  before = {(r['concurrency'], r['name']): r for r in baseline['results']}
+  regressions = []
+  for result in results:
+    old = before.get((result['concurrency'], result['name']))
+    if old is None:
+      continue
+    name = f"{result['name']} at concurrency {result['concurrency']}"
+    if (min(result['n'], old['n']) >= min_requests
+        and result['p95_ms'] > (1 + tolerance) * old['p95_ms']
+        and result['p95_ms'] - old['p95_ms'] > min_delta_ms):
+      regressions.append(f"{name}: p95 {old['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+    if 'requests_per_s' in result and result['requests_per_s'] < old['requests_per_s'] / (1 + tolerance):
+      regressions.append(f"{name}: {old['requests_per_s']:.1f} -> {result['requests_per_s']:.1f} requests/s")
+  return regressions
+
+
+def serve(port, workers, timeout=600):
+  """Start the dashboard under gunicorn, and wait until it answers."""
+  env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers))
+  process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:server'], env=env)
+  url = f'http://127.0.0.1:{port}'
+  start = time.time()
+  while time.time() - start < timeout:
+    if process.poll() is not None:
+      raise RuntimeError(f'gunicorn exited with {process.returncode}')
+    try:
+      client = Client(url, timeout=5)
+      client.request('GET', '/_dash-dependencies')
+      client.close()
+      return process, url
+    except OSError:
+      time.sleep(1)
+  process.terminate()
+  raise RuntimeError(f'the dashboard did not start within {timeout}s')
+
+
+def main(*, url, workers, port, concurrency, sessions, interactions, think_ms, seed, output, baseline,
+         tolerance, min_delta_ms):
+  process = None
+  if workers is not None:
+    process, url = serve(port, workers)
+  try:
+    client = Client(url)
+    dashboard = Dashboard(client)
+    client.close()
+
+    results = []
+    for level in [int(c) for c in concurrency.split(',')]:
+      level_results = run_level(url, dashboard, level, sessions, interactions, seed, think_ms / 1000)
+      total = level_results[-1]
+      print(f"concurrency {level}: {total['n']} requests in {total['wall_s']:.1f}s, "
+            f"{total['requests_per_s']:.1f} requests/s, {total['sessions_per_s']:.2f} sessions/s, "
+            f"{total['errors']} errors")
+      print(f"  {'request':60s} {'n':>6s} {'p50':>10s} {'p95':>10s} {'p99':>10s} {'errors':>7s}")
+      for result in level_results:
+        print(f"  {result['name'][:60]:60s} {result['n']:6d} {result['p50_ms']:8.2f}ms {result['p95_ms']:8.2f}ms "
+              f"{result['p99_ms']:8.2f}ms {result['errors']:7d}")
+      results += level_results
+  finally:
+    if process is not None:
+      process.terminate()
+      process.wait()
+
+  if output is not None:
+    write_results(output, results, url=url, workers=workers, sessions=sessions, interactions=interactions,
+                  think_ms=think_ms, seed=seed)
+
+  if baseline is not None:
+    with open(baseline) as file:
+      regressions = compare(results, json.load(file), tolerance, min_delta_ms)
+    for regression in regressions:
+      print(f'regression: {regression}')
+    if regressions:
+      sys.exit(1)
+    print(f'no regressions against {baseline}')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--url', default='http://127.0.0.1:8050', help='the running dashboard')
+  parser.add_argument('--workers', default=None, type=int,
+                      help='start the dashboard under gunicorn with this many workers, instead of using --url')
+  parser.add_argument('--port', default=8051, type=int, help='port to start the dashboard on, with --workers')
+  parser.add_argument('--concurrency', default='1,2,4,8', help='comma-separated numbers of concurrent users to ramp through')
+  parser.add_argument('--sessions', default=3, type=int, help='number of sessions per user at each level')
+  parser.add_argument('--interactions', default=10, type=int, help='number of interactions per session')
+  parser.add_argument('--think-ms', default=0, type=float, help='pause before each interaction')
+  parser.add_argument('--seed', default=0, type=int, help='random seed for the sessions')
+  parser.add_argument('--output', default=None, help='json file to write the results to')
+  parser.add_argument('--baseline', default=None, help='results of an earlier run to check for regressions against')
+  parser.add_argument('--tolerance', default=0.25, type=float, help='fraction by which a result may regress')
+  parser.add_argument('--min-delta-ms', default=2., type=float, help='ignore p95 regressions smaller than this')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
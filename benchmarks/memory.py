@@ -0,0 +1,50 @@
+"""Compare the memory held by `DashboardData` with and without compact dtypes.
+
+Builds the data from the csv files both ways and prints `memory_report()` side by side:
+```sh
+python -m benchmarks.memory --data-dir benchmark_data/3000x200_seed0
+```
+
+"""
+
+from os.path import join
+import json
+import argparse
+import pandas as pd
+
+from utils.data import DashboardData
+
+
+def main(*, data_dir, output_dir, json_output):
+  if output_dir is None:
+    output_dir = join(data_dir, 'output')
+
+  reports = {}
+  for compact in [False, True]:
+    data = DashboardData(data_dir=data_dir, output_dir=output_dir, compact=compact)
+    reports['compact' if compact else 'default'] = data.memory_report()['bytes']
+  report = pd.DataFrame(reports).fillna(0).astype(int)
+  report['saved'] = report['default'] - report['compact']
+  report = report.sort_values('default', ascending=False)
+
+  mb = 1 / 2 ** 20
+  print(f"{'attribute':32s} {'default':>10s} {'compact':>10s} {'saved':>10s}")
+  for name, row in report.iterrows():
+    print(f"{name[:32]:32s} {row['default'] * mb:8.2f}MB {row['compact'] * mb:8.2f}MB {row['saved'] * mb:8.2f}MB")
+  total = report.sum()
+  print(f"{'total':32s} {total['default'] * mb:8.2f}MB {total['compact'] * mb:8.2f}MB {total['saved'] * mb:8.2f}MB")
+
+  if json_output is not None:
+    with open(json_output, 'w') as file:
+      json.dump(report.to_dict(orient='index'), file, indent=2)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--data-dir', default='data', help='directory with the csv files')
+  parser.add_argument('--output-dir', default=None, help='directory with the cached embedding, DATA_DIR/output by default')
+  parser.add_argument('--json-output', default=None, help='write the report to this file')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
@@ -0,0 +1,66 @@
+"""Measure the overhead of the metrics instrumentation on the dashboard callbacks.
+
+Each callback is timed through the flask test client before and after `metrics.install`, with the
+response cache cleared so the callback always runs:
+```sh
+python -m benchmarks.metrics_overhead --output metrics_overhead.json
+```
+
+"""
+
+import argparse
+
+from utils import elements
+from utils.metrics import Metrics
+from benchmarks.timing import time_function, write_results
+from benchmarks.callbacks import get_callback_body, get_callback_outputs
+
+
+def time_callbacks(dashboard, client, repeat):
+  def post(body):
+    dashboard.responses.cache.clear()
+    response = client.post('/_dash-update-component', json=body, headers={'Accept-Encoding': 'gzip, br'})
+    assert response.status_code == 200, f"{body['output']}: {response.status_code}"
+
+  return {callback: time_function(post, get_callback_body(dashboard.app, callback), repeat=repeat)[0]
+          for callback in get_callback_outputs(dashboard.app)}
+
+
+def main(*, repeat, output):
+  import main as dashboard
+
+  # the overhead of the wrapper itself, on a function that does nothing
+  metrics = Metrics()
+  noop = metrics.timed(lambda: None, 'noop_seconds', 'func')
+  wrapper_summary, _ = time_function(lambda: [noop() for _ in range(1000)], repeat=repeat)
+  baseline_summary, _ = time_function(lambda: [(lambda: None)() for _ in range(1000)], repeat=repeat)
+  wrapper_us = wrapper_summary['median_ms'] - baseline_summary['median_ms']
+  print(f'timing wrapper: {wrapper_us:.2f}us per call')
+
+  client = dashboard.app.server.test_client()
+  before = time_callbacks(dashboard, client, repeat)
+  metrics.register_cache('responses', dashboard.responses.stats)
+  metrics.install(dashboard.app, modules=[elements])
+  after = time_callbacks(dashboard, client, repeat)
+
+  results = []
+  print(f"{'callback':40s} {'disabled':>10s} {'enabled':>10s} {'overhead':>10s}")
+  for callback in before:
+    disabled = before[callback]['median_ms']
+    enabled = after[callback]['median_ms']
+    results.append(dict(name=callback, disabled_ms=disabled, enabled_ms=enabled,
+                        overhead_ms=enabled - disabled, overhead=(enabled - disabled) / disabled))
+    print(f'{callback:40s} {disabled:8.2f}ms {enabled:8.2f}ms {(enabled - disabled) / disabled:10.1%}')
+
+  if output is not None:
+    write_results(output, results, wrapper_us=wrapper_us)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--repeat', default=20, type=int, help='number of requests to time per callback')
+  parser.add_argument('--output', default=None, help='json file to write the results to')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
@@ -0,0 +1,78 @@
+"""Compare the time to encode each figure with plotly's json encoder and with `serialize.dumps`.
+
+Checks that both give the same json, and times them on the choropleth, the embedding, the clustering
+and the timeseries figures:
+```sh
+python -m benchmarks.serialization --data-dir benchmark_data/3000x200_seed0
+```
+
+"""
+
+from os.path import join
+import json
+import argparse
+import numpy as np
+import plotly
+
+from utils.data import DashboardData
+from utils import elements
+from utils import serialize
+from benchmarks.timing import time_function
+
+
+def get_figures(data):
+  return [
+    ('counties choropleth', elements.get_counties_figure(data)),
+    ('embedding', elements.get_counties_embedding_figure(data)),
+    ('clustering', elements.get_counties_clustering_figure(data)),
+    ('timeseries', elements.get_timeseries_figure(data))]
+
+
+def same_json(a, b):
+  # orjson writes float32 values with fewer digits than plotly
+  if isinstance(a, float) and isinstance(b, (int, float)):
+    return a == b or np.float32(a) == np.float32(b)
+  if isinstance(a, dict):
+    return isinstance(b, dict) and a.keys() == b.keys() and all(same_json(a[k], b[k]) for k in a)
+  if isinstance(a, list):
+    return isinstance(b, list) and len(a) == len(b) and all(same_json(x, y) for x, y in zip(a, b))
+  return a == b
+
+
+def plotly_dumps(fig):
+  return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def main(*, data_dir, output_dir, repeat, json_output):
+  if output_dir is None:
+    output_dir = join(data_dir, 'output')
+  data = DashboardData.load(data_dir=data_dir, output_dir=output_dir)
+
+  print(f"encoding with {'orjson' if serialize.orjson is not None else 'the plotly encoder (orjson is not installed)'}")
+  print(f"{'figure':24s} {'bytes':>10s} {'plotly':>10s} {'fast':>10s} {'speedup':>8s}")
+  results = []
+  for name, fig in get_figures(data):
+    plotly_summary, expected = time_function(plotly_dumps, fig, repeat=repeat)
+    fast_summary, encoded = time_function(serialize.dumps, fig, repeat=repeat)
+    if not same_json(json.loads(expected), json.loads(encoded)):
+      raise RuntimeError(f'{name}: the encodings differ')
+    speedup = plotly_summary['median_ms'] / fast_summary['median_ms']
+    print(f"{name:24s} {len(encoded):10,d} {plotly_summary['median_ms']:8.2f}ms {fast_summary['median_ms']:8.2f}ms "
+          f"{speedup:7.1f}x")
+    results.append(dict(name=name, bytes=len(encoded), plotly=plotly_summary, fast=fast_summary))
+
+  if json_output is not None:
+    with open(json_output, 'w') as file:
+      json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--data-dir', default='data', help='directory with the csv files')
+  parser.add_argument('--output-dir', default=None, help='directory with the cached embedding, DATA_DIR/output by default')
+  parser.add_argument('--repeat', default=20, type=int, help='number of timed encodings of each figure')
+  parser.add_argument('--json-output', default=None, help='write the timings to this file')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
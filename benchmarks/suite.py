@@ -0,0 +1,139 @@
+"""Benchmark the data core, the figure builders and the dashboard callbacks on synthetic data.
+
+Nothing here reads `./data` or the network, so results are comparable between machines and over time.
+Each run writes a json file named by its timestamp and scale:
+```sh
+python -m benchmarks.suite --counties 3000 --dates 200 --results-dir benchmark_results
+```
+
+"""
+
+from os.path import join, exists
+import os
+import time
+import shutil
+import argparse
+import datetime as dt
+
+from utils.data import DashboardData
+from utils import elements
+from benchmarks import synthetic
+from benchmarks.timing import summarize, time_function, write_results
+from benchmarks.callbacks import get_callback_body, get_callback_outputs
+
+
+def benchmark_construction(data_dir, output_dir, repeat):
+  """Time `DashboardData()`, cold (fitting the embedding and clustering) and warm (loading them)."""
+  if exists(output_dir):
+    shutil.rmtree(output_dir)
+  t = time.perf_counter()
+  data = DashboardData(data_dir=data_dir, output_dir=output_dir)
+  results = [dict(group='construction', name='DashboardData (cold)', **summarize([time.perf_counter() - t]))]
+  summary, data = time_function(DashboardData, data_dir=data_dir, output_dir=output_dir, repeat=repeat, warmup=0)
+  results.append(dict(group='construction', name='DashboardData (warm)', **summary))
+  return results, data
+
+
+def get_figure_variants(data):
+  """List (name, function) for every figure builder in `elements`, over the options the dashboard offers."""
+  variants = [
+    ('get_counties_display', lambda: elements.get_counties_display(data)),
+    ('get_counties_embedding_figure', lambda: elements.get_counties_embedding_figure(data)),
+    ('get_counties_clustering_figure', lambda: elements.get_counties_clustering_figure(data))]
+  for timeseries_type in ['infections', 'deaths']:
+    for gradient in [False, True]:
+      for mode in ['Date', 'Threshold']:
+        for per_capita in [False, True]:
+          name = (f'get_timeseries_figure({timeseries_type}, mode={mode}, gradient={gradient}, '
+                  f'per_capita={per_capita})')
+          variants.append((name, lambda t=timeseries_type, g=gradient, m=mode, p=per_capita: (
+            elements.get_timeseries_figure(data, t, mode=m, per_capita=p, gradient=g))))
+  variants.append(('get_timeseries_figure(infections, scale=Log)',
+                   lambda: elements.get_timeseries_figure(data, 'infections', scale='Log')))
+  variants.append(('get_timeseries_figure(infections, daily=True)',
+                   lambda: elements.get_timeseries_figure(data, 'infections', daily=True)))
+  return variants
+
+
+def benchmark_figures(data, repeat):
+  results = []
+  for name, func in get_figure_variants(data):
+    summary, _ = time_function(func, repeat=repeat)
+    results.append(dict(group='figures', name=name, **summary))
+  return results
+
+
+def benchmark_callbacks(data_dir, output_dir, repeat):
+  """Time a POST to each callback in `main.py`, through the flask test client.
+
+  The response cache is cleared before each request, so every callback actually runs.
+
+  """
+  os.environ['DASHBOARD_DATA_DIR'] = data_dir
+  os.environ['DASHBOARD_OUTPUT_DIR'] = output_dir
+  import main as dashboard
+
+  client = dashboard.app.server.test_client()
+
+  def post(body):
+    dashboard.responses.cache.clear()
+    response = client.post('/_dash-update-component', json=body, headers={'Accept-Encoding': 'gzip, br'})
+    assert response.status_code == 200, f"{body['output']}: {response.status_code}"
+    return response
+
+  results = []
+  for callback in get_callback_outputs(dashboard.app):
+    summary, response = time_function(post, get_callback_body(dashboard.app, callback), repeat=repeat)
+    results.append(dict(group='callbacks', name=callback, bytes=len(response.get_data()), **summary))
+
+  # a zoom on the dates left in relayoutData after switching to days since the threshold renders the
+  # whole series, rather than failing
+  dates = dashboard.data.timeseries_dates
+  for callback, graph_id in [('timeseries-store.data', 'timeseries-display'),
+                             ('timeseries-gradient-store.data', 'timeseries-gradient-display')]:
+    relayout = f'{graph_id}.relayoutData'
+    body = get_callback_body(dashboard.app, callback, {
+      'timeseries-mode-radioitems.value': 'Threshold',
+      relayout: {'xaxis.range[0]': dates[len(dates) // 2], 'xaxis.range[1]': dates[-1]}}, changed=relayout)
+    summary, response = time_function(post, body, repeat=repeat)
+    results.append(dict(group='callbacks', name=f'{callback} (stale date zoom)', bytes=len(response.get_data()),
+                        **summary))
+  return results
+
+
+def main(*, counties, dates, seed, repeat, data_dir, results_dir):
+  if data_dir is None:
+    data_dir = join('benchmark_data', f'{counties}x{dates}_seed{seed}')
+  if not exists(join(data_dir, 'counties.csv')):
+    print(f'generating {counties} counties x {dates} dates in {data_dir}...')
+    synthetic.make_dataset(data_dir, num_counties=counties, num_dates=dates, seed=seed)
+  output_dir = join(data_dir, 'output')
+
+  results, data = benchmark_construction(data_dir, output_dir, max(1, repeat // 5))
+  results += benchmark_figures(data, repeat)
+  results += benchmark_callbacks(data_dir, output_dir, repeat)
+
+  print(f"{'group':14s} {'name':80s} {'median':>10s} {'p95':>10s}")
+  for result in results:
+    print(f"{result['group']:14s} {result['name']:80s} {result['median_ms']:8.2f}ms {result['p95_ms']:8.2f}ms")
+
+  if not exists(results_dir):
+    os.makedirs(results_dir)
+  timestamp = dt.datetime.now().strftime('%Y%m%d-%H%M%S')
+  fname = join(results_dir, f'{timestamp}_{counties}x{dates}.json')
+  write_results(fname, results, counties=counties, dates=dates, seed=seed)
+  print(f'wrote {fname}')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--counties', default=3000, type=int, help='number of synthetic counties (3k-50k)')
+  parser.add_argument('--dates', default=200, type=int, help='number of synthetic dates (100-2,000)')
+  parser.add_argument('--seed', default=0, type=int, help='random seed for the synthetic data')
+  parser.add_argument('--repeat', default=10, type=int, help='number of timed calls per benchmark')
+  parser.add_argument('--data-dir', default=None, help='synthetic data directory, generated if missing')
+  parser.add_argument('--results-dir', default='benchmark_results', help='directory for the json results')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
@@ -0,0 +1,213 @@
+"""Generate a synthetic copy of the county-level data folder.
+
+The files mirror the schema `DashboardData` reads from `./data`, so the dashboard and the benchmarks
+can run without the external COVID-19_US_County-level_Summaries checkout. A geojson with square county
+boundaries is included, so nothing is fetched over the network either.
+
+```sh
+python -m benchmarks.synthetic --data-dir synthetic_data --counties 3000 --dates 200
+```
+
+"""
+
+from os.path import join, exists
+import os
+import json
+import argparse
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from utils.data import DashboardData
+
+
+states = {
+  'AL': 1, 'AK': 2, 'AZ': 4, 'AR': 5, 'CA': 6, 'CO': 8, 'CT': 9, 'DE': 10, 'DC': 11, 'FL': 12, 'GA': 13,
+  'HI': 15, 'ID': 16, 'IL': 17, 'IN': 18, 'IA': 19, 'KS': 20, 'KY': 21, 'LA': 22, 'ME': 23, 'MD': 24,
+  'MA': 25, 'MI': 26, 'MN': 27, 'MS': 28, 'MO': 29, 'MT': 30, 'NE': 31, 'NV': 32, 'NH': 33, 'NJ': 34,
+  'NM': 35, 'NY': 36, 'NC': 37, 'ND': 38, 'OH': 39, 'OK': 40, 'OR': 41, 'PA': 42, 'RI': 44, 'SC': 45,
+  'SD': 46, 'TN': 47, 'TX': 48, 'UT': 49, 'VT': 50, 'VA': 51, 'WA': 53, 'WV': 54, 'WI': 55, 'WY': 56}
+
+# counties the dashboard selects or hovers by default, kept complete so they survive the subsetting
+default_counties = {'53033', '17031'}
+
+first_date = dt.date(2020, 1, 22)
+
+
+def get_fips_codes(num_counties):
+  """Spread `num_counties` county FIPS codes over the states, with a '000' row for every state.
+
+  :param num_counties: number of county rows to generate.
+  :returns: (list of county FIPS strings, list of state FIPS strings, list of state abbreviations per county)
+  :rtype: tuple
+
+  """
+  num_states = len(states)
+  counties_per_state = np.full(num_states, num_counties // num_states)
+  counties_per_state[:num_counties % num_states] += 1
+  if counties_per_state.max() > 999:
+    raise ValueError(f'too many counties for {num_states} states: {num_counties}')
+
+  county_fips = []
+  county_states = []
+  state_fips = []
+  for (state, state_code), n in zip(states.items(), counties_per_state):
+    state_fips.append(f'{state_code:02d}000')
+    county_fips += [f'{state_code:02d}{c:03d}' for c in range(1, n + 1)]
+    county_states += [state] * n
+  return county_fips, state_fips, county_states
+
+
+def make_counties(rng, county_fips, state_fips, county_states):
+  """Make the descriptors table, one row per county plus national and state rows.
+
+  Every column in `DashboardData.columns_to_include` and `DashboardData.selected_features` is present,
+  with roughly 2% missing values outside of the identifier columns.
+
+  """
+  num_counties = len(county_fips)
+  complete = np.isin(county_fips, list(default_counties))
+  population = np.round(rng.lognormal(10, 1.3, size=num_counties)).clip(80, 1e7)
+
+  columns = sorted((DashboardData.columns_to_include | set(DashboardData.selected_features))
+                   - {'FIPS', 'State', 'Area_Name', 'POP_ESTIMATE_2018'})
+  values = {}
+  for column in columns:
+    if column in DashboardData.features_to_normalize:
+      # counts that scale with the population
+      x = population * rng.uniform(0.01, 0.4, size=num_counties)
+    else:
+      x = rng.lognormal(3, 1, size=num_counties)
+    x[(rng.random(num_counties) < 0.02) & ~complete] = np.nan
+    values[column] = x
+
+  counties = pd.DataFrame(dict(
+    FIPS=[int(fips) for fips in county_fips],
+    State=county_states,
+    Area_Name=[f'county {fips[2:]}' for fips in county_fips],
+    POP_ESTIMATE_2018=population,
+    **values))
+
+  # national and state rows come first, as in the real table
+  totals = pd.DataFrame(dict(
+    FIPS=[0] + [int(fips) for fips in state_fips],
+    State=['US'] + list(states),
+    Area_Name=['United States'] + [f'state {state}' for state in states]))
+  for state, rows in counties.groupby('State'):
+    totals.loc[totals['State'] == state, 'POP_ESTIMATE_2018'] = rows['POP_ESTIMATE_2018'].sum()
+  totals.loc[0, 'POP_ESTIMATE_2018'] = population.sum()
+  return pd.concat([totals, counties], ignore_index=True, sort=False)[counties.columns]
+
+
+def make_timeseries(rng, populations, num_dates):
+  """Make cumulative infections and deaths, as logistic curves with noise.
+
+  :param populations: population for each row.
+  :param num_dates: number of daily columns.
+  :returns: (infections, deaths), both arrays of shape (len(populations), num_dates)
+
+  """
+  n = len(populations)
+  t = np.arange(num_dates)[None, :]
+  onset = rng.uniform(0.1, 0.6, size=(n, 1)) * num_dates
+  rate = rng.uniform(0.05, 0.25, size=(n, 1))
+  attack = rng.uniform(0.005, 0.1, size=(n, 1))
+  curve = populations[:, None] * attack / (1 + np.exp(-rate * (t - onset)))
+  daily = np.diff(np.floor(curve), axis=1, prepend=0).clip(0)
+  infections = np.cumsum(rng.poisson(daily), axis=1).astype(float)
+  deaths = np.floor(infections * rng.uniform(0.005, 0.03, size=(n, 1)))
+  deaths = np.maximum.accumulate(np.concatenate((np.zeros((n, 14)), deaths[:, :-14]), axis=1)[:, :num_dates],
+                                 axis=1)
+  return infections, deaths
+
+
+def make_interventions(rng, fips_codes, states_column, num_dates):
+  """Make ordinal intervention dates, all within the timeseries dates."""
+  n = len(fips_codes)
+  first = first_date.toordinal()
+  interventions = dict(FIPS=[int(fips) for fips in fips_codes], STATE=states_column,
+                       AREA_NAME=[f'area {fips}' for fips in fips_codes])
+  for k in DashboardData.intervention_keys:
+    offset = 0.5 if 'rollback' in k else 0.2
+    dates = first + np.floor(rng.uniform(offset, offset + 0.3, size=n) * (num_dates - 1))
+    dates[rng.random(n) < 0.15] = np.nan
+    interventions[k] = dates
+  return pd.DataFrame(interventions)
+
+
+def make_geojson(county_fips):
+  """Make square county boundaries on a grid, one row of counties per state."""
+  features = []
+  for fips in county_fips:
+    x = -125 + 0.5 * (int(fips[2:]) % 120)
+    y = 25 + 0.5 * (int(fips[:2]) % 50) + 0.25 * (int(fips[2:]) // 120)
+    coordinates = [[[x, y], [x + 0.4, y], [x + 0.4, y + 0.2], [x, y + 0.2], [x, y]]]
+    features.append(dict(type='Feature', id=fips, properties={},
+                         geometry=dict(type='Polygon', coordinates=coordinates)))
+  return dict(type='FeatureCollection', features=features)
+
+
+def make_dataset(data_dir, num_counties=3000, num_dates=200, seed=0):
+  """Write a synthetic data folder.
+
+  :param data_dir: directory to write the csv files into. Created if needed.
+  :param num_counties: number of counties, spread over the 51 states.
+  :param num_dates: number of daily timeseries columns, starting 1/22/20.
+  :param seed: random seed.
+  :returns: the data directory.
+  :rtype: str
+
+  """
+  if not exists(data_dir):
+    os.makedirs(data_dir)
+  rng = np.random.default_rng(seed)
+
+  county_fips, state_fips, county_states = get_fips_codes(num_counties)
+  counties = make_counties(rng, county_fips, state_fips, county_states)
+  counties.to_csv(join(data_dir, 'counties.csv'), index=False)
+
+  # timeseries hold the state rows too, after the counties, which `DashboardData` drops
+  fips_codes = county_fips + state_fips
+  fips_to_population = dict(zip(counties['FIPS'], counties['POP_ESTIMATE_2018']))
+  populations = np.array([fips_to_population[int(fips)] for fips in fips_codes])
+  states_column = county_states + list(states)
+  infections, deaths = make_timeseries(rng, populations, num_dates)
+  dates = [first_date + dt.timedelta(days=i) for i in range(num_dates)]
+  date_keys = [f'{d.month}/{d.day}/{d.year % 100}' for d in dates]
+  combined_keys = [f'{fips}, {state}, US' for fips, state in zip(fips_codes, states_column)]
+  for name, values in [('infections', infections), ('deaths', deaths)]:
+    timeseries = pd.DataFrame(values, columns=date_keys)
+    timeseries.insert(0, 'Combined_Key', combined_keys)
+    timeseries.insert(0, 'FIPS', [int(fips) for fips in fips_codes])
+    timeseries.to_csv(join(data_dir, f'{name}_timeseries.csv'), index=False)
+
+  interventions = make_interventions(rng, fips_codes, states_column, num_dates)
+  interventions.to_csv(join(data_dir, 'interventions.csv'), index=False)
+
+  with open(join(data_dir, DashboardData.geojson_file), 'w') as file:
+    json.dump(make_geojson(county_fips), file)
+
+  columns = list(counties.columns)
+  pd.DataFrame({'Column name': columns, 'Description': [f'synthetic {c}' for c in columns]}).to_csv(
+    join(data_dir, 'list_of_columns.csv'), index=False)
+  availability = counties.iloc[1 + len(states):].notnull().mean(axis=0)
+  pd.DataFrame({'Column name': columns, 'Availability': availability.values}).to_csv(
+    join(data_dir, 'availability.csv'), index=False)
+  return data_dir
+
+
+def main(*, data_dir, counties, dates, seed):
+  make_dataset(data_dir, num_counties=counties, num_dates=dates, seed=seed)
+  print(f'wrote {counties} counties x {dates} dates to {data_dir}')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--data-dir', default='synthetic_data', help='directory to write the csv files')
+  parser.add_argument('--counties', default=3000, type=int, help='number of counties (3k-50k)')
+  parser.add_argument('--dates', default=200, type=int, help='number of daily timeseries columns')
+  parser.add_argument('--seed', default=0, type=int, help='random seed')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
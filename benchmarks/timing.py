@@ -0,0 +1,69 @@
+"""Timing helpers shared by the benchmarks."""
+
+import time
+import json
+import platform
+import datetime as dt
+import subprocess
+import numpy as np
+import pandas as pd
+
+
+def summarize(times):
+  """Summarize a list of durations, in seconds, as milliseconds.
+
+  :param times: durations in seconds.
+  :returns: dict with the count, min, median, mean, p95 and max.
+  :rtype: dict
+
+  """
+  times = 1000 * np.array(times)
+  return dict(
+    n=len(times),
+    min_ms=float(times.min()),
+    median_ms=float(np.median(times)),
+    mean_ms=float(times.mean()),
+    p95_ms=float(np.quantile(times, 0.95)),
+    max_ms=float(times.max()))
+
+
+def time_function(func, *args, repeat=10, warmup=1, **kwargs):
+  """Time `func(*args, **kwargs)`.
+
+  :param repeat: number of timed calls.
+  :param warmup: number of untimed calls first.
+  :returns: (summary, the value of the last call)
+  :rtype: tuple
+
+  """
+  for _ in range(warmup):
+    value = func(*args, **kwargs)
+  times = []
+  for _ in range(repeat):
+    t = time.perf_counter()
+    value = func(*args, **kwargs)
+    times.append(time.perf_counter() - t)
+  return summarize(times), value
+
+
+def get_environment():
+  """Describe the machine and code a result was measured on, for comparing runs over time."""
+  try:
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                            text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    commit = None
+  return dict(
+    timestamp=dt.datetime.now().isoformat(timespec='seconds'),
+    commit=commit,
+    python=platform.python_version(),
+    machine=platform.machine(),
+    processor=platform.processor(),
+    numpy=np.__version__,
+    pandas=pd.__version__)
+
+
+def write_results(fname, results, **meta):
+  """Write benchmark results and the environment as json."""
+  with open(fname, 'w') as file:
+    json.dump(dict(environment=get_environment(), results=results, **meta), file, indent=2)
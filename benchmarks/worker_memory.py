@@ -0,0 +1,178 @@
+"""Measure the memory each web worker costs, with the data built per worker or shared from the master.
+
+Two layouts are compared, each forking the same number of workers:
+- 'private': every worker builds its own `DashboardData` from the csv files, as each worker of a
+  server without `preload_app` does;
+- 'shared': the master loads the snapshot once, memory-mapped, and freezes the garbage collector
+  before forking, as `gunicorn.conf.py` does.
+
+Each worker then builds every figure, so it touches the data as a real worker would, and reports its
+unique set size (USS, the memory only it holds, i.e. what each additional worker costs), its
+proportional set size (PSS) and its resident set size (RSS). This reads `/proc/self/smaps_rollup`, so it
+needs Linux.
+
+The check fails, with exit status 1, if a shared worker's USS is more than `--max-uss-fraction` of a
+private worker's (0.25 by default), or more than `--max-uss-mb`, if given. Either one means pages the
+workers should share from the master are being copied into each worker.
+
+```sh
+python build_snapshot.py --data-dir benchmark_data/3000x200_seed0
+python -m benchmarks.worker_memory --data-dir benchmark_data/3000x200_seed0 --workers 4
+```
+
+"""
+
+from os.path import join, exists
+import gc
+import sys
+import json
+import argparse
+import subprocess
+import multiprocessing as mp
+import numpy as np
+
+layouts = ['private', 'shared']
+
+
+def get_memory():
+  """Get the USS, PSS and RSS of this process, in bytes."""
+  fields = {}
+  with open('/proc/self/smaps_rollup') as file:
+    for line in file:
+      parts = line.split()
+      if len(parts) == 3 and parts[2] == 'kB':
+        fields[parts[0].rstrip(':')] = 1024 * int(parts[1])
+  return dict(uss=fields['Private_Clean'] + fields['Private_Dirty'], pss=fields['Pss'], rss=fields['Rss'])
+
+
+def exercise(data):
+  """Build every figure, touching the data the way the dashboard's callbacks do."""
+  from utils import elements
+  elements.get_counties_display(data)
+  elements.get_counties_embedding_figure(data)
+  elements.get_counties_clustering_figure(data)
+  for timeseries_type in ['infections', 'deaths']:
+    for gradient in [False, True]:
+      elements.get_timeseries_figure(data, timeseries_type, gradient=gradient, per_capita=True)
+
+
+def worker(data, data_dir, output_dir, barrier, queue):
+  from utils.data import DashboardData
+  if data is None:
+    data = DashboardData(data_dir=data_dir, output_dir=output_dir)
+  exercise(data)
+  gc.collect()
+  # measure once every worker is up, so the shared pages are counted between all of them
+  barrier.wait()
+  queue.put(get_memory())
+  barrier.wait()
+
+
+def run_layout(layout, workers, data_dir, output_dir):
+  """Fork `workers` workers with the given layout, and collect their memory."""
+  from utils.data import DashboardData
+
+  data = None
+  if layout == 'shared':
+    data = DashboardData.load(data_dir=data_dir, output_dir=output_dir)
+    exercise(data)
+    gc.collect()
+    gc.freeze()
+
+  context = mp.get_context('fork')
+  barrier = context.Barrier(workers)
+  queue = context.Queue()
+  processes = [context.Process(target=worker, args=(data, data_dir, output_dir, barrier, queue))
+               for _ in range(workers)]
+  for process in processes:
+    process.start()
+  memory = [queue.get() for _ in processes]
+  for process in processes:
+    process.join()
+  return dict(layout=layout, workers=workers, master=get_memory(), per_worker=memory)
+
+
+def summarize(result):
+  mb = 1 / 2 ** 20
+  per_worker = {k: float(np.mean([m[k] for m in result['per_worker']])) * mb for k in ['uss', 'pss', 'rss']}
+  master = {k: v * mb for k, v in result['master'].items()}
+  return dict(layout=result['layout'], workers=result['workers'], master_pss_mb=master['pss'],
+              worker_uss_mb=per_worker['uss'], worker_pss_mb=per_worker['pss'], worker_rss_mb=per_worker['rss'],
+              total_pss_mb=master['pss'] + result['workers'] * per_worker['pss'])
+
+
+def check_budget(summaries, max_uss_fraction, max_uss_mb=None):
+  """Check that each shared worker holds little memory of its own.
+
+  :param summaries: the `summarize`d results of each layout.
+  :param max_uss_fraction: the most USS a shared worker may have, as a fraction of a private worker's.
+  :param max_uss_mb: the most USS a shared worker may have, in MB, or None for no limit.
+  :returns: a description of each budget exceeded
+  :rtype: list
+
+  """
+  by_layout = {s['layout']: s for s in summaries}
+  shared_uss = by_layout['shared']['worker_uss_mb']
+  private_uss = by_layout['private']['worker_uss_mb']
+  failures = []
+  if shared_uss > max_uss_fraction * private_uss:
+    failures.append(f'shared worker uss {shared_uss:.1f}MB is over {max_uss_fraction:.0%} of a private '
+                    f"worker's {private_uss:.1f}MB")
+  if max_uss_mb is not None and shared_uss > max_uss_mb:
+    failures.append(f'shared worker uss {shared_uss:.1f}MB is over {max_uss_mb:.1f}MB')
+  return failures
+
+
+def main(*, data_dir, output_dir, workers, layout, json_output, max_uss_fraction, max_uss_mb):
+  if output_dir is None:
+    output_dir = join(data_dir, 'output')
+
+  if layout is not None:
+    # one layout, in this process, reporting to the parent on stdout
+    print(json.dumps(run_layout(layout, workers, data_dir, output_dir)))
+    return
+
+  if not exists(join(output_dir, 'snapshot')):
+    print(f'no snapshot in {output_dir}, run build_snapshot.py first')
+    sys.exit(1)
+
+  # each layout runs in a fresh interpreter, so neither inherits the other's allocations
+  summaries = []
+  for layout in layouts:
+    out = subprocess.run(
+      [sys.executable, '-m', 'benchmarks.worker_memory', '--data-dir', data_dir, '--output-dir', output_dir,
+       '--workers', str(workers), '--layout', layout],
+      capture_output=True, text=True, check=True).stdout
+    summaries.append(summarize(json.loads(out.strip().splitlines()[-1])))
+
+  print(f"{'layout':10s} {'workers':>8s} {'worker uss':>11s} {'worker pss':>11s} {'worker rss':>11s} "
+        f"{'total pss':>11s}")
+  for s in summaries:
+    print(f"{s['layout']:10s} {s['workers']:8d} {s['worker_uss_mb']:9.1f}MB {s['worker_pss_mb']:9.1f}MB "
+          f"{s['worker_rss_mb']:9.1f}MB {s['total_pss_mb']:9.1f}MB")
+  if json_output is not None:
+    with open(json_output, 'w') as file:
+      json.dump(summaries, file, indent=2)
+
+  failures = check_budget(summaries, max_uss_fraction, max_uss_mb)
+  for failure in failures:
+    print(f'FAIL: {failure}')
+  if failures:
+    sys.exit(1)
+  print('ok: shared worker uss is within budget')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--data-dir', default='data', help='directory with the csv files')
+  parser.add_argument('--output-dir', default=None, help='directory with the snapshot, DATA_DIR/output by default')
+  parser.add_argument('--workers', default=4, type=int, help='number of workers to fork')
+  parser.add_argument('--layout', default=None, choices=layouts, help='run a single layout (used internally)')
+  parser.add_argument('--json-output', default=None, help='write the summary to this file')
+  parser.add_argument('--max-uss-fraction', default=0.25, type=float,
+                      help="fail if a shared worker's USS is over this fraction of a private worker's")
+  parser.add_argument('--max-uss-mb', default=None, type=float, help="fail if a shared worker's USS is over this")
+  args = parser.parse_args()
+
+  main(**args.__dict__)
@@ -0,0 +1,21 @@
+import argparse
+
+from utils.data import DashboardData
+
+
+def main(*, data_dir, output_dir, snapshot_dir):
+  data = DashboardData(data_dir=data_dir, output_dir=output_dir)
+  manifest = data.save_snapshot(snapshot_dir)
+  print(f"wrote snapshot of data version {manifest['version']}, "
+        f"source hash {manifest['source_hash'][:12]}")
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--data-dir', default=None, help='data directory, defaults to ./data')
+  parser.add_argument('--output-dir', default=None, help='embedding and clustering directory, defaults to ./output')
+  parser.add_argument('--snapshot-dir', default=None, help='defaults to snapshot/ in the output directory')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
@@ -0,0 +1,24 @@
+"""Gunicorn settings for serving the dashboard with several workers.
+
+```sh
+gunicorn -c gunicorn.conf.py main:server
+```
+
+The app and its data are loaded once in the master process before the workers fork, so the workers
+share them copy-on-write instead of each holding a copy. The large arrays are memory-mapped from the
+snapshot (see `build_snapshot.py`), so their pages stay shared whatever the workers touch.
+
+"""
+
+import os
+import gc
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+preload_app = True
+
+
+def pre_fork(server, worker):
+  # move the preloaded objects out of the garbage collector's reach, so collections in the workers
+  # don't write to (and copy) their pages
+  gc.freeze()
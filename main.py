@@ -1,40 +1,113 @@
+import os
 import pandas as pd
 import numpy as np
 
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 
 from utils.data import DashboardData
 from utils import elements
+from utils import serialize
+from utils.responses import CompressedResponses
+from utils.metrics import metrics
+from utils.jobs import EmbeddingJobs
 
-data = DashboardData()
+# the data and output directories can be overridden, e.g. to serve a synthetic dataset. Loads from the
+# snapshot written by build_snapshot.py, if it is up to date.
+data = DashboardData.load(data_dir=os.environ.get('DASHBOARD_DATA_DIR'),
+                          output_dir=os.environ.get('DASHBOARD_OUTPUT_DIR'))
+if os.environ.get('DASHBOARD_PROFILE'):
+  print(data.profiler.table())
+
+# re-embeddings on the features chosen in the dashboard, fit in the background
+embedding_jobs = EmbeddingJobs(data)
 
 # define core elements as global variables, with horizontally aligned divs on the same line.
 # Objed id's are the variable name with '-' in place of '_'
 dashboard_header = elements.get_dashboard_header()
 
+region_dropdown = html.Div([elements.get_region_dropdown(data)],
+                           style=dict(width='39%', float='center', display='inline-block'))
 counties_display = html.Div([elements.get_counties_display(data)],
                             style=dict(width='89%', float='center', display='inline-block'))
+counties_color_radioitems = html.Div([elements.get_counties_color_radioitems(data)],
+                                     style=dict(width='89%', float='center', display='inline-block'))
+counties_date_slider = html.Div([elements.get_counties_date_slider(data)],
+                                style=dict(width='89%', float='center', display='inline-block'))
+# the map of the region and color chosen last, and its colors on the date chosen, for recoloring it in
+# the browser. It starts without the figure, which the page already has
+counties_figure_store = dcc.Store(id='counties-figure-store', data=dict(region=None, color='infections_per_capita'))
+counties_colors_store = dcc.Store(id='counties-colors-store')
+rollup_timeseries_display = html.Div([elements.get_rollup_timeseries_display(data)],
+                                     style=dict(width='89%', float='center', display='inline-block'))
 counties_dropdown = html.Div([elements.get_counties_dropdown(data)],
                              style=dict(width='39%', float='center', display='inline-block'))
 
 # selected_counties_scale = elements.get_selected_counties_scale()
 
+embedding_features_dropdown = elements.get_embedding_features_dropdown(data)
+embedding_features_count = html.Div(elements.get_embedding_features_count(data, data.selected_features),
+                                    id='embedding-features-count')
+embedding_jobs_status = html.Div(id='embedding-jobs-status')
+embedding_jobs_interval = dcc.Interval(id='embedding-jobs-interval', interval=1000, disabled=True)
+# the features of the embedding shown, once it is ready
+embedding_features_store = dcc.Store(id='embedding-features-store')
+embedding_features_panel = html.Div(
+  [embedding_features_dropdown, embedding_features_count, embedding_jobs_status, embedding_jobs_interval, embedding_features_store])
+
 counties_embedding_display = elements.get_counties_embedding_display(data)
+# the embedding figure with its arrays packed, which the browser unpacks to draw it
+counties_embedding_store = elements.get_counties_embedding_store(data)
 counties_clustering_display = elements.get_counties_clustering_display(data)
 counties_embedding_panel = html.Div(
   [
-    html.Div([counties_embedding_display], style=dict(width='39%', float='left', display='inline-block')),
+    html.Div([counties_embedding_display, counties_embedding_store], style=dict(width='39%', float='left', display='inline-block')),
     html.Div([counties_clustering_display], style=dict(width='59%', float='right', display='inline-block'))
   ])
 
+similar_counties_space_radioitems = elements.get_similar_counties_space_radioitems()
+similar_counties_display = elements.get_similar_counties_display(data)
+similar_counties_panel = html.Div(
+  [
+    html.Div([similar_counties_space_radioitems], style=dict(width='19%', float='left', display='inline-block')),
+    html.Div([similar_counties_display], style=dict(width='79%', float='right', display='inline-block'))
+  ])
+
+growth_measure_radioitems = elements.get_growth_measure_radioitems()
+growth_window_dropdown = elements.get_growth_window_dropdown(data)
+growth_ranking_display = elements.get_growth_ranking_display(data)
+growth_ranking_panel = html.Div(
+  [
+    html.Div([growth_window_dropdown, growth_measure_radioitems],
+             style=dict(width='19%', float='left', display='inline-block')),
+    html.Div([growth_ranking_display], style=dict(width='79%', float='right', display='inline-block'))
+  ])
+
+effect_intervention_dropdown = elements.get_effect_intervention_dropdown(data)
+effect_window_dropdown = elements.get_effect_window_dropdown(data)
+effect_group_radioitems = elements.get_effect_group_radioitems(data)
+intervention_effect_display = elements.get_intervention_effect_display(data)
+intervention_effect_panel = html.Div(
+  [
+    html.Div([effect_intervention_dropdown, effect_window_dropdown, effect_group_radioitems],
+             style=dict(width='19%', float='left', display='inline-block')),
+    html.Div([intervention_effect_display], style=dict(width='79%', float='right', display='inline-block'))
+  ])
+
+correlations_table = elements.get_correlations_table(data)
+correlations_panel = html.Div([correlations_table], style=dict(width='89%', float='center', display='inline-block'))
+
 # infections_display = elements.get_infections_display(data)
 # deaths_display = elements.get_deaths_display(data)
 timeseries_display = elements.get_timeseries_display(data)
 timeseries_gradient_display = elements.get_timeseries_gradient_display(data)
-timeseries_type_dropdown = elements.get_timeseries_type_dropdown()
+# the figures in absolute numbers on a linear scale, which the browser rescales itself
+timeseries_store = elements.get_timeseries_store(data)
+timeseries_gradient_store = elements.get_timeseries_gradient_store(data)
+timeseries_type_dropdown = elements.get_timeseries_type_dropdown(data)
 interventions_dropdown = elements.get_interventions_dropdown(data)
 timeseries_mode_radioitems = elements.get_timeseries_mode_radioitems()
 timeseries_scale_radioitems = elements.get_timeseries_scale_radioitems()
@@ -47,80 +120,290 @@ selected_counties_timeseries_panel = html.Div(
               timeseries_scale_radioitems,
               timeseries_percapita_radioitems],
              style=dict(width='19%', float='left', display='inline-block')),
-    html.Div([timeseries_display, timeseries_gradient_display],
+    html.Div([timeseries_display, timeseries_gradient_display, timeseries_store, timeseries_gradient_store],
              style=dict(width='79%', float='right', display='inline-block'))
   ])
 
 # define the app and its layout
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+app = dash.Dash(__name__, external_stylesheets=external_stylesheets, compress=False)
+server = app.server  # for gunicorn, see gunicorn.conf.py
 app.layout = html.Div(
   [
     # dashboard_header,
+    region_dropdown,
+    counties_color_radioitems,
     counties_display,
+    counties_date_slider,
+    counties_figure_store,
+    counties_colors_store,
+    rollup_timeseries_display,
     counties_dropdown,
+    embedding_features_panel,
     counties_embedding_panel,
+    similar_counties_panel,
+    growth_ranking_panel,
+    intervention_effect_panel,
+    correlations_panel,
     selected_counties_timeseries_panel,
   ])
 
+# compress layout and callback responses, and answer repeat requests for the figures from the cache
+responses = CompressedResponses(
+  app.server,
+  data.version,
+  cacheable_outputs={
+    'counties-figure-store.data',
+    'counties-colors-store.data',
+    'rollup-timeseries-display.figure',
+    'counties-embedding-store.data',
+    'counties-clustering-display.figure',
+    'similar-counties-display.figure',
+    'growth-ranking-display.figure',
+    'intervention-effect-display.figure',
+    'timeseries-store.data',
+    'timeseries-gradient-store.data'},
+  # these re-render a zoomed range only when the zoom triggered them, see `get_zoomed_range`
+  trigger_outputs={
+    'timeseries-store.data',
+    'timeseries-gradient-store.data'})
+
 
 @app.callback(
   Output('counties-dropdown', 'value'),
   [Input('counties-display', 'clickData'),
-   Input('counties-embedding-display', 'clickData')])
-def update_selected_county(display_click_data, embedding_click_data):
-  if display_click_data is not None:
+   Input('counties-embedding-display', 'clickData'),
+   Input('similar-counties-display', 'clickData'),
+   Input('growth-ranking-display', 'clickData')])
+def update_selected_county(display_click_data, embedding_click_data, similar_click_data, growth_click_data):
+  # follow the graph that was clicked last
+  clicked = dash.callback_context.triggered[0]['prop_id']
+  if clicked == 'counties-display.clickData' and display_click_data is not None:
     fips = display_click_data['points'][0]['customdata'][0]
-    data.set_selected_county(fips)
-  elif embedding_click_data is not None:
+    # a state, on the map of the states, drills down instead
+    if data._is_county(fips):
+      data.set_selected_county(fips)
+  elif clicked == 'counties-embedding-display.clickData' and embedding_click_data is not None:
     fips = embedding_click_data['points'][0]['customdata']
     data.set_selected_county(fips)
+  elif clicked == 'similar-counties-display.clickData' and similar_click_data is not None:
+    fips = similar_click_data['points'][0]['customdata']
+    data.set_selected_county(fips)
+  elif clicked == 'growth-ranking-display.clickData' and growth_click_data is not None:
+    fips = growth_click_data['points'][0]['customdata']
+    data.set_selected_county(fips)
   return data.selected_county
 
 
 @app.callback(
-  Output('counties-embedding-display', 'figure'),
-  [Input('counties-dropdown', 'value')])
-def update_embedding(fips):
+  Output('region-dropdown', 'value'),
+  [Input('counties-display', 'clickData')])
+def update_region(click_data):
+  # clicking a state on the map of the states shows its counties
+  if click_data is None:
+    raise PreventUpdate
+  fips = click_data['points'][0]['customdata'][0]
+  if data._is_county(fips) or fips == data.national_fips:
+    raise PreventUpdate
+  return fips
+
+
+@app.callback(
+  Output('counties-figure-store', 'data'),
+  [Input('region-dropdown', 'value'),
+   Input('counties-color-radioitems', 'value')])
+def update_counties_figure(region, color):
+  # the page already has the map of every county
+  if dash.callback_context.triggered[0]['prop_id'] == '.':
+    raise PreventUpdate
+  return dict(region=region, color=color, figure=elements.get_counties_figure(data, region, color))
+
+
+@app.callback(
+  Output('counties-colors-store', 'data'),
+  [Input('counties-date-slider', 'value'),
+   Input('region-dropdown', 'value'),
+   Input('counties-color-radioitems', 'value')])
+def update_counties_colors(date_index, region, color):
+  return elements.get_counties_colors(data, region, date_index, color)
+
+
+# moving the date slider only recolors the map
+app.clientside_callback(
+  ClientsideFunction('choropleth', 'recolor'),
+  Output('counties-display', 'figure'),
+  [Input('counties-figure-store', 'data'),
+   Input('counties-colors-store', 'data')],
+  [State('counties-display', 'figure')])
+
+
+@app.callback(
+  Output('rollup-timeseries-display', 'figure'),
+  [Input('region-dropdown', 'value'),
+   Input('timeseries-type-dropdown', 'value'),
+   Input('timeseries-percapita-radioitems', 'value')])
+def update_rollup_timeseries_display(region, timeseries_type, per_capita):
+  return elements.get_rollup_timeseries_figure(data, region, timeseries_type,
+                                               per_capita=per_capita == 'per_capita')
+
+
+@app.callback(
+  [Output('embedding-features-dropdown', 'options'),
+   Output('embedding-features-count', 'children')],
+  [Input('embedding-features-dropdown', 'value')])
+def update_embedding_features_counts(features):
+  features = features or []
+  return (elements.get_embedding_features_options(data, features),
+          elements.get_embedding_features_count(data, features))
+
+
+@app.callback(
+  [Output('embedding-jobs-status', 'children'),
+   Output('embedding-features-store', 'data'),
+   Output('embedding-jobs-interval', 'disabled')],
+  [Input('embedding-features-dropdown', 'value'),
+   Input('embedding-jobs-interval', 'n_intervals')])
+def update_embedding_jobs(features, n_intervals):
+  # queue a fit on new features, and poll it until the embedding is ready
+  features = sorted(features or [])
+  embedding_jobs.submit(features)
+  status = embedding_jobs.status(features)
+  ready = status['stage'] == 'done'
+  return (elements.get_embedding_jobs_status(status),
+          features if ready else dash.no_update,
+          ready or status['stage'] == 'failed')
+
+
+def get_chosen_embedding(features):
+  """Get the embedding on the features chosen, or None for the default one. Nothing is updated if it
+  isn't available in this worker, rather than drawing (and caching) the default one under the chosen
+  features."""
+  if features is None:
+    return None
+  embedding = embedding_jobs.get(features)
+  if embedding is None:
+    raise PreventUpdate
+  return embedding
+
+
+@app.callback(
+  Output('counties-embedding-store', 'data'),
+  [Input('counties-dropdown', 'value'),
+   Input('embedding-features-store', 'data')])
+def update_embedding(fips, features):
   data.set_selected_county(fips)
-  return elements.get_counties_embedding_figure(data)
+  embedding = get_chosen_embedding(features)
+  return elements.get_counties_embedding_figure(data, embedding=embedding)
 
 
 @app.callback(
   Output('counties-clustering-display', 'figure'),
-  [Input('counties-dropdown', 'value')])
-def update_clustering_display(fips):
+  [Input('counties-dropdown', 'value'),
+   Input('embedding-features-store', 'data')])
+def update_clustering_display(fips, features):
   data.set_selected_county(fips)
-  return elements.get_counties_clustering_figure(data)
+  embedding = get_chosen_embedding(features)
+  return elements.get_counties_clustering_figure(data, embedding=embedding)
 
 
 @app.callback(
-  Output('timeseries-display', 'figure'),
+  Output('similar-counties-display', 'figure'),
+  [Input('counties-dropdown', 'value'),
+   Input('similar-counties-space-radioitems', 'value')])
+def update_similar_counties_display(fips, space):
+  data.set_selected_county(fips)
+  return elements.get_similar_counties_figure(data, space=space)
+
+
+@app.callback(
+  Output('growth-ranking-display', 'figure'),
+  [Input('timeseries-type-dropdown', 'value'),
+   Input('growth-window-dropdown', 'value'),
+   Input('growth-measure-radioitems', 'value')])
+def update_growth_ranking_display(timeseries_type, window, measure):
+  return elements.get_growth_ranking_figure(data, timeseries_type, window=window, measure=measure)
+
+
+@app.callback(
+  Output('intervention-effect-display', 'figure'),
+  [Input('effect-intervention-dropdown', 'value'),
+   Input('effect-window-dropdown', 'value'),
+   Input('effect-group-radioitems', 'value'),
+   Input('embedding-features-store', 'data')])
+def update_intervention_effect_display(intervention, window, group, features):
+  embedding = get_chosen_embedding(features) if group == 'cluster' else None
+  return elements.get_intervention_effect_figure(data, intervention, window=window, group=group, embedding=embedding)
+
+
+def get_zoomed_range(graph_id, relayout_data):
+  """Get the range to re-render a timeseries figure over at full resolution, when it was zoomed. Any
+  other input resets the figure to the whole series."""
+  triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+  if f'{graph_id}.relayoutData' not in triggered:
+    return None
+  x_range = elements.get_x_range(relayout_data)
+  if x_range is False:
+    raise PreventUpdate
+  return x_range
+
+
+@app.callback(
+  Output('timeseries-store', 'data'),
   [Input('counties-dropdown', 'value'),
    Input('timeseries-type-dropdown', 'value'),
    Input('interventions-dropdown', 'value'),
    Input('timeseries-mode-radioitems', 'value'),
-   Input('timeseries-scale-radioitems', 'value'),
-   Input('timeseries-percapita-radioitems', 'value')])
-def update_timeseries_display(fips, timeseries_type, intervention, mode, scale, per_capita):
+   Input('timeseries-display', 'relayoutData')])
+def update_timeseries_store(fips, timeseries_type, intervention, mode, relayout_data):
+  x_range = get_zoomed_range('timeseries-display', relayout_data)
   data.set_selected_county(fips)
-  return elements.get_timeseries_figure(data, timeseries_type, mode=mode, intervention=intervention,
-                                        scale=scale, per_capita=per_capita == 'per_capita')
+  return elements.get_timeseries_base(data, timeseries_type, mode=mode, intervention=intervention,
+                                      x_range=x_range)
 
 
 @app.callback(
-  Output('timeseries-gradient-display', 'figure'),
+  Output('timeseries-gradient-store', 'data'),
   [Input('counties-dropdown', 'value'),
    Input('timeseries-type-dropdown', 'value'),
    Input('interventions-dropdown', 'value'),
    Input('timeseries-mode-radioitems', 'value'),
+   Input('timeseries-gradient-display', 'relayoutData')])
+def update_gradient_store(fips, timeseries_type, intervention, mode, relayout_data):
+  x_range = get_zoomed_range('timeseries-gradient-display', relayout_data)
+  data.set_selected_county(fips)
+  return elements.get_timeseries_base(data, timeseries_type, mode=mode, intervention=intervention,
+                                      x_range=x_range, gradient=True)
+
+
+# the scale and per-capita toggles only rescale the figures, in the browser
+app.clientside_callback(
+  ClientsideFunction('timeseries', 'render'),
+  Output('timeseries-display', 'figure'),
+  [Input('timeseries-store', 'data'),
    Input('timeseries-scale-radioitems', 'value'),
    Input('timeseries-percapita-radioitems', 'value')])
-def update_gradient_display(fips, timeseries_type, intervention, mode, scale, per_capita):
-  data.set_selected_county(fips)
-  return elements.get_timeseries_figure(data, timeseries_type, mode=mode, intervention=intervention,
-                                        scale=scale, per_capita=per_capita == 'per_capita',
-                                        gradient=True)
+
+app.clientside_callback(
+  ClientsideFunction('timeseries', 'render'),
+  Output('timeseries-gradient-display', 'figure'),
+  [Input('timeseries-gradient-store', 'data'),
+   Input('timeseries-scale-radioitems', 'value'),
+   Input('timeseries-percapita-radioitems', 'value')])
+
+# the embedding's packed arrays are unpacked in the browser
+app.clientside_callback(
+  ClientsideFunction('embedding', 'render'),
+  Output('counties-embedding-display', 'figure'),
+  [Input('counties-embedding-store', 'data')])
+
+
+# encode the callback responses and the layout with orjson, when it is installed
+serialize.install(app)
+
+# time the callbacks and figure builders, and serve /metrics, with an optional per-request trace log
+if os.environ.get('DASHBOARD_METRICS'):
+  metrics.register_cache('responses', responses.stats)
+  metrics.install(app, modules=[elements], trace_log=os.environ.get('DASHBOARD_TRACE_LOG'))
 
 
 if __name__ == '__main__':
@@ -1,34 +1,34 @@
+import os
 import argparse
-import numpy as np
-import string
-import seaborn as sns
-from plotly import graph_objects as go
 
 from utils.data import DashboardData
-from utils import elements
+from utils import export
 
 
-def main(*, counties):
-  data = DashboardData()
-  data.selected_counties = counties
-  d = elements.get_timeseries_figure(
-    data, mode='Date', threshold=1, daily=True, interventions=[
-      'stay at home', 'restaurant dine-in',
-      'stay at home rollback', 'restaurant dine-in rollback'])
-  fig_data = d['data']
-  layout = d['layout']
+def main(*, counties, fips_file, cluster, formats, out_dir, jobs, force, data_dir, output_dir):
+  data = DashboardData.load(data_dir=data_dir, output_dir=output_dir)
+  if fips_file is not None:
+    counties = export.read_fips_file(fips_file)
+  elif cluster is not None:
+    counties = export.get_cluster_fips(data, cluster)
 
-  fig = go.Figure(fig_data)
-  fig.update_layout(layout)
-  counties_string = '-'.join(counties)
-  fig.write_image(f'infections_{counties_string}.pdf', height=500, width=800, scale=5)
+  result = export.export_figures(data, counties, out_dir=out_dir, fmts=formats, processes=jobs, force=force)
+  print(f"wrote {len(result['written'])} figures in {result['wall_s']:.1f}s with {result['processes']} "
+        f"workers, skipped {result['skipped']} up to date")
 
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
 
-  parser.add_argument('--counties', nargs='+', default=['36061'], type=str, help='counties to include, by fips code')
+  parser.add_argument('--counties', nargs='+', default=['36061'], type=str, help='counties to plot, by fips code, one figure each')
+  parser.add_argument('--fips-file', default=None, help='file with the fips codes to plot, one per line')
+  parser.add_argument('--cluster', default=None, help='plot every county in this cluster')
+  parser.add_argument('--formats', nargs='+', default=['pdf'], choices=export.formats, help='formats to write')
+  parser.add_argument('--out-dir', default='.', help='directory for the figures')
+  parser.add_argument('--jobs', default=None, type=int, help='number of workers, defaults to the number of cores')
+  parser.add_argument('--force', action='store_true', help='write figures even if they are up to date')
+  parser.add_argument('--data-dir', default=os.environ.get('DASHBOARD_DATA_DIR'), help='directory with the csv files')
+  parser.add_argument('--output-dir', default=os.environ.get('DASHBOARD_OUTPUT_DIR'), help='directory with the embedding and snapshot')
   args = parser.parse_args()
-  
-  main(**args.__dict__)
 
+  main(**args.__dict__)
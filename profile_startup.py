@@ -0,0 +1,30 @@
+import argparse
+
+from utils.profiling import StartupProfiler
+
+
+def main(*, data_dir, output_dir, json_output, cprofile_dir, track_allocations, load_workers):
+  profiler = StartupProfiler(track_allocations=track_allocations, cprofile_dir=cprofile_dir)
+
+  # importing the data module pulls in umap, sklearn and plotly, which is part of the cold start
+  with profiler.phase('import utils.data'):
+    from utils.data import DashboardData
+
+  DashboardData(data_dir=data_dir, output_dir=output_dir, profiler=profiler, load_workers=load_workers)
+  print(profiler.table())
+  if json_output is not None:
+    profiler.to_json(json_output)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--data-dir', default=None, help='data directory, defaults to ./data')
+  parser.add_argument('--output-dir', default=None, help='embedding and clustering directory, defaults to ./output')
+  parser.add_argument('--json-output', default=None, help='write the timeline to this json file')
+  parser.add_argument('--cprofile-dir', default=None, help='dump a cProfile of each phase to this directory')
+  parser.add_argument('--track-allocations', action='store_true', help='trace peak allocations per phase (slow)')
+  parser.add_argument('--load-workers', default=None, type=int, help='threads for the loading stages, 1 to load one at a time')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
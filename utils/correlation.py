@@ -0,0 +1,74 @@
+"""Correlations between many columns at once, with missing values.
+
+Each pair of columns is correlated over the rows where both have values, as `pd.DataFrame.corr` does,
+but rather than a loop over pairs, the sums over those rows are matrix products with the masks of
+which values are present, so every pair takes the same six products.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def standardize(x):
+  """Center and scale each column of `x`, ignoring NaNs, so the sums in `correlate` stay well conditioned.
+
+  Constant columns become 0.
+
+  """
+  x = np.asarray(x, dtype=np.float64)
+  with np.errstate(invalid='ignore'):
+    mean = np.nanmean(np.where(np.isnan(x).all(axis=0), 0, x), axis=0)
+    std = np.nanstd(x - mean, axis=0)
+  return (x - mean) / np.where(std > 0, std, 1)
+
+
+def rank(x):
+  """Rank the values of each column of `x`, averaging ties, with NaNs kept where they are."""
+  return pd.DataFrame(np.asarray(x, dtype=np.float64)).rank().values
+
+
+def correlate(x, y, min_count=10):
+  """Get the Pearson correlation of every column of `x` with every column of `y`.
+
+  :param x: (rows, p) values, NaN where missing.
+  :param y: (rows, q) values, NaN where missing.
+  :param min_count: pairs with values on fewer rows than this are NaN.
+  :returns: (p, q) correlations, and (p, q) numbers of rows each is over
+  :rtype: tuple
+
+  """
+  x = standardize(x)
+  y = standardize(y)
+  x_mask = ~np.isnan(x)
+  y_mask = ~np.isnan(y)
+  x = np.where(x_mask, x, 0)
+  y = np.where(y_mask, y, 0)
+  x_mask = x_mask.astype(np.float64)
+  y_mask = y_mask.astype(np.float64)
+
+  # sums over the rows where both columns have values
+  n = x_mask.T @ y_mask
+  x_sum = x.T @ y_mask
+  y_sum = x_mask.T @ y
+  xx_sum = (x * x).T @ y_mask
+  yy_sum = x_mask.T @ (y * y)
+  xy_sum = x.T @ y
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    covariance = xy_sum - x_sum * y_sum / n
+    x_variance = xx_sum - x_sum ** 2 / n
+    y_variance = yy_sum - y_sum ** 2 / n
+    r = covariance / np.sqrt(x_variance * y_variance)
+  valid = (n >= min_count) & (x_variance > 1e-12 * n) & (y_variance > 1e-12 * n)
+  return np.where(valid, np.clip(r, -1, 1), np.nan), n.astype(np.int64)
+
+
+def rank_correlate(x, y, min_count=10):
+  """Get the Spearman correlation of every column of `x` with every column of `y`, like `correlate`.
+
+  The values are ranked within each column once, over all its values, rather than again over the rows
+  each pair has in common, which only differs where a pair is missing some rows.
+
+  """
+  return correlate(rank(x), rank(y), min_count=min_count)
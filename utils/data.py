@@ -1,5 +1,9 @@
 from os.path import join, exists
 import os
+import json
+import pickle
+import hashlib
+from urllib.request import urlopen
 from string import capwords
 import numpy as np
 import datetime as dt
@@ -9,11 +13,44 @@ from sklearn.cluster import DBSCAN
 from sklearn.cluster import AgglomerativeClustering
 from sklearn.cluster import KMeans
 from sklearn.neighbors import NearestNeighbors
+from sklearn.neighbors import KDTree
 from sklearn.mixture import GaussianMixture
 from scipy.signal import savgol_filter
 import seaborn as sns
 from plotly import graph_objects as go
 
+from utils.profiling import StartupProfiler, get_size
+from utils.lookups import FipsLookup, AnnotationLookup
+from utils import snapshot
+from utils import correlation
+from utils.stages import run_stages
+
+
+def compact_table(df, fips_dtype=None):
+  """Convert a table to compact dtypes, as `DashboardData._compact` describes.
+
+  :param df: the table.
+  :param fips_dtype: categorical dtype for the 'FIPS' column, to share the categories between tables.
+  :returns: the converted table, with the same index and columns
+  :rtype: pd.DataFrame
+
+  """
+  columns = {}
+  for column in df.columns:
+    values = df[column]
+    if column == 'FIPS':
+      values = values.astype('category' if fips_dtype is None else fips_dtype)
+    elif column == 'State':
+      values = values.astype('category')
+    elif pd.api.types.is_integer_dtype(values):
+      values = values.astype(np.int32)
+    elif pd.api.types.is_float_dtype(values):
+      v = values.values
+      whole = np.isfinite(v).all() and (v == np.round(v)).all() and np.abs(v).max(initial=0) < 2 ** 31
+      values = values.astype(np.int32 if whole else np.float32)
+    columns[column] = values
+  return pd.DataFrame(columns, index=df.index)
+
 
 class DashboardData(object):
   data_dir = './data'
@@ -385,18 +422,172 @@ class DashboardData(object):
   per_what = 10000
   threshold = 50
 
-  def __init__(self):
-    self.counties = pd.read_csv(join(self.data_dir, 'counties.csv'), converters=self.converters)
-    self.interventions = pd.read_csv(join(self.data_dir, 'interventions.csv'), converters=self.converters)
-    self.infections = self._load_timeseries('infections')
-    self.deaths = self._load_timeseries('deaths')
-    self.descriptions = pd.read_csv(join(self.data_dir, 'list_of_columns.csv'), dtype=str)
-    self.availability = pd.read_csv(join(self.data_dir, 'availability.csv'))
+  source_files = [
+    'counties.csv',
+    'interventions.csv',
+    'infections_timeseries.csv',
+    'deaths_timeseries.csv',
+    'list_of_columns.csv',
+    'availability.csv']
 
-    # get the gradient of the time series
-    self.infections_gradient = self.get_gradient(self.infections)
-    self.deaths_gradient = self.get_gradient(self.deaths)
+  # county boundaries, read from the data directory if there's a copy there
+  geojson_file = 'geojson-counties-fips.json'
+  geojson_url = 'https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json'
+
+  # threads to run the independent loading stages on, by default as many as the executor picks
+  load_workers = None
+
+  def __init__(self, data_dir=None, output_dir=None, profiler=None, compact=None, load_workers=None):
+    """Load the county data, its embedding and clustering.
+
+    :param data_dir: directory with the county-level csv files. Defaults to `DashboardData.data_dir`.
+    :param output_dir: directory for the cached embedding and clustering. Defaults to
+      `DashboardData.output_dir`.
+    :param profiler: `StartupProfiler` to record the construction phases with. By default, a new one
+      recording wall time and memory, available as `self.profiler`.
+    :param compact: store the tables in compact dtypes. Defaults to `DashboardData.compact`.
+    :param load_workers: threads to read the csv files and compute the gradients on. 1 loads them one
+      at a time. Defaults to `DashboardData.load_workers`.
+
+    """
+    if data_dir is not None:
+      self.data_dir = data_dir
+    if compact is not None:
+      self.compact = compact
+    if load_workers is not None:
+      self.load_workers = load_workers
+    if output_dir is not None:
+      self.output_dir = output_dir
+    if not exists(self.output_dir):
+      os.makedirs(self.output_dir)
+    self.profiler = StartupProfiler() if profiler is None else profiler
+
+    with self.profiler.phase('DashboardData.__init__'):
+      self._load()
+    self.profiler.finish()
+
+  @classmethod
+  def load(cls, data_dir=None, output_dir=None, snapshot_dir=None, profiler=None):
+    """Load the data from a snapshot, falling back to building it when the snapshot is missing or stale.
+
+    :param data_dir: directory with the county-level csv files. Defaults to `DashboardData.data_dir`.
+    :param output_dir: directory for the cached embedding and clustering. Defaults to
+      `DashboardData.output_dir`.
+    :param snapshot_dir: defaults to 'snapshot' in the output directory. Write one with
+      `build_snapshot.py`.
+    :param profiler: `StartupProfiler` to record the loading phases with.
+    :returns: the data
+    :rtype: DashboardData
+
+    """
+    data_dir = cls.data_dir if data_dir is None else data_dir
+    output_dir = cls.output_dir if output_dir is None else output_dir
+    snapshot_dir = join(output_dir, 'snapshot') if snapshot_dir is None else snapshot_dir
+    profiler = StartupProfiler() if profiler is None else profiler
+
+    with profiler.phase('check snapshot'):
+      manifest = snapshot.read_manifest(snapshot_dir)
+      fresh = snapshot.is_fresh(manifest, cls.get_source_hash(data_dir))
+    if not fresh:
+      print(f'snapshot in {snapshot_dir} is {"stale" if manifest else "missing"}, building from csv')
+      return cls(data_dir=data_dir, output_dir=output_dir, profiler=profiler)
+
+    with profiler.phase('load snapshot'):
+      data = snapshot.load_snapshot(cls, snapshot_dir)
+    data.data_dir = data_dir
+    data.output_dir = output_dir
+    data.profiler = profiler
+    profiler.finish()
+    return data
+
+  def save_snapshot(self, snapshot_dir=None):
+    """Write a snapshot for `DashboardData.load`.
+
+    :param snapshot_dir: defaults to 'snapshot' in the output directory.
+    :returns: the snapshot's manifest
+    :rtype: dict
+
+    """
+    snapshot_dir = join(self.output_dir, 'snapshot') if snapshot_dir is None else snapshot_dir
+    return snapshot.save_snapshot(self, snapshot_dir)
+
+  def _load_stages(self):
+    """The stages of loading that can run concurrently: parsing each csv file, the geojson, the
+    gradients and hashing the source files. Each sets its attributes and depends only on the stages it
+    names."""
+    def read_csv(name, fname, **kwargs):
+      return lambda: setattr(self, name, pd.read_csv(join(self.data_dir, fname), **kwargs))
+
+    def set_gradient(name):
+      return lambda: setattr(self, f'{name}_gradient', self.get_gradient(getattr(self, name)))
+
+    return {
+      'read counties.csv': (read_csv('counties', 'counties.csv', converters=self.converters), []),
+      'read interventions.csv': (read_csv('interventions', 'interventions.csv', converters=self.converters), []),
+      'read infections_timeseries.csv': (lambda: setattr(self, 'infections', self._load_timeseries('infections')), []),
+      'read deaths_timeseries.csv': (lambda: setattr(self, 'deaths', self._load_timeseries('deaths')), []),
+      'read list_of_columns.csv': (read_csv('descriptions', 'list_of_columns.csv', dtype=str), []),
+      'read availability.csv': (read_csv('availability', 'availability.csv'), []),
+      'load geojson': (lambda: setattr(self, 'counties_geojson', self._load_geojson()), []),
+      'source hash': (lambda: setattr(self, 'source_hash', self.get_source_hash(self.data_dir)), []),
+      # get the gradient of the time series
+      'infections gradient': (set_gradient('infections'), ['read infections_timeseries.csv']),
+      'deaths gradient': (set_gradient('deaths'), ['read deaths_timeseries.csv']),
+    }
+
+  def _load(self):
+    phase = self.profiler.phase
+    with phase('load stages'):
+      run_stages(self._load_stages(), max_workers=self.load_workers, profiler=self.profiler)
+
+    with phase('county tables'):
+      self._set_county_tables()
+
+    if self.compact:
+      with phase('compact tables'):
+        self._compact()
+
+    with phase('availability index'):
+      self._set_availability_index()
+
+    with phase('rollups'):
+      self._set_rollups()
 
+    with phase('growth sums'):
+      self._set_growth_sums()
+
+    with phase('growth rates'):
+      self._set_rates()
+
+    with phase('choropleth values'):
+      self._set_choropleth_values()
+
+    with phase('correlations'):
+      self._set_correlations()
+
+    with phase('annotations'):
+      self._set_annotations()
+
+    with phase('intervention growth'):
+      self._set_intervention_growth()
+
+    # self.selected_county = list(self.infections.nlargest(1, date_key)['FIPS'])[0]
+    self.selected_county = '53033'
+
+    with phase('_set_embedding'):
+      self._set_embedding()
+
+    with phase('_set_neighbors'):
+      self._set_neighbors()
+
+    # the timeseries figures plot one county at a time
+    self.selected_counties = [self.selected_county]
+
+    # identifies the data snapshot, for validating cached responses
+    with phase('data version'):
+      self.version = self.get_version()
+
+  def _set_county_tables(self):
     # remove non-counties:
     is_county = list(map(self._is_county, list(self.counties.loc[:, 'FIPS'])))
     self.counties = self.counties.iloc[is_county, :]
@@ -411,8 +602,11 @@ class DashboardData(object):
       county_name=[f'{capwords(area_name)}, {state}'
                    for area_name, state in zip(self.counties['Area_Name'], self.counties['State'])])
     self.county_names = pd.DataFrame(county_names)
-    self.fips_to_county_name = dict(zip(self.fips_codes, county_names['county_name']))
-    self.fips_to_population = dict(zip(self.fips_codes, self.counties['POP_ESTIMATE_2018']))
+    self.fips_to_county_name = FipsLookup(self.fips_codes, county_names['county_name'])
+    population = self.counties[['POP_ESTIMATE_2018']]
+    if self.compact:
+      population = compact_table(population)
+    self.fips_to_population = FipsLookup(self.fips_codes, population['POP_ESTIMATE_2018'])
 
     # define the daily infections data, same ordering as infections
     date_key = self.infections.keys()[-1]
@@ -432,6 +626,7 @@ class DashboardData(object):
     self.infections_start_indices = [nonzero[0] if nonzero.size > 0 else -1 for nonzero in nonzeros]
     # self.infections_start_dates = [nonzero[0] if nonzero.size > 0 else -1 for nonzero in nonzeros]
 
+  def _set_annotations(self):
     # figure out the annotations for each FIPS in self.infections
     dates = [dt.date(int('20' + y), int(m), int(d)) for m, d, y in map(lambda x: x.split('/'), self.infections.keys()[1:])]
     self.timeseries_dates = [d.isoformat() for d in dates]
@@ -441,11 +636,22 @@ class DashboardData(object):
 
     self.timeseries_start_index = (np.array(self.infections.iloc[:, 1:]) > 50).any(axis=0).nonzero()[0][0]
 
-    # make annotations for the selected intervention on the graphs
-    self.infections_annotations = {}       # (fips, intervention) -> annotation dict
-    self.deaths_annotations = {}       # (fips, intervention key) -> annotation dict
-    self.threshold_infections_annotations = {}       # (fips, intervention) -> annotation dict
-    self.threshold_deaths_annotations = {}       # (fips, intervention key) -> annotation dict
+    # make annotations for the selected intervention on the graphs, (fips, intervention) -> annotation dict
+    fips_codes = list(self.infections['FIPS'])
+    kwargs = dict(
+      xref='x',
+      yref='y',
+      showarrow=True,
+      arrowhead=0,
+      ax=0,
+      ay=-30,
+      textangle=-90)
+    self.infections_annotations = AnnotationLookup(fips_codes, self.intervention_keys, **kwargs)
+    self.deaths_annotations = AnnotationLookup(fips_codes, self.intervention_keys, **kwargs)
+    self.threshold_infections_annotations = AnnotationLookup(
+      fips_codes, self.intervention_keys, threshold=True, **kwargs)
+    self.threshold_deaths_annotations = AnnotationLookup(
+      fips_codes, self.intervention_keys, threshold=True, **kwargs)
     for i, row in self.infections.iterrows():
       fips = row['FIPS']
       interventions = fips_to_interventions_row[fips]
@@ -455,70 +661,265 @@ class DashboardData(object):
         d = dt.date.fromordinal(int(interventions[k]))
         d_idx_raw = int(interventions[k]) - timeseries_ordinal_dates[0]
 
-        kwargs = dict(
-          xref='x',
-          yref='y',
-          text=d.strftime('%b %d'),
-          showarrow=True,
-          arrowhead=0,
-          ax=0,
-          ay=-30,
-          textangle=-90)
-
-        self.infections_annotations[fips, k] = dict(
-          x=d.isoformat(),
-          xidx=d_idx_raw + 1,
-          y=row[d_idx_raw + 1],
-          **kwargs)
-        
-        self.deaths_annotations[fips, k] = dict(
-          x=d.isoformat(),
-          xidx=d_idx_raw + 1,
-          y=self.deaths.iloc[i, d_idx_raw + 1],
-          **kwargs)
+        self.infections_annotations.set(fips, k, d, xidx=d_idx_raw + 1, y=row[d_idx_raw + 1])
+        self.deaths_annotations.set(fips, k, d, xidx=d_idx_raw + 1, y=self.deaths.iloc[i, d_idx_raw + 1])
 
         date_idx = d_idx_raw - self.infections_start_indices[i]
         if date_idx < 0:
           continue
-        
-        self.threshold_infections_annotations[fips, k] = dict(
+
+        self.threshold_infections_annotations.set(
+          fips, k, d,
           x=d_idx_raw - self.infections_start_indices[i],
           xidx=d_idx_raw + 1,
-          y=row[d_idx_raw + 1] / self.fips_to_population[row[0]] * self.per_what,
-          **kwargs)
-        
-        self.threshold_deaths_annotations[fips, k] = dict(
+          y=row[d_idx_raw + 1] / self.fips_to_population[row[0]] * self.per_what)
+        self.threshold_deaths_annotations.set(
+          fips, k, d,
           x=d_idx_raw - self.infections_start_indices[i],
           xidx=d_idx_raw + 1,
-          y=self.deaths.iloc[i, d_idx_raw + 1] / self.fips_to_population[row[0]] * self.per_what,
-          **kwargs)
-
-    # self.selected_county = list(self.infections.nlargest(1, date_key)['FIPS'])[0]
-    self.selected_county = '53033'
-
-    self._set_embedding()
-
-    self.selected_counties = self.counties_subset_names['FIPS'][
-      self.cluster_labels == self.fips_to_cluster_label[self.selected_county]]
+          y=self.deaths.iloc[i, d_idx_raw + 1] / self.fips_to_population[row[0]] * self.per_what)
 
   def set_selected_county(self, fips):
     if self.selected_county == fips:
       return
     self.selected_county = fips
-    self.selected_cluster = self.fips_to_cluster_label[self.selected_county]
-    self.selected_counties = self.counties_subset_names['FIPS'][
-      self.cluster_labels == self.selected_cluster]
-    
+    # None for counties missing some of the features, which aren't clustered
+    self.selected_cluster = self.fips_to_cluster_label.get(self.selected_county)
+    self.selected_counties = [self.selected_county]
+
+  @classmethod
+  def get_source_hash(cls, data_dir=None):
+    """Hash the contents of the source csv files.
+
+    :param data_dir: defaults to `DashboardData.data_dir`.
+    :returns: hex digest
+    :rtype: str
+
+    """
+    if data_dir is None:
+      data_dir = cls.data_dir
+    h = hashlib.sha1()
+    for fname in cls.source_files:
+      with open(join(data_dir, fname), 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+          h.update(chunk)
+    return h.hexdigest()
+
+  def get_version(self):
+    """Get a short identifier for the data snapshot, including the embedding and clustering.
+
+    Anything derived from the data (figures, responses) can be cached under this version.
+
+    :returns: hex digest
+    :rtype: str
+
+    """
+    h = hashlib.sha1(self.source_hash.encode())
+    h.update(np.ascontiguousarray(self.embedding).tobytes())
+    h.update(np.ascontiguousarray(self.cluster_labels).astype(str).tobytes())
+    return h.hexdigest()[:16]
+
   def _is_county(self, fips):
     return fips[2:] != '000'
 
+  # FIPS code of the national rollup. States are '{state}000', as in the source tables.
+  national_fips = '00000'
+
+  def _set_rollups(self):
+    """Sum the county timeseries into state and national series.
+
+    The rollup tables have the layout of the county tables, with the nation first and then each state
+    in order of FIPS code. The counties are summed by state with one `np.add.reduceat` over the rows
+    sorted by state. Per-capita values divide by the summed population of the counties, so they are
+    the population-weighted averages of the counties'.
+
+    Also splits the county choropleth data and boundaries by state, so drilling down into a state
+    selects rows rather than recomputing anything.
+
+    """
+    def get_states(fips_codes):
+      return np.array([fips[:2] for fips in fips_codes])
+
+    def rollup(states, values):
+      order = np.argsort(states, kind='stable')
+      starts = np.searchsorted(states[order], self.rollup_states)
+      state_values = np.add.reduceat(np.asarray(values, dtype=np.float64)[order], starts, axis=0)
+      return np.concatenate([state_values.sum(axis=0, keepdims=True), state_values])
+
+    states = get_states(self.infections['FIPS'])
+    self.rollup_states = np.unique(states)
+    self.rollup_fips_codes = [self.national_fips] + [f'{state}000' for state in self.rollup_states]
+    for name in ['infections', 'deaths']:
+      table = getattr(self, name)
+      rollups = pd.DataFrame(rollup(get_states(table['FIPS']), table.iloc[:, 1:].values),
+                             columns=table.columns[1:])
+      rollups.insert(0, 'FIPS', self.rollup_fips_codes)
+      setattr(self, f'rollup_{name}', rollups)
+
+    population = rollup(states, self.fips_to_population.lookup(list(self.infections['FIPS']))[:, None])[:, 0]
+    state_names = dict(zip(get_states(self.counties['FIPS']), self.counties['State']))
+    names = ['United States'] + [state_names.get(state, state) for state in self.rollup_states]
+    self.fips_to_rollup_name = FipsLookup(self.rollup_fips_codes, names)
+    self.fips_to_rollup_population = FipsLookup(self.rollup_fips_codes, population)
+
+    infections = self.rollup_infections.iloc[:, -1].values
+    self.rollup_totals = pd.DataFrame({
+      'FIPS': self.rollup_fips_codes,
+      'state': names,
+      'infections': infections,
+      'infections_per_capita': infections / np.maximum(population, 1) * self.per_what})
+
+    # rows of `total_infections`, and county boundaries, in each state
+    county_states = get_states(self.total_infections['FIPS'])
+    self.state_county_rows = {f'{state}000': np.flatnonzero(county_states == state)
+                              for state in self.rollup_states}
+    features = {}
+    for feature in self.counties_geojson['features']:
+      features.setdefault(f"{str(feature.get('id', ''))[:2]}000", []).append(feature)
+    self.state_geojson = {fips: dict(type='FeatureCollection', features=features.get(fips, []))
+                          for fips in self.rollup_fips_codes[1:]}
+
+  def _set_choropleth_values(self):
+    """Divide the whole infections matrices, of the counties and of the rollups, by population, so the
+    choropleth of any date is a column of these."""
+    population = self.fips_to_population.lookup(list(self.infections['FIPS'])).astype(np.float64)
+    self.county_infections_per_capita = (np.asarray(self.infections.iloc[:, 1:].values, dtype=np.float64)
+                                         / np.maximum(population, 1)[:, None] * self.per_what).astype(np.float32)
+    population = self.fips_to_rollup_population.lookup(self.rollup_fips_codes).astype(np.float64)
+    self.rollup_infections_per_capita = (self.rollup_infections.iloc[:, 1:].values.astype(np.float64)
+                                         / np.maximum(population, 1)[:, None] * self.per_what).astype(np.float32)
+
+  def get_choropleth_values(self, region=None, date_index=-1, color='infections_per_capita'):
+    """Get the values to color each area of a choropleth with, and its infections, on one date.
+
+    :param region: None for every county, `national_fips` for the states, or a state's rollup code for
+      its counties. The areas are in the order `elements.get_counties_figure` plots them.
+    :param date_index: index of the date in `timeseries_dates`.
+    :param color: 'infections_per_capita', or a timeseries type with a rate measure, e.g.
+      'infections_growth_rate'.
+    :returns: the color values and infections, one per area
+    :rtype: tuple
+
+    """
+    if color == 'infections_per_capita':
+      counties, rollups = self.county_infections_per_capita, self.rollup_infections_per_capita
+    elif self.split_timeseries_type(color)[1] is not None:
+      counties = getattr(self, color).iloc[:, 1:].values
+      rollups = getattr(self, f'rollup_{color}').iloc[:, 1:].values
+    else:
+      raise ValueError(f'bad choropleth color: {color}')
+
+    if region is None:
+      return counties[:, date_index], self.infections.iloc[:, 1:].values[:, date_index]
+    if region == self.national_fips:
+      return rollups[1:, date_index], self.rollup_infections.iloc[1:, 1:].values[:, date_index]
+    rows = self.state_county_rows[region]
+    return counties[rows, date_index], self.infections.iloc[:, 1:].values[rows, date_index]
+
+  def get_rollup_timeseries(self, fips=None, timeseries_type='infections'):
+    """Get the timeseries of the nation or a state.
+
+    :param fips: the state's rollup code, '{state}000', or None for the nation.
+    :param timeseries_type: 'infections' or 'deaths', or one of their rates, e.g.
+      'infections_growth_rate'.
+    :returns: the cumulative values, or the rates, one per date in `timeseries_dates`
+    :rtype: np.ndarray
+
+    """
+    fips = self.national_fips if fips is None else fips
+    row = self.rollup_fips_codes.index(fips)
+    return getattr(self, f'rollup_{timeseries_type}').iloc[row, 1:].values.astype(np.float64)
+
+  # the Savitzky-Golay filter the gradients and growth rates are smoothed with
+  smoothing_window = 7
+  smoothing_polyorder = 3
+
   def get_gradient(self, timeseries):
     # get the gradient of the time series
-    gradient = np.array([savgol_filter(row[1:], window_length=7, polyorder=3, deriv=1) for i, row in timeseries.iterrows()])
+    gradient = savgol_filter(np.asarray(timeseries.iloc[:, 1:].values, dtype=np.float64),
+                             window_length=self.smoothing_window, polyorder=self.smoothing_polyorder,
+                             deriv=1, axis=1)
     gradient = pd.DataFrame(gradient, columns=timeseries.keys()[1:])
     gradient = pd.concat([timeseries['FIPS'], gradient], axis=1)
     return gradient
     
+  # store the tables in compact dtypes
+  compact = True
+
+  def _compact(self):
+    """Convert the large tables to compact dtypes.
+
+    FIPS codes and states become categoricals, so each string is stored once and the columns hold
+    integer codes. Whole-number columns become int32, and the other floats float32. The figures still
+    see the zero-padded FIPS strings.
+
+    """
+    fips_dtype = pd.CategoricalDtype(sorted(set(self.counties['FIPS']) | set(self.infections['FIPS'])))
+    for name in ['counties', 'infections', 'deaths', 'infections_gradient', 'deaths_gradient']:
+      setattr(self, name, compact_table(getattr(self, name), fips_dtype))
+    self.infections_start_indices = np.array(self.infections_start_indices, dtype=np.int32)
+
+  def memory_report(self):
+    """Break down the memory held by the data, by attribute.
+
+    Objects shared between attributes are counted once, under the first. Memory-mapped arrays are
+    counted in full, although their pages are only loaded when read and are shared between processes.
+
+    :returns: the type and size in bytes of each attribute, largest first
+    :rtype: pd.DataFrame
+
+    """
+    seen = set()
+    rows = [(name, type(value).__name__, get_size(value, seen)) for name, value in vars(self).items()
+            if name not in snapshot.excluded]
+    report = pd.DataFrame(rows, columns=['attribute', 'type', 'bytes']).set_index('attribute')
+    return report.sort_values('bytes', ascending=False)
+
+  def _set_availability_index(self):
+    """Index which descriptors each county has, as one bit per column packed into 64-bit words.
+
+    Row i of `self.availability_bits` is the county in row i of `self.counties`, and bit j (counting
+    from the least significant bit of the first word) is set if it has a value for the column
+    `self.availability_columns[j]`.
+
+    """
+    self.availability_columns = [column for column in self.counties.columns if column != 'FIPS']
+    self.availability_column_index = {column: j for j, column in enumerate(self.availability_columns)}
+    notnull = self.counties[self.availability_columns].notnull().values
+    num_words = -(-notnull.shape[1] // 64)
+    padded = np.zeros((notnull.shape[0], 64 * num_words), dtype=bool)
+    padded[:, :notnull.shape[1]] = notnull
+    self.availability_bits = np.packbits(padded, axis=1, bitorder='little').view('<u8')
+
+  def get_availability_mask(self, features):
+    """Pack a set of features into words, like the rows of `self.availability_bits`."""
+    bits = np.zeros(64 * self.availability_bits.shape[1], dtype=bool)
+    bits[[self.availability_column_index[feature] for feature in features]] = True
+    return np.packbits(bits, bitorder='little').view('<u8')
+
+  def get_complete_counties(self, features):
+    """Get a mask of the counties (the rows of `self.counties`) with values for all of `features`."""
+    mask = self.get_availability_mask(features)
+    return ((self.availability_bits & mask) == mask).all(axis=1)
+
+  def count_complete_counties(self, features, candidates=None):
+    """Count the counties with values for all of `features`, and how many would remain with each candidate.
+
+    :param features: the features chosen so far.
+    :param candidates: features that could be added. Defaults to every column.
+    :returns: the number of counties with all of `features`, and a dict with the number that also
+      have each candidate
+    :rtype: tuple
+
+    """
+    complete = self.get_complete_counties(features)
+    bits = np.unpackbits(self.availability_bits[complete].view(np.uint8), axis=1, bitorder='little')
+    counts = bits.sum(axis=0)
+    if candidates is None:
+      candidates = self.availability_columns
+    return int(complete.sum()), {feature: int(counts[self.availability_column_index[feature]])
+                                 for feature in candidates}
+
   def get_counties_subset(self, selected_features=None):
     """Get the subset of counties with 100% availability for the selected features
 
@@ -531,7 +932,7 @@ class DashboardData(object):
 
     counties = self.counties.loc[:, selected_features]
     num_counties = counties.shape[0]
-    which_counties = counties.notnull().values.all(axis=1)
+    which_counties = self.get_complete_counties(selected_features)
     self.counties_subset_names = self.county_names.loc[which_counties]
     self.counties_subset = counties.iloc[which_counties, :]
 
@@ -546,8 +947,6 @@ class DashboardData(object):
   color_palette = sns.color_palette('hls', 10)
   color_palette = [f'#{int(255*t[0]):02x}{int(255*t[1]):02x}{int(255*t[2]):02x}' for t in color_palette]
   output_dir = 'output'
-  if not exists(output_dir):
-    os.mkdir(output_dir)
 
   selected_features = [
     "POP_ESTIMATE_2018",
@@ -588,7 +987,7 @@ class DashboardData(object):
     "ICU Beds",
   }
     
-  def _embed(self, x, fips_codes, normalize=True):
+  def _embed(self, x, fips_codes, normalize=True, refit=False):
     x = x.copy()
     print('FOR FAST DEBUGGING ONLY')
     fname = join(self.output_dir, 'embedding.npy')
@@ -601,7 +1000,7 @@ class DashboardData(object):
 
       # x = (x - x.mean(axis=0, keepdims=True)) / np.sqrt(x.var(axis=0, keepdims=True) + 0.0001)
     
-    if exists(fname) and __name__ != '__main__':
+    if exists(fname) and not refit:
       embedding = np.load(fname)
     else:
       print('embedding...')
@@ -613,7 +1012,7 @@ class DashboardData(object):
       
     return embedding
 
-  def _cluster(self, x, fips_codes, normalize=True):
+  def _cluster(self, x, fips_codes, normalize=True, refit=False):
     x = x.copy()
     print('FOR FAST DEBUGGING ONLY')
     fname = join(self.output_dir, 'clustering.npy')
@@ -627,7 +1026,7 @@ class DashboardData(object):
 
       # x = (x - x.mean(axis=0, keepdims=True)) / np.sqrt(x.var(axis=0, keepdims=True) + 0.0001)
     
-    if exists(fname) and __name__ != '__main__':
+    if exists(fname) and not refit:
       labels = np.load(fname)
     else:
       print('clustering...')
@@ -664,12 +1063,39 @@ class DashboardData(object):
       fig.show()
   
   def _set_embedding(self, selected_features=None):
-    counties_subset, counties_subset_names = self.get_counties_subset(selected_features=selected_features)
+    phase = self.profiler.phase
+    with phase('get_counties_subset'):
+      counties_subset, counties_subset_names = self.get_counties_subset(selected_features=selected_features)
     subset_fips_codes = list(counties_subset_names['FIPS'])
     self.clustering_fips_codes = subset_fips_codes
-    self.embedding = self._embed(counties_subset, subset_fips_codes)
-    self.cluster_labels = self._cluster(counties_subset, subset_fips_codes)
-    self.fips_to_cluster_label = dict(zip(counties_subset_names['FIPS'], self.cluster_labels))
+    x = self.get_normalized_features().values
+
+    models = self._load_models()
+    with phase('_update_embedding'):
+      updated = models is not None and __name__ != '__main__' and self._update_embedding(models, x)
+    if not updated:
+      # fit both from scratch, unless there are no saved models and the cached embedding and clustering
+      # can be used as they are
+      refit = (models is not None or __name__ == '__main__'
+               or not exists(join(self.output_dir, 'embedding.npy'))
+               or not exists(join(self.output_dir, 'clustering.npy')))
+      with phase('_embed'):
+        self.embedding = self._embed(counties_subset, subset_fips_codes, refit=refit)
+      with phase('_cluster'):
+        self.cluster_labels = self._cluster(counties_subset, subset_fips_codes, refit=refit)
+      if refit:
+        self._save_models(dict(
+          features=list(self.selected_features),
+          reducer=self.reducer,
+          clusterer=self.clusterer,
+          fit_fips_codes=subset_fips_codes,
+          fit_x=x,
+          fips_codes=subset_fips_codes,
+          x=x,
+          embedding=self.embedding,
+          labels=self.cluster_labels))
+    self.fips_to_cluster_label = FipsLookup(
+      counties_subset_names['FIPS'], np.asarray(self.cluster_labels).astype(np.int16), convert=str)
     self.selected_cluster = self.fips_to_cluster_label[self.selected_county]
     self.unique_cluster_labels = set(self.cluster_labels)
 
@@ -683,48 +1109,610 @@ class DashboardData(object):
       cluster=self.cluster_labels.astype(str)))
     return self.embedding
     
+  # refit the embedding and clustering from scratch, rather than projecting the new and changed
+  # counties, once more than this fraction of the counties differ from the ones they were fit on...
+  refit_fraction = 0.1
+  # ...or the mean of a feature has moved by more than this many standard deviations since the fit
+  refit_shift = 0.25
+  # drift measured against the saved models, None if there were none
+  embedding_drift = None
+
+  def _load_models(self):
+    fname = join(self.output_dir, 'models.pkl')
+    if not exists(fname):
+      return None
+    with open(fname, 'rb') as file:
+      return pickle.load(file)
+
+  def _save_models(self, models):
+    with open(join(self.output_dir, 'models.pkl'), 'wb') as file:
+      pickle.dump(models, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+  def get_drift(self, x, fips_codes, models):
+    """Measure how far the normalized features have drifted from the ones the models were fit on.
+
+    :param x: normalized features of the clustered counties.
+    :param fips_codes: FIPS codes of the rows of `x`.
+    :param models: the saved models.
+    :returns: 'unfit_fraction', the fraction of counties not in the fit or with different features,
+      and 'max_shift', the largest change in a feature's mean, in standard deviations of the fit.
+    :rtype: dict
+
+    """
+    fit_index = {fips: i for i, fips in enumerate(models['fit_fips_codes'])}
+    idx = np.array([fit_index.get(fips, -1) for fips in fips_codes])
+    unfit = idx < 0
+    unfit[~unfit] = ~np.isclose(models['fit_x'][idx[~unfit]], x[~unfit]).all(axis=1)
+
+    fit_x = models['fit_x']
+    std = fit_x.std(axis=0)
+    shift = np.abs(x.mean(axis=0) - fit_x.mean(axis=0)) / np.where(std > 0, std, 1)
+    return dict(unfit_fraction=float(unfit.mean()), max_shift=float(shift.max()))
+
+  def _update_embedding(self, models, x):
+    """Update the embedding and clustering with the saved models, without refitting them.
+
+    Counties whose features are unchanged since the last update keep their coordinates and cluster.
+    New and changed counties are projected with the reducer's `transform` and assigned with the
+    clusterer's `predict`.
+
+    :param models: the saved models.
+    :param x: normalized features of the clustered counties.
+    :returns: whether the embedding was updated. False if the features selected have changed, or the
+      data has drifted too far from the fit, and the models need refitting.
+    :rtype: bool
+
+    """
+    fips_codes = self.clustering_fips_codes
+    if models['features'] != list(self.selected_features):
+      return False
+    self.embedding_drift = self.get_drift(x, fips_codes, models)
+    if (self.embedding_drift['unfit_fraction'] > self.refit_fraction
+        or self.embedding_drift['max_shift'] > self.refit_shift):
+      print(f'features drifted from the fit ({self.embedding_drift}), refitting...')
+      return False
+
+    last_index = {fips: i for i, fips in enumerate(models['fips_codes'])}
+    idx = np.array([last_index.get(fips, -1) for fips in fips_codes])
+    changed = idx < 0
+    changed[~changed] = ~np.isclose(models['x'][idx[~changed]], x[~changed]).all(axis=1)
+
+    embedding = np.empty((len(fips_codes), models['embedding'].shape[1]), dtype=models['embedding'].dtype)
+    labels = np.empty(len(fips_codes), dtype=models['labels'].dtype)
+    embedding[~changed] = models['embedding'][idx[~changed]]
+    labels[~changed] = models['labels'][idx[~changed]]
+    if changed.any():
+      print(f'projecting {changed.sum()} new or changed counties...')
+      embedding[changed] = models['reducer'].transform(x[changed])
+      labels[changed] = models['clusterer'].predict(x[changed]).astype(labels.dtype)
+
+      np.save(join(self.output_dir, 'embedding.npy'), embedding)
+      np.save(join(self.output_dir, 'clustering.npy'), labels.astype(int))
+      pd.DataFrame(dict(FIPS=fips_codes, x=embedding[:, 0], y=embedding[:, 1])).to_csv(
+        join(self.output_dir, 'embedding.csv'))
+      pd.DataFrame(dict(FIPS=fips_codes, x=x[:, 0], y=x[:, 1], cluster=labels)).to_csv(
+        join(self.output_dir, 'clustering.csv'))
+      models.update(fips_codes=fips_codes, x=x, embedding=embedding, labels=labels)
+      self._save_models(models)
+
+    self.reducer = models['reducer']
+    self.clusterer = models['clusterer']
+    self.embedding = embedding
+    self.cluster_labels = labels
+    return True
+
+  # spaces that `similar_counties` searches: the standardized descriptors, or the 2-D embedding
+  neighbor_spaces = ['features', 'embedding']
+
+  def _get_neighbor_points(self):
+    # normalized features scaled to unit variance, so no one feature dominates the distances
+    features = self.get_normalized_features().values
+    std = features.std(axis=0)
+    features = (features - features.mean(axis=0)) / np.where(std > 0, std, 1)
+    return dict(features=features, embedding=np.array(self.embedding, dtype=np.float64))
+
+  def _set_neighbors(self):
+    """Build a KD-tree over the clustered counties in each neighbor space, for `similar_counties`.
+
+    The trees are saved to 'neighbors.pkl' in the output directory, next to the embedding, and loaded
+    from there as long as the points they were built on are unchanged.
+
+    """
+    points = self._get_neighbor_points()
+    key = hashlib.sha1(b''.join(points[space].tobytes() for space in self.neighbor_spaces)).hexdigest()
+    fname = join(self.output_dir, 'neighbors.pkl')
+
+    trees = None
+    if exists(fname):
+      with open(fname, 'rb') as file:
+        saved = pickle.load(file)
+      if saved.get('key') == key:
+        trees = saved['trees']
+    if trees is None:
+      trees = {space: KDTree(points[space]) for space in self.neighbor_spaces}
+      with open(fname, 'wb') as file:
+        pickle.dump(dict(key=key, trees=trees), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    self.neighbor_points = points
+    self.neighbor_trees = trees
+    self.clustering_fips_index = {fips: i for i, fips in enumerate(self.clustering_fips_codes)}
+
+  def similar_counties(self, fips, k=10, space='features'):
+    """Get the counties nearest to a county, by their descriptors or in the embedding.
+
+    :param fips: the county's FIPS code.
+    :param k: number of counties to return.
+    :param space: 'features' or 'embedding'.
+    :returns: (FIPS code, distance) for each of the `k` nearest counties, nearest first. Empty if the
+      county isn't clustered, because it is missing some of the features.
+    :rtype: list
+
+    """
+    if space not in self.neighbor_spaces:
+      raise ValueError(f'bad space: {space}')
+    i = self.clustering_fips_index.get(fips)
+    if i is None:
+      return []
+    points = self.neighbor_points[space]
+    distances, indices = self.neighbor_trees[space].query(points[i:i + 1], k=min(k + 1, points.shape[0]))
+    return [(self.clustering_fips_codes[j], float(d)) for d, j in zip(distances[0], indices[0]) if j != i][:k]
+
+  # the longest window, in days, the growth rankings average over
+  max_growth_window = 28
+  growth_measures = ['absolute', 'per_capita', 'relative']
+
+  def _set_growth_sums(self):
+    """Sum the last `max_growth_window` days of each county's gradient and timeseries, backwards from
+    the latest date, so the mean over any window ending on the latest date is one column.
+
+    The gradients are the Savitzky-Golay slopes, so their mean over a window is the county's recent
+    growth per day. These are saved with the rest of the data, so they are only recomputed when new
+    data arrives.
+
+    """
+    window = self.max_growth_window
+    for name in ['infections', 'deaths']:
+      # the gradients still have the state rows, otherwise their rows match the timeseries
+      timeseries = getattr(self, name)
+      gradient = getattr(self, f'{name}_gradient')
+      gradient = gradient.loc[gradient['FIPS'].isin(set(timeseries['FIPS']))]
+      fips_codes = np.array(timeseries['FIPS'], dtype=str)
+      assert (np.array(gradient['FIPS'], dtype=str) == fips_codes).all()
+
+      slopes = np.asarray(gradient.iloc[:, -window:].values[:, ::-1], dtype=np.float64)
+      levels = np.asarray(timeseries.iloc[:, -window:].values[:, ::-1], dtype=np.float64)
+      setattr(self, f'{name}_growth_fips_codes', fips_codes)
+      setattr(self, f'{name}_growth_slope_sums', np.cumsum(slopes, axis=1))
+      setattr(self, f'{name}_growth_level_sums', np.cumsum(levels, axis=1))
+      setattr(self, f'{name}_growth_population',
+              np.asarray(self.fips_to_population.lookup(fips_codes), dtype=np.float64))
+
+  # the measures of growth computed for every county and rollup, on every date
+  rate_measures = ['growth_rate', 'doubling_time', 'reproduction']
+  # smoothed totals below this, and new cases per day below `min_daily_cases`, give no rates, which
+  # would be mostly noise
+  min_rate_level = 10
+  min_daily_cases = 1
+  # mean days from one infection to the next in a chain of transmission
+  serial_interval = 5
+  # doubling times longer than this, in days, are no growth to speak of
+  max_doubling_time = 365
+
+  def split_timeseries_type(self, timeseries_type):
+    """Split a timeseries type into the counts it comes from and its rate measure.
+
+    :param timeseries_type: 'infections' or 'deaths', or either followed by one of `rate_measures`,
+      e.g. 'infections_growth_rate'.
+    :returns: ('infections' or 'deaths', the measure or None)
+    :rtype: tuple
+
+    """
+    for name in ['infections', 'deaths']:
+      if timeseries_type == name:
+        return name, None
+      if timeseries_type.startswith(f'{name}_') and timeseries_type[len(name) + 1:] in self.rate_measures:
+        return name, timeseries_type[len(name) + 1:]
+    raise ValueError(f'bad timeseries type: {timeseries_type}')
+
+  def get_rates(self, values):
+    """Compute the growth rate, doubling time and a reproduction number proxy of many timeseries at once.
+
+    The totals and their slopes are smoothed along the dates of every row at once, with the filter
+    `get_gradient` uses. The growth rate is the slope of the log of the total, i.e. the slope over the
+    total, per day. The doubling time, ln 2 over the growth rate, is only defined while the total grows,
+    up to `max_doubling_time`. The reproduction number proxy is the smoothed new cases per day over
+    those `serial_interval` days earlier, which is about exp(r * serial_interval) for new cases growing
+    at a rate r. The rates are NaN where the total is below `min_rate_level`, or the earlier new cases
+    below `min_daily_cases`.
+
+    :param values: cumulative totals, one row per area and one column per date.
+    :returns: dict from each of `rate_measures` to a float32 matrix the shape of `values`
+    :rtype: dict
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    kwargs = dict(window_length=self.smoothing_window, polyorder=self.smoothing_polyorder, axis=1)
+    level = savgol_filter(values, **kwargs)
+    slope = savgol_filter(values, deriv=1, **kwargs)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+      growth_rate = np.where(level >= self.min_rate_level, slope / level, np.nan)
+      doubling_time = np.where(growth_rate > np.log(2) / self.max_doubling_time, np.log(2) / growth_rate, np.nan)
+      lag = self.serial_interval
+      earlier = np.full_like(slope, np.nan)
+      earlier[:, lag:] = slope[:, :-lag]
+      reproduction = np.where((earlier >= self.min_daily_cases) & (slope >= 0), slope / earlier, np.nan)
+    return dict(growth_rate=growth_rate.astype(np.float32),
+                doubling_time=doubling_time.astype(np.float32),
+                reproduction=reproduction.astype(np.float32))
+
+  def _set_rates(self):
+    """Compute the `rate_measures` of every county and rollup, stacked into one matrix for each of
+    infections and deaths, so each takes one pass.
+
+    Each is a table in the layout of the timeseries it comes from, e.g. `infections_growth_rate` and
+    `rollup_infections_growth_rate`, so they plot like the timeseries. These are saved with the rest of
+    the data, so they are only recomputed when new data arrives.
+
+    """
+    for name in ['infections', 'deaths']:
+      counties = getattr(self, name)
+      rollups = getattr(self, f'rollup_{name}')
+      rates = self.get_rates(np.concatenate([np.asarray(counties.iloc[:, 1:].values, dtype=np.float64),
+                                             np.asarray(rollups.iloc[:, 1:].values, dtype=np.float64)]))
+      n = counties.shape[0]
+      for measure, values in rates.items():
+        for prefix, table, rows in [('', counties, values[:n]), ('rollup_', rollups, values[n:])]:
+          rates_table = pd.DataFrame(rows, columns=table.columns[1:], index=table.index)
+          rates_table.insert(0, 'FIPS', table['FIPS'])
+          setattr(self, f'{prefix}{name}_{measure}', rates_table)
+
+  # the county outcomes the descriptors are correlated with, latest first
+  correlation_outcomes = ['infections_per_capita', 'deaths_per_capita', 'infections_growth_per_capita',
+                          'infections_growth_rate']
+  # days the new cases per day per capita are averaged over
+  correlation_growth_window = 7
+
+  def get_outcomes(self):
+    """Get the `correlation_outcomes` of every county on the latest date, in the order of `self.counties`.
+
+    :returns: (counties, outcomes) float64 matrix, NaN for counties without a timeseries
+    :rtype: np.ndarray
+
+    """
+    population = np.asarray(self.fips_to_population.lookup(list(self.infections['FIPS'])), dtype=np.float64)
+    population = np.where(population > 0, population, np.nan)
+    window = min(self.correlation_growth_window, self.infections_growth_slope_sums.shape[1])
+    outcomes = np.stack([
+      np.asarray(self.infections.iloc[:, -1].values, dtype=np.float64) / population * self.per_what,
+      np.asarray(self.deaths.iloc[:, -1].values, dtype=np.float64) / population * self.per_what,
+      self.infections_growth_slope_sums[:, window - 1] / window / population * self.per_what,
+      np.asarray(self.infections_growth_rate.iloc[:, -1].values, dtype=np.float64)], axis=1)
+
+    rows = pd.Index(np.asarray(self.infections['FIPS'], dtype=str)).get_indexer(
+      np.asarray(self.counties['FIPS'], dtype=str))
+    outcomes = np.where((rows >= 0)[:, None], outcomes[rows], np.nan)
+    return outcomes
+
+  def _set_correlations(self):
+    """Correlate every numeric descriptor in `columns_to_include` with each of `correlation_outcomes`,
+    over the counties with both.
+
+    Counts are divided by the county population first, as for the embedding. Every descriptor and
+    outcome is standardized once, so each of Pearson's r and Spearman's rho is a handful of matrix
+    products (see `utils.correlation`). The table is saved with the rest of the data, so it is only
+    recomputed when new data arrives.
+
+    """
+    descriptors = [feature for feature in self.get_feature_options() if feature in self.columns_to_include]
+    x = np.asarray(self.counties[descriptors].values, dtype=np.float64)
+    population = np.asarray(self.fips_to_population.lookup(list(self.counties['FIPS'])), dtype=np.float64)
+    normalized = [i for i, feature in enumerate(descriptors) if feature in self.features_to_normalize]
+    with np.errstate(divide='ignore', invalid='ignore'):
+      x[:, normalized] /= np.where(population > 0, population, np.nan)[:, None]
+    y = self.get_outcomes()
+
+    pearson, counts = correlation.correlate(x, y)
+    spearman, _ = correlation.rank_correlate(x, y)
+    correlations = pd.DataFrame({'descriptor': descriptors, 'counties': (~np.isnan(x)).sum(axis=0)})
+    for i, outcome in enumerate(self.correlation_outcomes):
+      correlations[f'{outcome}_pearson'] = pearson[:, i]
+      correlations[f'{outcome}_spearman'] = spearman[:, i]
+
+    # strongest first
+    strength = np.nan_to_num(np.abs(pearson), nan=-1).max(axis=1)
+    self.correlations = correlations.iloc[np.argsort(-strength, kind='stable')].reset_index(drop=True)
+
+  # days of growth rate averaged before and after each intervention, and the days after it that its
+  # effect takes to show in the confirmed cases
+  intervention_windows = [7, 14, 21]
+  intervention_lag = 7
+  # windows with a growth rate on fewer than this fraction of their days are left out
+  min_window_coverage = 0.5
+  intervention_groups = ['state', 'cluster']
+
+  def _set_intervention_growth(self):
+    """Average the infections growth rate of every county over the days before and after each of its
+    interventions, for each of `intervention_windows`.
+
+    The window before an intervention is the `window` days up to it, and the window after starts
+    `intervention_lag` days after it. Windows that run off either end of the timeseries are NaN. Every
+    window is the difference of two columns gathered from running sums along the dates, so all the
+    counties and interventions take a few array operations per window. These are saved with the rest
+    of the data, so they are only recomputed when new data arrives.
+
+    """
+    growth = np.asarray(self.infections_growth_rate.iloc[:, 1:].values, dtype=np.float64)
+    valid = ~np.isnan(growth)
+    num_counties, num_dates = growth.shape
+    sums = np.zeros((num_counties, num_dates + 1))
+    np.cumsum(np.where(valid, growth, 0), axis=1, out=sums[:, 1:])
+    counts = np.zeros((num_counties, num_dates + 1), dtype=np.int32)
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+
+    # the index of each intervention's date in the timeseries, NaN without one
+    fips_codes = np.asarray(self.infections['FIPS'], dtype=str)
+    rows = pd.Index(np.asarray(self.interventions['FIPS'], dtype=str)).get_indexer(fips_codes)
+    ordinals = np.asarray(self.interventions[self.intervention_keys].values, dtype=np.float64)
+    starts = np.where((rows >= 0)[:, None], ordinals[rows], np.nan)
+    starts -= dt.date.fromisoformat(self.timeseries_dates[0]).toordinal()
+
+    shape = (len(self.intervention_windows), num_counties, len(self.intervention_keys))
+    self.intervention_growth_before = np.full(shape, np.nan, dtype=np.float32)
+    self.intervention_growth_after = np.full(shape, np.nan, dtype=np.float32)
+    for i, window in enumerate(self.intervention_windows):
+      for means, lower in [(self.intervention_growth_before, starts - window),
+                           (self.intervention_growth_after, starts + self.intervention_lag)]:
+        inside = (lower >= 0) & (lower + window <= num_dates)    # False for NaN
+        lower = np.where(inside, lower, 0).astype(np.int64)
+        upper = lower + window
+        total = np.take_along_axis(sums, upper, axis=1) - np.take_along_axis(sums, lower, axis=1)
+        count = np.take_along_axis(counts, upper, axis=1) - np.take_along_axis(counts, lower, axis=1)
+        covered = inside & (count >= self.min_window_coverage * window)
+        means[i] = np.where(covered, total / np.maximum(count, 1), np.nan)
+    self.intervention_growth_fips_codes = fips_codes
+
+  def get_intervention_effects(self, intervention='stay at home', window=14, group='state', embedding=None):
+    """Summarize the change in growth rate after an intervention, over the counties of each state or
+    cluster.
+
+    :param intervention: one of `intervention_keys`.
+    :param window: days averaged before and after, one of `intervention_windows`.
+    :param group: 'state' or 'cluster'.
+    :param embedding: with 'cluster', the clustering to group by, from `get_embedding`. Defaults to
+      the current one. Counties that aren't embedded are left out.
+    :returns: one row per group with any counties, with its name, code, number of counties, mean growth
+      rate before and after, mean change and its standard error, and the fraction of counties whose
+      growth rate fell
+    :rtype: pd.DataFrame
+
+    """
+    if intervention not in self.intervention_keys:
+      raise ValueError(f'bad intervention: {intervention}')
+    if window not in self.intervention_windows:
+      raise ValueError(f'window must be one of {self.intervention_windows}, got {window}')
+    i = self.intervention_windows.index(window)
+    k = self.intervention_keys.index(intervention)
+    before = np.asarray(self.intervention_growth_before[i, :, k], dtype=np.float64)
+    after = np.asarray(self.intervention_growth_after[i, :, k], dtype=np.float64)
+
+    # the group of each county, -1 for none
+    groups = np.full(before.shape[0], -1, dtype=np.int64)
+    if group == 'state':
+      codes = self.rollup_fips_codes[1:]
+      names = [self.fips_to_rollup_name[code] for code in codes]
+      for j, code in enumerate(codes):
+        groups[self.state_county_rows[code]] = j
+    elif group == 'cluster':
+      if embedding is None:
+        embedding = self.get_embedding()
+      codes, cluster_indices = np.unique(embedding['cluster_labels'], return_inverse=True)
+      names = ['Unclustered' if code == '-1' else f'Cluster {code}' for code in codes]
+      rows = pd.Index(self.intervention_growth_fips_codes).get_indexer(embedding['fips_codes'])
+      groups[rows[rows >= 0]] = cluster_indices[rows >= 0]
+    else:
+      raise ValueError(f'bad group: {group}')
+
+    valid = (groups >= 0) & ~np.isnan(before) & ~np.isnan(after)
+    groups, before, after = groups[valid], before[valid], after[valid]
+    change = after - before
+    minlength = len(codes)
+    counts = np.bincount(groups, minlength=minlength)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      mean_change = np.bincount(groups, change, minlength=minlength) / counts
+      variance = (np.bincount(groups, change ** 2, minlength=minlength) - counts * mean_change ** 2) / (counts - 1)
+      effects = pd.DataFrame(dict(
+        name=names,
+        code=list(codes),
+        counties=counts,
+        before=np.bincount(groups, before, minlength=minlength) / counts,
+        after=np.bincount(groups, after, minlength=minlength) / counts,
+        change=mean_change,
+        stderr=np.sqrt(np.maximum(variance, 0) / counts),
+        decreased=np.bincount(groups, change < 0, minlength=minlength) / counts))
+    return effects[counts > 0].reset_index(drop=True)
+
+  def rank_growth(self, n=10, timeseries_type='infections', window=7, measure='absolute', min_level=None):
+    """Get the counties growing fastest over the last `window` days.
+
+    :param n: number of counties to return.
+    :param timeseries_type: 'infections' or 'deaths'
+    :param window: days to average the slope over, up to `max_growth_window`.
+    :param measure: 'absolute' for new cases per day, 'per_capita' for new cases per day per
+      `per_what` people, or 'relative' for new cases per day as a fraction of the total.
+    :param min_level: with 'relative', leave out counties averaging fewer cases than this over the
+      window, whose relative growth is mostly noise. Defaults to `threshold`.
+    :returns: (FIPS code, growth) for each of the `n` fastest growing counties, fastest first.
+    :rtype: list
+
+    """
+    if measure not in self.growth_measures:
+      raise ValueError(f'bad measure: {measure}')
+    if not 1 <= window <= self.max_growth_window:
+      raise ValueError(f'window must be between 1 and {self.max_growth_window} days, got {window}')
+    slope_sums = getattr(self, f'{timeseries_type}_growth_slope_sums')
+    fips_codes = getattr(self, f'{timeseries_type}_growth_fips_codes')
+    window = min(window, slope_sums.shape[1])
+
+    growth = slope_sums[:, window - 1] / window
+    if measure == 'per_capita':
+      population = getattr(self, f'{timeseries_type}_growth_population')
+      growth = np.where(population > 0, growth / np.maximum(population, 1) * self.per_what, np.nan)
+    elif measure == 'relative':
+      level = getattr(self, f'{timeseries_type}_growth_level_sums')[:, window - 1] / window
+      min_level = self.threshold if min_level is None else min_level
+      growth = np.where(level >= max(min_level, 1), growth / np.maximum(level, 1), np.nan)
+
+    candidates = np.flatnonzero(~np.isnan(growth))
+    n = min(n, candidates.shape[0])
+    if n == 0:
+      return []
+    top = candidates[np.argpartition(-growth[candidates], n - 1)[:n]]
+    top = top[np.argsort(-growth[top], kind='stable')]
+    return [(str(fips_codes[i]), float(growth[i])) for i in top]
+
+  def _load_geojson(self):
+    fname = join(self.data_dir, self.geojson_file)
+    if exists(fname):
+      with open(fname) as file:
+        return json.load(file)
+    with urlopen(self.geojson_url) as response:
+      return json.load(response)
+
   def _load_timeseries(self, timeseries_name):
     filename = join(self.data_dir, f'{timeseries_name}_timeseries.csv')
     timeseries = pd.read_csv(filename, converters=self.converters)
     timeseries = timeseries.drop(labels='Combined_Key', axis=1)
     return timeseries
 
-  def cluster_statistics(self):
-    self.counties.set_index('FIPS', inplace=True)
-    for cluster in range(self.num_clusters):
-      fips_codes = [fips for i, fips in enumerate(self.clustering_fips_codes) if int(self.cluster_labels[i]) == cluster]
-      cluster_counties = self.counties.loc[fips_codes, self.selected_features]
+  # features in the order the cluster summaries list them
+  summary_features = [
+    "POP_ESTIMATE_2018",
+    "Male_age0to17",
+    "Female_age0to17",
+    "Male_age18to64",
+    "Female_age18to64",
+    "Male_age65plus",
+    "Female_age65plus",
+    "Some college or associate's degree 2014-18",
+    "POVALL_2018",
+    "Unemployed_2018",
+    "Median_Household_Income_2018",
+    "Density per square mile of land area - Population",
+    "Housing units",
+    "Area in square miles - Land area",
+    "transit_scores - population weighted averages aggregated from town/city level to county",
+  ]
+
+  def get_normalized_features(self, selected_features=None):
+    """Get the features of the clustered counties, with counts divided by the county population.
 
-      # normalize each column to zero mean, unit variance
-      for j, feature in enumerate(self.selected_features):
-        if feature in self.features_to_normalize:
-          for i, fips in enumerate(fips_codes):
-            cluster_counties.loc[fips, feature] /= self.fips_to_population[fips]
-
-      summary = cluster_counties.describe().T
-      printing_order = [
-        "POP_ESTIMATE_2018",
-        "Male_age0to17",
-        "Female_age0to17",
-        "Male_age18to64",
-        "Female_age18to64",
-        "Male_age65plus",
-        "Female_age65plus",
-        "Some college or associate's degree 2014-18",
-        "POVALL_2018",
-        "Unemployed_2018",
-        "Median_Household_Income_2018",
-        "Density per square mile of land area - Population",    
-        "Housing units",
-        "Area in square miles - Land area",
-        "transit_scores - population weighted averages aggregated from town/city level to county",
-      ]
-      summary = summary.loc[printing_order]
-      
-      print(f'cluster {cluster}:')
-      print(summary)
-      summary.to_csv(f'cluster_{cluster}_summary.csv')
-      
+    :param selected_features: features to get instead of the clustered ones, for the counties that
+      have all of them.
+    :returns: a copy of the features, indexed by FIPS code, in the order of `self.clustering_fips_codes`
+      (or of `self.counties`, for other features)
+    :rtype: pd.DataFrame
+
+    """
+    if selected_features is None:
+      counties = self.counties_subset
+      fips_codes = self.clustering_fips_codes
+    else:
+      counties = self.counties.loc[:, list(selected_features)]
+      which_counties = self.get_complete_counties(selected_features)
+      counties = counties.iloc[which_counties, :]
+      fips_codes = np.asarray(self.counties['FIPS'], dtype=object)[which_counties]
+
+    x = pd.DataFrame(np.array(counties, dtype=np.float64),
+                     index=pd.Index(fips_codes, name='FIPS'),
+                     columns=counties.columns)
+    population = self.fips_to_population.lookup(x.index)
+    normalized = [feature for feature in x.columns if feature in self.features_to_normalize]
+    x[normalized] = x[normalized].div(population, axis=0)
+    return x
+
+  def get_feature_options(self):
+    """List the numeric county descriptors that an embedding can be fit on."""
+    return [column for column in self.counties.columns
+            if column != 'FIPS' and pd.api.types.is_numeric_dtype(self.counties[column])]
+
+  def get_embedding(self, fips_codes=None, embedding=None, cluster_labels=None):
+    """Package an embedding and clustering of the counties for the figures in `utils.elements`.
+
+    :param fips_codes: the embedded counties. Defaults to the counties of `self.embedding`, and
+      likewise for the other arguments.
+    :param embedding: their 2-D coordinates.
+    :param cluster_labels: their clusters.
+    :returns: dict with the FIPS codes, county names, coordinates, cluster labels (as strings), the
+      index of each county's cluster in `cluster_palette`, the color of each cluster, and a table of
+      the counties' clusters.
+    :rtype: dict
+
+    """
+    if fips_codes is None:
+      fips_codes, embedding, cluster_labels = self.clustering_fips_codes, self.embedding, self.cluster_labels
+    fips_codes = list(fips_codes)
+    cluster_labels = np.asarray(cluster_labels).astype(int).astype(str)
+    unique_labels, cluster_indices = np.unique(cluster_labels, return_inverse=True)
+    county_names = [self.fips_to_county_name[fips] for fips in fips_codes]
+    return dict(
+      fips_codes=fips_codes,
+      fips_index={fips: i for i, fips in enumerate(fips_codes)},
+      county_names=county_names,
+      embedding=embedding,
+      cluster_labels=cluster_labels,
+      cluster_indices=cluster_indices,
+      cluster_palette=[self.cluster_colors_map.get(label, self.color_palette[int(label) % len(self.color_palette)])
+                       for label in unique_labels],
+      clustering_df=pd.DataFrame(dict(FIPS=fips_codes, county_name=county_names, cluster=cluster_labels)))
+
+  def cluster_statistics(self, output_dir='.', quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), verbose=True):
+    """Summarize the features of every cluster in one pass.
+
+    For each cluster and feature: the count, mean, standard deviation, min, `quantiles` and max, as
+    `describe` gives them, and the mean and standard deviation weighted by county population. Writes
+    them all to `cluster_summary.csv`, and each cluster's to `cluster_{k}_summary.csv`.
+
+    :param output_dir: directory for the csv files.
+    :param quantiles: quantiles to report, between 0 and 1.
+    :param verbose: print each cluster's summary.
+    :returns: the summaries, indexed by cluster and feature
+    :rtype: pd.DataFrame
+
+    """
+    x = self.get_normalized_features()[self.summary_features]
+    labels = pd.Series(np.asarray(self.cluster_labels).astype(int), index=x.index, name='cluster')
+    weights = pd.Series(self.fips_to_population.lookup(x.index), index=x.index, dtype=np.float64)
+
+    grouped = x.groupby(labels)
+    stats = {name: getattr(grouped, name)() for name in ['count', 'mean', 'std', 'min']}
+    percentiles = grouped.quantile(list(quantiles))
+    for q in quantiles:
+      stats[f'{100 * q:g}%'] = percentiles.xs(q, level=-1)
+    stats['max'] = grouped.max()
+
+    total_weight = weights.groupby(labels).sum()
+    weighted_mean = x.mul(weights, axis=0).groupby(labels).sum().div(total_weight, axis=0)
+    weighted_var = (x ** 2).mul(weights, axis=0).groupby(labels).sum().div(total_weight, axis=0) - weighted_mean ** 2
+    stats['weighted_mean'] = weighted_mean
+    stats['weighted_std'] = np.sqrt(weighted_var.clip(lower=0))
+
+    # (cluster, feature) rows, one column per statistic
+    summary = pd.concat({name: stat.stack() for name, stat in stats.items()}, axis=1)
+    summary.index.names = ['cluster', 'feature']
+    summary = summary.reindex(pd.MultiIndex.from_product(
+      [sorted(labels.unique()), self.summary_features], names=summary.index.names))
+
+    if not exists(output_dir):
+      os.makedirs(output_dir)
+    summary.to_csv(join(output_dir, 'cluster_summary.csv'))
+    for cluster, cluster_summary in summary.groupby(level='cluster'):
+      cluster_summary = cluster_summary.droplevel('cluster')
+      if verbose:
+        print(f'cluster {cluster}:')
+        print(cluster_summary)
+      cluster_summary.to_csv(join(output_dir, f'cluster_{cluster}_summary.csv'))
+    return summary
 
 
 if __name__ == '__main__':
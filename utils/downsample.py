@@ -0,0 +1,120 @@
+"""Shape-preserving downsampling of long timeseries traces, so figure payloads stay bounded.
+
+Each function picks the indices of the points to keep, always including the first and last, so the
+same selection can be applied to the x values, the y values and anything else aligned with them.
+`minmax` keeps the extremes of each bucket, which keeps the peaks of a bar trace. `lttb`
+(largest-triangle-three-buckets) keeps the point of each bucket that makes the largest triangle with
+its neighbors, which follows the shape of a smooth line with far fewer points.
+
+"""
+
+import datetime as dt
+import numpy as np
+
+
+def minmax(y, n_out):
+  """Keep the minimum and maximum of each of about `n_out / 2` equal buckets.
+
+  :param y: values, NaNs ignored.
+  :param n_out: the most points to keep.
+  :returns: sorted indices of at most `n_out` points
+  :rtype: np.ndarray
+
+  """
+  y = np.asarray(y, dtype=float)
+  n = y.shape[0]
+  if n <= n_out or n_out < 4:
+    return np.arange(n)
+
+  num_buckets = (n_out - 2) // 2
+  edges = np.linspace(1, n - 1, num_buckets + 1).astype(int)
+  filled = np.where(np.isnan(y), 0, y)
+  indices = [0, n - 1]
+  for start, end in zip(edges[:-1], edges[1:]):
+    if end > start:
+      indices += [start + np.argmin(filled[start:end]), start + np.argmax(filled[start:end])]
+  return np.unique(indices)
+
+
+def lttb(x, y, n_out):
+  """Largest-triangle-three-buckets downsampling.
+
+  :param x: numeric positions, ascending.
+  :param y: values, NaNs treated as 0.
+  :param n_out: the number of points to keep.
+  :returns: sorted indices of at most `n_out` points
+  :rtype: np.ndarray
+
+  """
+  x = np.asarray(x, dtype=float)
+  y = np.nan_to_num(np.asarray(y, dtype=float))
+  n = y.shape[0]
+  if n <= n_out or n_out < 3:
+    return np.arange(n)
+
+  # the first and last points are kept, and the rest split into n_out - 2 buckets
+  edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+  indices = np.empty(n_out, dtype=int)
+  indices[0] = 0
+  indices[-1] = n - 1
+  a = 0
+  for i in range(n_out - 2):
+    start, end = edges[i], edges[i + 1]
+    if i + 2 < edges.shape[0]:
+      next_x = x[end:edges[i + 2]].mean()
+      next_y = y[end:edges[i + 2]].mean()
+    else:
+      next_x, next_y = x[n - 1], y[n - 1]
+
+    # twice the area of the triangle from the last point kept, through each candidate, to the average
+    # of the next bucket
+    area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+    a = start + int(np.argmax(area))
+    indices[i + 1] = a
+  return indices
+
+
+def parse_range(x_range, dates):
+  """Get the bounds of an x range, as ISO dates or as numbers.
+
+  :param x_range: [low, high], or None. Dates may have a time after the day.
+  :param dates: whether the x values are dates, rather than numbers.
+  :returns: (low, high), or None if there is no range or its bounds are the wrong type, like a range
+    left over from before the x axis of a plot changed from dates to numbers
+  :rtype: tuple
+
+  """
+  if x_range is None:
+    return None
+  low, high = x_range
+  if dates:
+    try:
+      return tuple(dt.date.fromisoformat(bound[:10]).isoformat() for bound in (low, high))
+    except (TypeError, ValueError):
+      return None
+  if isinstance(low, str) or isinstance(high, str):
+    return None
+  try:
+    return float(low), float(high)
+  except (TypeError, ValueError):
+    return None
+
+
+def get_visible(x, x_range, margin=1):
+  """Get the slice of sorted `x` inside `x_range`, with `margin` points either side so the lines run to
+  the edges of the plot.
+
+  :param x: ascending positions, numbers or ISO date strings.
+  :param x_range: [low, high], or None for all of them. Dates may have a time after the day. A range of
+    the wrong type, see `parse_range`, is all of them too.
+  :rtype: slice
+
+  """
+  x = np.asarray(x)
+  bounds = parse_range(x_range, x.dtype.kind in 'US')
+  if bounds is None:
+    return slice(None)
+  low, high = bounds
+  start = max(int(np.searchsorted(x, low, side='left')) - margin, 0)
+  stop = min(int(np.searchsorted(x, high, side='right')) + margin, x.shape[0])
+  return slice(start, stop)
@@ -1,15 +1,40 @@
 import string
 import json
+import datetime as dt
 import numpy as np
 import pandas as pd
-from urllib.request import urlopen
 import plotly.express as px
 import seaborn as sns
 from plotly import graph_objects as go
 
+from utils import downsample
+from utils import serialize
+
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
+import dash_table
+from dash_table.Format import Format, Scheme
+
+# the most points sent per timeseries trace, about two per horizontal pixel of the plots
+max_timeseries_points = 1000
+
+# names of the `DashboardData.rate_measures`, and of the timeseries they come from
+rate_labels = {'growth_rate': 'Growth Rate', 'doubling_time': 'Doubling Time', 'reproduction': 'Reproduction Number'}
+rate_units = {'growth_rate': 'Growth per day', 'doubling_time': 'Days to double', 'reproduction': 'Reproduction number'}
+timeseries_labels = {'infections': 'Confirmed Cases', 'deaths': 'Deaths'}
+
+# what the choropleth can be colored by, and its color scale for each
+counties_colors = ['infections_per_capita', 'infections_growth_rate', 'infections_doubling_time',
+                   'infections_reproduction']
+counties_color_scales = {'infections_doubling_time': 'Reds_r'}
+
+# names of the `DashboardData.correlation_outcomes`
+correlation_outcome_labels = {
+  'infections_per_capita': 'Cases per capita',
+  'deaths_per_capita': 'Deaths per capita',
+  'infections_growth_per_capita': 'New cases per day per capita',
+  'infections_growth_rate': 'Growth rate'}
 
 
 def compute_moving_window(x, window_size, axis=0, mode='left', func='mean'):
@@ -69,49 +94,221 @@ def get_dashboard_header():
   return html.Div('County-level Response to COVID-19', id='dashboard-header')
 
 
-with urlopen('https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json') as response:
-  counties_geojson = json.load(response)
+# stand-in for the county boundaries while plotly express builds a choropleth, see `set_geojson`
+empty_geojson = dict(type='FeatureCollection', features=[])
 
-  
-def get_counties_display(data):
-  """FIXME! briefly describe function
+
+def set_geojson(fig, geojson):
+  """Put the boundaries into a choropleth built on `empty_geojson`.
+
+  The boundaries are encoded once, by `serialize.preserialize`, rather than copied into every figure by
+  plotly and encoded again with each response.
+
+  :param fig: the figure.
+  :param geojson: the boundaries, which mustn't change.
+  :returns: the figure, as a dict
+  :rtype: dict
+
+  """
+  fig = fig.to_dict()
+  for trace in fig['data']:
+    trace['geojson'] = serialize.preserialize(geojson)
+  return fig
+
+
+def get_counties_title(data, region, date, color='infections_per_capita'):
+  what = 'Confirmed Cases'
+  if color != 'infections_per_capita':
+    what += ' ' + rate_labels[data.split_timeseries_type(color)[1]]
+  if region is None:
+    return f"United States COVID-19 {what}, {date.strftime('%x')}"
+  if region == data.national_fips:
+    return f"United States COVID-19 {what} by State, {date.strftime('%x')}"
+  return f"{data.fips_to_rollup_name[region]} COVID-19 {what}, {date.strftime('%x')}"
+
+
+def get_counties_color_label(data, color):
+  if color == 'infections_per_capita':
+    return f'Infections per {data.per_what:,d}'
+  return rate_units[data.split_timeseries_type(color)[1]]
+
+
+def get_counties_range_color(values):
+  # the rates can be negative, or missing where the counts are low
+  values = np.asarray(values, dtype=np.float64)
+  values = values[~np.isnan(values)]
+  if values.shape[0] == 0:
+    return (0, 1)
+  return (min(0, np.quantile(values, 0.05)), np.quantile(values, 0.9))
+
+
+def get_counties_figure(data, region=None, color='infections_per_capita'):
+  """Get the choropleth of infections per capita, or of one of their rates.
 
   :param data: 
+  :param region: None for every county, `data.national_fips` for the states, or a state's rollup code
+    for just its counties.
+  :param color: one of `counties_colors`.
   :returns: 
   :rtype: 
 
   """
-  df = data.total_infections
-  color_max = np.quantile(df['infections_per_capita'], 0.9)
-  
+  title = get_counties_title(data, region, data.daily_infections_date, color)
+  labels = {color: get_counties_color_label(data, color), 'infections': 'Infections'}
+  if region == data.national_fips:
+    df = data.rollup_totals.iloc[1:]
+    locations = dict(locations='state', locationmode='USA-states', hover_name='state')
+  else:
+    if region is None:
+      df = data.total_infections
+      geojson = data.counties_geojson
+    else:
+      df = data.total_infections.iloc[data.state_county_rows[region]]
+      geojson = data.state_geojson[region]
+    locations = dict(geojson=empty_geojson, locations='FIPS', hover_name='county_name')
+  if color == 'infections_per_capita':
+    range_color = (0, np.quantile(df['infections_per_capita'], 0.9))
+  else:
+    df = df.assign(**{color: data.get_choropleth_values(region, -1, color)[0]})
+    range_color = get_counties_range_color(df[color])
   fig = px.choropleth(
     df,
-    geojson=counties_geojson,
-    locations='FIPS',
-    color='infections_per_capita',
-    color_continuous_scale='Reds',
-    hover_name='county_name',
+    color=color,
+    color_continuous_scale=counties_color_scales.get(color, 'Reds'),
     hover_data=['infections'],
     custom_data=['FIPS'],
     scope='usa',
     height=800,
-    range_color=(0, color_max),
-    labels={'infections_per_capita': f'Infections per {data.per_what:,d}',
-            'infections': 'Infections'},
-    title='United States COVID-19 Confirmed Cases, {}'.format(data.daily_infections_date.strftime('%x')))
+    range_color=range_color,
+    labels=labels,
+    title=title,
+    **locations)
+  if region is not None and region != data.national_fips:
+    fig.update_geos(fitbounds='locations')
   fig.update_layout(coloraxis_showscale=True, coloraxis_colorbar=dict(
-    title=f'Infections per {data.per_what:,d}',
+    title=labels[color],
     thicknessmode="pixels",
     thickness=20,
     lenmode='pixels',
     len=200,
     ticks='outside',
-    dtick=5,
+    dtick=5 if color == 'infections_per_capita' else None,
     yanchor='middle'))
-  
+  if region == data.national_fips:
+    return fig
+  return set_geojson(fig, geojson)
+
+
+def get_counties_display(data):
+  fig = get_counties_figure(data)
   return dcc.Graph(id='counties-display', figure=fig, config={'scrollZoom': False})
 
 
+def get_counties_date_slider(data):
+  # from the first date any county passed the threshold, marking the start of each month
+  start = int(data.timeseries_start_index)
+  end = len(data.timeseries_dates) - 1
+  marks = {i: dt.date.fromisoformat(data.timeseries_dates[i]).strftime('%b %Y')
+           for i in range(start, end + 1) if data.timeseries_dates[i].endswith('-01')}
+  return dcc.Slider(
+    id='counties-date-slider',
+    min=start,
+    max=end,
+    value=end,
+    marks=marks,
+    updatemode='drag')
+
+
+def get_counties_colors(data, region=None, date_index=-1, color='infections_per_capita'):
+  """Get the values to recolor the choropleth of `region` with for another date, without resending it.
+
+  The color range stays that of the latest date, so the colors compare across dates.
+
+  :returns: dict with the region, what it is colored by, the color values and infections of each area
+    in the order they are plotted, and the title
+  :rtype: dict
+
+  """
+  values, infections = data.get_choropleth_values(region, date_index, color)
+  return dict(
+    region=region,
+    color=color,
+    z=np.round(values.astype(np.float64), 3 if color == 'infections_per_capita' else 4).tolist(),
+    infections=np.asarray(infections).tolist(),
+    title=get_counties_title(data, region, dt.date.fromisoformat(data.timeseries_dates[date_index]), color))
+
+
+def get_counties_color_radioitems(data):
+  return dcc.RadioItems(
+    id='counties-color-radioitems',
+    options=[{'label': get_counties_color_label(data, color), 'value': color} for color in counties_colors],
+    value='infections_per_capita',
+    labelStyle={'display': 'inline-block'})
+
+
+def get_region_dropdown(data):
+  options = [{'label': 'United States, by state', 'value': data.national_fips}]
+  options += [{'label': data.fips_to_rollup_name[fips], 'value': fips} for fips in data.rollup_fips_codes[1:]]
+  return dcc.Dropdown(
+    id='region-dropdown',
+    options=options,
+    value=None,
+    multi=False,
+    placeholder='All counties, or drill down from the states...',
+    style={})
+
+
+def get_rollup_timeseries_figure(data, region=None, timeseries_type='infections', per_capita=False,
+                                 max_points=max_timeseries_points):
+  """Get the daily timeseries of the nation or a state, from the precomputed rollups.
+
+  :param data: 
+  :param region: a state's rollup code, or None or `data.national_fips` for the nation.
+  :param timeseries_type: 'infections' or 'deaths', or one of their rates.
+  :param per_capita: divide by the summed population of the counties. Rates aren't.
+  :returns: 
+  :rtype: 
+
+  """
+  region = data.national_fips if region is None else region
+  values = data.get_rollup_timeseries(region, timeseries_type)
+  name, measure = data.split_timeseries_type(timeseries_type)
+  start = data.timeseries_start_index
+  if measure is not None:
+    # already smoothed, so just the line
+    _, _, (x, y) = downsample_timeseries(data.timeseries_dates[start:], values[start:], values[start:],
+                                         max_points=max_points)
+    fig_data = [dict(x=x, y=y, name=rate_labels[measure], hoverinfo='text+x+y', mode='lines',
+                     line=dict(color='red'))]
+    title = f'{rate_labels[measure]} of {timeseries_labels[name]} in {data.fips_to_rollup_name[region]}'
+    layout = dict(title=title, xaxis={'title': 'Date'}, yaxis={'title': rate_units[measure]}, hovermode='closest')
+    return dict(data=fig_data, layout=layout)
+
+  if per_capita:
+    values = values / max(data.fips_to_rollup_population[region], 1) * data.per_what
+  daily = np.diff(values, prepend=0)
+
+  x = data.timeseries_dates[start:]
+  y = daily[start:]
+  average = compute_moving_average(y, window_size=7, mode='center')
+  x, y, average = downsample_timeseries(x, y, average, max_points=max_points)
+
+  title = f'Daily {string.capwords(timeseries_type)} in {data.fips_to_rollup_name[region]}'
+  if per_capita:
+    title += f', per {data.per_what:,d}'
+  fig_data = [
+    go.Bar(x=x, y=y, name=f'Daily {timeseries_type}', hoverinfo='text+x+y'),
+    dict(x=average[0], y=average[1], name='7-day avg', hoverinfo='text+x+y', mode='lines',
+         line=dict(color='red'))]
+  layout = dict(title=title, xaxis={'title': 'Date'}, hovermode='closest')
+  return dict(data=fig_data, layout=layout)
+
+
+def get_rollup_timeseries_display(data):
+  fig = get_rollup_timeseries_figure(data)
+  return dcc.Graph(id='rollup-timeseries-display', figure=fig)
+
+
 def get_counties_dropdown(data):
   return dcc.Dropdown(
     id='counties-dropdown',
@@ -122,10 +319,13 @@ def get_counties_dropdown(data):
     style={})
 
 
-def get_timeseries_type_dropdown():
+def get_timeseries_type_dropdown(data):
+  options = [{'label': label, 'value': name} for name, label in timeseries_labels.items()]
+  options += [{'label': f'{rate_labels[measure]} of {label}', 'value': f'{name}_{measure}'}
+              for name, label in timeseries_labels.items() for measure in data.rate_measures]
   return dcc.Dropdown(
     id='timeseries-type-dropdown',
-    options=[{'label': 'Confirmed Cases', 'value': 'infections'}, {'label': 'Deaths', 'value': 'deaths'}],
+    options=options,
     value='infections',
     multi=False,
     placeholder='Choose timeseries...')
@@ -174,26 +374,34 @@ def get_timeseries_figure(
     scale='Linear',
     per_capita=False,
     daily=False,
-    gradient=False):
+    gradient=False,
+    x_range=None,
+    max_points=max_timeseries_points):
   """FIXME! briefly describe function
 
   :param data: 
-  :param timeseries_type: 
+  :param timeseries_type: 'infections' or 'deaths', or one of their rates, e.g. 'infections_growth_rate',
+    which is plotted as a line. The gradient of a rate is that of the counts it comes from.
   :param mode: Either 'Analysis' or 'Raw'
+  :param x_range: [low, high] to show, from `get_x_range`, or None for the whole series. Only the
+    points in range are sent, so a zoomed figure keeps full resolution.
+  :param max_points: downsample each trace to at most this many points, or None to send every point.
   :returns: 
   :rtype: 
 
   """
   
   # get top 10 counties by default
-  assert timeseries_type in ['infections', 'deaths']
+  name, measure = data.split_timeseries_type(timeseries_type)
+  if gradient:
+    timeseries_type, measure = name, None
   timeseries = getattr(data, timeseries_type + ('_gradient' if gradient else ''))
   timeseries = timeseries.loc[timeseries['FIPS'].isin(set(data.selected_counties))]
 
   if interventions is None:
     interventions = [intervention]
 
-  if daily:
+  if daily and measure is None:
     timeseries.iloc[:, 1:] = (timeseries.iloc[:, 1:] -
                               np.concatenate((np.zeros((timeseries.shape[0], 1)),
                                               np.array(timeseries.iloc[:, 1:])[:, :-1]), axis=1))
@@ -201,10 +409,10 @@ def get_timeseries_figure(
   color_palette = sns.color_palette('Set1', n_colors=len(data.selected_counties))
   color_palette = [f'#{int(255*t[0]):02x}{int(255*t[1]):02x}{int(255*t[2]):02x}' for t in color_palette]
 
-  if gradient:
+  if gradient or measure == 'growth_rate':
     scale = 'Linear'
 
-  if per_capita:
+  if per_capita and measure is None:
     value_func = lambda x, fips: x / data.fips_to_population[fips] * data.per_what
   else:
     value_func = lambda x, fips: x
@@ -215,47 +423,63 @@ def get_timeseries_figure(
     xfunc = lambda row, idx: data.timeseries_dates[start:]
     yfunc = lambda row, idx: value_func(row[start + 1:], row[0])
   elif mode == 'Threshold':
-    xtitle = f'Days since {threshold} Confirmed {string.capwords(timeseries_type)}'
+    xtitle = f'Days since {threshold} Confirmed {string.capwords(name)}'
     xfunc = lambda row, idx: list(range(len(row) - data.infections_start_indices[idx] - 1))
     yfunc = lambda row, idx: value_func(row[1:][data.infections_start_indices[idx]:], row[0])
   else:
     raise ValueError(f'bad mode: {mode}')
 
+  # a range zoomed to before the mode changed, on the other kind of x axis, shows the whole series
+  if downsample.parse_range(x_range, dates=mode == 'Date') is None:
+    x_range = None
+
   # TODO: these are hot fixes for plotting a single county, fix them for dashboard
   assert len(data.selected_counties) == 1
   
-  fig_data = [
-    go.Bar(
-      x=xfunc(row, idx),
-      y=yfunc(row, idx),
+  bars = []
+  lines = []
+  for i, (idx, row) in enumerate(timeseries.iterrows()):
+    x = xfunc(row, idx)
+    y = yfunc(row, idx)
+    if measure is not None:
+      # rates are already smoothed, so just the line
+      _, _, (x, y) = downsample_timeseries(x, y, y, x_range=x_range, max_points=max_points)
+      lines.append(dict(x=x, y=y, name=rate_labels[measure], hoverinfo='text+x+y', mode='lines',
+                        line=dict(color='red')))
+      continue
+    average = compute_moving_average(y, window_size=7, mode='center')
+    x, y, average = downsample_timeseries(x, y, average, x_range=x_range, max_points=max_points)
+    bars.append(go.Bar(
+      x=x,
+      y=y,
       name=f'Daily {timeseries_type}',
       # name=data.fips_to_county_name.get(row[0], 'NA'),
       # text=data.fips_to_county_name.get(row[0], 'NA'),
       hoverinfo='text+x+y',
       # mode='lines',
       # line=dict(color=color_palette[i])
-    )
-    for i, (idx, row) in enumerate(timeseries.iterrows())]
-
-  fig_data += [
-    dict(
-      x=xfunc(row, idx),
-      y=compute_moving_average(yfunc(row, idx), window_size=7, mode='center'),
+    ))
+    lines.append(dict(
+      x=average[0],
+      y=average[1],
       name='7-day avg',
       # name=data.fips_to_county_name.get(row[0], 'NA'),
       # text=data.fips_to_county_name.get(row[0], 'NA'),
       hoverinfo='text+x+y',
       mode='lines',
       line=dict(color='red')
-    )
-    for i, (idx, row) in enumerate(timeseries.iterrows())]
+    ))
+  fig_data = bars + lines
   
-  title = f'{string.capwords(timeseries_type)} in {data.fips_to_county_name.get(timeseries.iloc[0, 0])}'
-  if daily:
+  county_name = data.fips_to_county_name.get(timeseries.iloc[0, 0])
+  title = f'{string.capwords(name)} in {county_name}'
+  if measure is not None:
+    title = f'{rate_labels[measure]} of {timeseries_labels[name]} in {county_name}'
+  if daily and measure is None:
     title = 'Daily ' + title
   if gradient:
     title += ' per Day (smoothed)'
-  if per_capita:
+  if per_capita and measure is None:
     title += f', per {data.per_what:,d}'
   
   layout = dict(
@@ -265,9 +489,11 @@ def get_timeseries_figure(
     xaxis={'title': xtitle},
     hovermode='closest',
     annotations=[])
+  if x_range is not None:
+    layout['xaxis']['range'] = list(x_range)
 
   # add annotations
-  annotations = getattr(data, ('threshold_' if mode == 'Threshold' else '') + f'{timeseries_type}_annotations')
+  annotations = getattr(data, ('threshold_' if mode == 'Threshold' else '') + f'{name}_annotations')
   for i, (idx, row) in enumerate(timeseries.iterrows()):
     for intervention in interventions:
       fips = row['FIPS']
@@ -280,6 +506,9 @@ def get_timeseries_figure(
       annotation['text'] = '- ' + annotation['text'] +  f': {intervention}  '
       # annotation['textfont'] = dict(size=8, color=color_palette[i])
       annotation['y'] = value_func(row[annotation['xidx'] + 1], fips)
+      if measure is not None and np.isnan(annotation['y']):
+        # no rate on that date
+        continue
 
       # if 'rollback' in annotation['text']:
       #   annotation['y'] += 95 * len(annotation['text'])
@@ -288,7 +517,7 @@ def get_timeseries_figure(
       # if 'dine-in' in annotation['text']:
       #   annotation['y'] += 10 * len(annotation['text'])
       # else:
-      annotation['y'] += 5 * len(annotation['text'])
+      annotation['y'] += get_annotation_offset(annotation, measure)
         # if 'rollback' in annotation['text']:
       #   annotation['y'] += 10 * len(annotation['text'])
       # else:
@@ -302,16 +531,105 @@ def get_timeseries_figure(
   return dict(data=fig_data, layout=layout)
 
 
+def get_annotation_offset(annotation, measure=None):
+  """Get how far above the value it marks an intervention annotation sits, so its text clears the bars.
+  The rates have no bars, so their annotations sit on the line."""
+  if measure is not None:
+    return 0
+  return 5 * len(annotation['text'])
+
+
+def get_timeseries_base(data, timeseries_type='infections', mode='Date', intervention='stay at home',
+                        gradient=False, x_range=None):
+  """Get a timeseries figure in absolute numbers on a linear scale, with what the browser needs to show it
+  per capita or on a log scale itself, in `assets/clientside.js`.
+
+  :returns: dict with the figure, its title, the county's population, `per_what`, whether the figure
+    may be shown per capita, the offset of each annotation above its value, and whether the figure may
+    use a log scale
+  :rtype: dict
+
+  """
+  fig = get_timeseries_figure(data, timeseries_type, mode=mode, intervention=intervention, gradient=gradient,
+                              x_range=x_range)
+  measure = None if gradient else data.split_timeseries_type(timeseries_type)[1]
+  return dict(
+    figure=fig,
+    title=fig['layout']['title'],
+    population=int(data.fips_to_population[data.selected_county]),
+    per_what=data.per_what,
+    per_capita=measure is None,
+    offsets=[get_annotation_offset(annotation, measure) for annotation in fig['layout']['annotations']],
+    log_scale=not gradient and measure != 'growth_rate')
+
+
+def downsample_timeseries(x, y, average, x_range=None, max_points=max_timeseries_points):
+  """Crop a timeseries to `x_range` and downsample it for rendering.
+
+  The daily values keep the extremes of each bucket, so no peak is lost among the bars, while the
+  smoothed average keeps the points that best follow its shape. Returns the series unchanged when it
+  is already in range and short enough.
+
+  :param x: the positions, dates or days since the threshold.
+  :param y: the daily values.
+  :param average: the moving average of `y`, over the whole series so the edges of a crop are smooth.
+  :returns: the cropped and downsampled `x` and `y`, and (x, y) for the average
+  :rtype: tuple
+
+  """
+  if x_range is None and (max_points is None or len(x) <= max_points):
+    return x, y, (x, average)
+
+  visible = downsample.get_visible(x, x_range)
+  x = np.asarray(x)[visible]
+  y = np.asarray(y)[visible]
+  average = np.asarray(average)[visible]
+  if max_points is None or x.shape[0] <= max_points:
+    return x.tolist(), y.tolist(), (x.tolist(), average.tolist())
+
+  positions = np.arange(x.shape[0])
+  bar_indices = downsample.minmax(y, max_points)
+  line_indices = downsample.lttb(positions, average, max_points)
+  return (x[bar_indices].tolist(), y[bar_indices].tolist(),
+          (x[line_indices].tolist(), average[line_indices].tolist()))
+
+
+def get_x_range(relayout_data):
+  """Get the x range a timeseries figure was zoomed to, from its relayoutData.
+
+  :returns: [low, high], None if the figure was reset to show everything, or False if the relayout
+    didn't change the x axis.
+
+  """
+  if not relayout_data:
+    return False
+  if relayout_data.get('xaxis.autorange'):
+    return None
+  if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+    return [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+  if 'xaxis.range' in relayout_data:
+    return list(relayout_data['xaxis.range'])
+  return False
+
+
 def get_timeseries_display(data):
   fig = get_timeseries_figure(data, gradient=False)
   return dcc.Graph(id=f'timeseries-display', figure=fig)
 
 
+def get_timeseries_store(data):
+  return dcc.Store(id='timeseries-store', data=get_timeseries_base(data, gradient=False))
+
+
 def get_timeseries_gradient_display(data):
   fig = get_timeseries_figure(data, gradient=True)
   return dcc.Graph(id=f'timeseries-gradient-display', figure=fig)  
 
 
+def get_timeseries_gradient_store(data):
+  return dcc.Store(id='timeseries-gradient-store', data=get_timeseries_base(data, gradient=True))
+
+
 def get_infections_display(data):
   fig = get_timeseries_figure(data, 'infections')
   return dcc.Graph(id=f'infections-display',
@@ -326,36 +644,65 @@ def get_deaths_display(data):
                    hoverData={'points': [{'customdata': '17031'}]})
 
 
-def get_counties_embedding_figure(data):
+def get_counties_embedding_figure(data, embedding=None):
+  """WebGL scatter plot of the county embedding, with the selected county highlighted.
+
+  The coordinates go as float32 typed arrays, and the colors as the index of each county's cluster
+  into a colorscale of the cluster colors, both packed with `serialize.typed_array`, so the payload
+  stays small with tens of thousands of points. The `embedding.render` clientside callback unpacks
+  them.
+
+  :param data: 
+  :param embedding: an embedding from `data.get_embedding`, or `EmbeddingJobs.get`. Defaults to
+    the data's own.
+  :returns: 
+  :rtype: 
+
+  """
+  if embedding is None:
+    embedding = data.get_embedding()
+  coordinates = embedding['embedding']
+  palette = embedding['cluster_palette']
+  # a stop at each cluster's index, so each index gets exactly its cluster's color
+  colorscale = [[i / max(len(palette) - 1, 1), color] for i, color in enumerate(palette)]
+  if len(palette) == 1:
+    colorscale.append([1, palette[0]])
   fig_data = [dict(
-    x=data.embedding[:, 0],
-    y=data.embedding[:, 1],
-    text=data.counties_subset_names['county_name'],
-    customdata=data.counties_subset_names['FIPS'],
+    type='scattergl',
+    x=serialize.typed_array(coordinates[:, 0], 'f4'),
+    y=serialize.typed_array(coordinates[:, 1], 'f4'),
+    text=embedding['county_names'],
+    customdata=embedding['fips_codes'],
     mode='markers',
     opacity=0.5,
     marker=dict(
       size=5,
       line={'width': 0.5, 'color': 'white'},
-      color=data.cluster_colors,
+      color=serialize.typed_array(embedding['cluster_indices'], 'u1' if len(palette) <= 256 else 'u2'),
+      colorscale=colorscale,
+      cmin=0,
+      cmax=max(len(palette) - 1, 1),
       showscale=False),
     hoverinfo='text'
   )]
 
-  idx = list(data.counties_subset_names['FIPS']).index(data.selected_county)
-  fig_data += [dict(
-    x=data.embedding[idx: idx + 1, 0],
-    y=data.embedding[idx: idx + 1, 1],
-    text=data.fips_to_county_name[data.selected_county],
-    customdata=data.counties_subset_names['FIPS'],
-    mode='markers',
-    opacity=0.5,
-    marker=dict(
-      size=20,
-      line={'width': 0.5, 'color': 'white'},
-      color=data.cluster_colors[idx],
-      showscale=False),
-    hoverinfo='text')]
+  # counties missing some of the features aren't embedded
+  idx = embedding['fips_index'].get(data.selected_county)
+  if idx is not None:
+    fig_data += [dict(
+      type='scattergl',
+      x=coordinates[idx: idx + 1, 0],
+      y=coordinates[idx: idx + 1, 1],
+      text=data.fips_to_county_name[data.selected_county],
+      customdata=embedding['fips_codes'][idx: idx + 1],
+      mode='markers',
+      opacity=0.5,
+      marker=dict(
+        size=20,
+        line={'width': 0.5, 'color': 'white'},
+        color=palette[embedding['cluster_indices'][idx]],
+        showscale=False),
+      hoverinfo='text')]
 
   layout = dict(
     title='United States Counties Embedding',
@@ -370,15 +717,30 @@ def get_counties_embedding_figure(data):
 
 
 def get_counties_embedding_display(data):
+  # drawn by the `embedding.render` clientside callback, from the embedding store
   return dcc.Graph(id='counties-embedding-display',
-                   hoverData={'points': [{'text': 'Cook County, IL'}]},
-                   figure=get_counties_embedding_figure(data))
+                   hoverData={'points': [{'text': 'Cook County, IL'}]})
 
 
-def get_counties_clustering_figure(data):
+def get_counties_embedding_store(data):
+  return dcc.Store(id='counties-embedding-store', data=get_counties_embedding_figure(data))
+
+
+def get_counties_clustering_figure(data, embedding=None):
+  if embedding is None:
+    embedding = data.get_embedding()
+  clustering_df = embedding['clustering_df']
+  idx = embedding['fips_index'].get(data.selected_county)
+  if idx is None:
+    # counties missing some of the features aren't embedded, so have no cluster neighbors to show
+    return dict(data=[], layout=dict(
+      title=f'Cluster Neighbors for: {data.fips_to_county_name[data.selected_county]} (not embedded)',
+      geo=dict(scope='usa'),
+      height=800))
+  selected_cluster = embedding['cluster_labels'][idx]
   fig = px.choropleth(
-    data.clustering_df[data.clustering_df['cluster'] == data.selected_cluster],
-    geojson=counties_geojson,
+    clustering_df[clustering_df['cluster'] == selected_cluster],
+    geojson=empty_geojson,
     locations='FIPS',
     color='cluster',
     color_discrete_map=data.cluster_colors_map,
@@ -387,9 +749,240 @@ def get_counties_clustering_figure(data):
     height=800,
     title=f'Cluster Neighbors for: {data.fips_to_county_name[data.selected_county]}')
   fig.update_layout(coloraxis_showscale=False)
-  return fig
+  return set_geojson(fig, data.counties_geojson)
   
 
 def get_counties_clustering_display(data):
   fig = get_counties_clustering_figure(data)
   return dcc.Graph(id='counties-clustering-display', figure=fig, config={'scrollZoom': False})
+
+
+def get_embedding_features_options(data, features):
+  """Label each feature with the number of counties that would be embedded with it chosen too."""
+  feature_options = data.get_feature_options()
+  _, counts = data.count_complete_counties(features, candidates=feature_options)
+  return [{'label': f'{feature} ({counts[feature]:,d} counties)', 'value': feature} for feature in feature_options]
+
+
+def get_embedding_features_count(data, features):
+  num_complete, _ = data.count_complete_counties(features, candidates=[])
+  return f'{num_complete:,d} / {data.counties.shape[0]:,d} counties have all {len(features)} features'
+
+
+def get_embedding_features_dropdown(data):
+  return dcc.Dropdown(
+    id='embedding-features-dropdown',
+    options=get_embedding_features_options(data, data.selected_features),
+    value=list(data.selected_features),
+    multi=True,
+    placeholder='Features to embed the counties on...')
+
+
+def get_embedding_jobs_status(status):
+  """Describe the progress of a re-embedding job, from `EmbeddingJobs.status`."""
+  stage = status['stage']
+  if stage is None or stage == 'done':
+    return ''
+  if stage == 'failed':
+    return f"Embedding failed: {status['error']}"
+  return f"Embedding: {stage} ({status['elapsed_s']:.0f}s)..."
+
+
+def get_similar_counties_space_radioitems():
+  return dcc.RadioItems(
+    id='similar-counties-space-radioitems',
+    options=[{'label': 'Descriptors', 'value': 'features'}, {'label': 'Embedding', 'value': 'embedding'}],
+    value='features',
+    labelStyle={'display': 'inline-block'})
+
+
+def get_similar_counties_figure(data, space='features', k=10):
+  """Bar chart of the counties nearest to the selected county, nearest on top.
+
+  :param data: 
+  :param space: 'features' to compare the county descriptors, 'embedding' for distance in the embedding.
+  :param k: number of counties.
+  :returns: 
+  :rtype: 
+
+  """
+  neighbors = data.similar_counties(data.selected_county, k=k, space=space)
+  fips_codes = [fips for fips, _ in neighbors][::-1]
+  fig_data = [dict(
+    type='bar',
+    orientation='h',
+    x=[distance for _, distance in neighbors][::-1],
+    y=[data.fips_to_county_name[fips] for fips in fips_codes],
+    customdata=fips_codes,
+    marker=dict(color=[data.cluster_colors_map[str(data.fips_to_cluster_label[fips])] for fips in fips_codes]),
+    hoverinfo='y+x')]
+
+  title = f'Counties Most Similar to {data.fips_to_county_name[data.selected_county]}'
+  if not neighbors:
+    title += ' (missing descriptors)'
+  layout = dict(
+    title=title,
+    height=400,
+    margin=dict(l=200),
+    xaxis=dict(title='Distance' + (' in Embedding' if space == 'embedding' else ' (standardized descriptors)')),
+    hovermode='closest')
+  return dict(data=fig_data, layout=layout)
+
+
+def get_similar_counties_display(data):
+  return dcc.Graph(id='similar-counties-display', figure=get_similar_counties_figure(data))
+
+
+def get_growth_measure_radioitems():
+  return dcc.RadioItems(
+    id='growth-measure-radioitems',
+    options=[{'label': 'Cases per day', 'value': 'absolute'},
+             {'label': 'Per capita', 'value': 'per_capita'},
+             {'label': 'Relative', 'value': 'relative'}],
+    value='absolute',
+    labelStyle={'display': 'inline-block'})
+
+
+def get_growth_window_dropdown(data):
+  return dcc.Dropdown(
+    id='growth-window-dropdown',
+    options=[{'label': f'Last {days} days', 'value': days} for days in [3, 7, 14, data.max_growth_window]],
+    value=7,
+    clearable=False)
+
+
+def get_growth_ranking_figure(data, timeseries_type='infections', window=7, measure='absolute', n=20):
+  """Bar chart of the counties growing fastest over the last `window` days, fastest on top.
+
+  :param data: 
+  :param timeseries_type: 'infections' or 'deaths', or one of their rates, which ranks the counts they
+    come from.
+  :param window: days to average the growth over.
+  :param measure: 'absolute', 'per_capita' or 'relative', see `DashboardData.rank_growth`.
+  :param n: number of counties.
+  :returns: 
+  :rtype: 
+
+  """
+  timeseries_type, _ = data.split_timeseries_type(timeseries_type)
+  ranking = data.rank_growth(n, timeseries_type=timeseries_type, window=window, measure=measure)[::-1]
+  fips_codes = [fips for fips, _ in ranking]
+  fig_data = [dict(
+    type='bar',
+    orientation='h',
+    x=[growth * 100 if measure == 'relative' else growth for _, growth in ranking],
+    y=[data.fips_to_county_name[fips] for fips in fips_codes],
+    customdata=fips_codes,
+    marker=dict(color='red'),
+    hoverinfo='y+x')]
+
+  xtitle = {
+    'absolute': f'New {timeseries_type} per day',
+    'per_capita': f'New {timeseries_type} per day, per {data.per_what:,d}',
+    'relative': f'Daily growth in {timeseries_type} (%)'}[measure]
+  layout = dict(
+    title=f'Fastest Growing Counties, Last {window} Days',
+    height=max(400, 20 * n + 100),
+    margin=dict(l=200),
+    xaxis=dict(title=xtitle),
+    hovermode='closest')
+  return dict(data=fig_data, layout=layout)
+
+
+def get_growth_ranking_display(data):
+  return dcc.Graph(id='growth-ranking-display', figure=get_growth_ranking_figure(data))
+
+
+def get_effect_intervention_dropdown(data):
+  return dcc.Dropdown(
+    id='effect-intervention-dropdown',
+    options=[{'label': intervention, 'value': intervention} for intervention in data.intervention_keys],
+    value='stay at home',
+    clearable=False)
+
+
+def get_effect_window_dropdown(data):
+  return dcc.Dropdown(
+    id='effect-window-dropdown',
+    options=[{'label': f'{days} days before and after', 'value': days} for days in data.intervention_windows],
+    value=14,
+    clearable=False)
+
+
+def get_effect_group_radioitems(data):
+  return dcc.RadioItems(
+    id='effect-group-radioitems',
+    options=[{'label': f'By {group}', 'value': group} for group in data.intervention_groups],
+    value='state',
+    labelStyle={'display': 'inline-block'})
+
+
+def get_intervention_effect_figure(data, intervention='stay at home', window=14, group='state', embedding=None):
+  """Bar chart of the mean change in the growth rate of infections after an intervention, in each
+  state or cluster, with its standard error. Groups whose growth slowed the most are on top.
+
+  :param data: 
+  :param intervention: one of `data.intervention_keys`.
+  :param window: days averaged before and after, see `DashboardData.get_intervention_effects`.
+  :param group: 'state' or 'cluster'.
+  :param embedding: the clustering to group by, from `data.get_embedding`.
+  :returns: 
+  :rtype: 
+
+  """
+  effects = data.get_intervention_effects(intervention, window=window, group=group, embedding=embedding)
+  effects = effects.sort_values('change', ascending=False, kind='stable')
+  fig_data = [dict(
+    type='bar',
+    orientation='h',
+    x=effects['change'].values * 100,
+    y=effects['name'].tolist(),
+    error_x=dict(type='data', array=effects['stderr'].fillna(0).values * 100),
+    customdata=effects[['counties', 'before', 'after', 'decreased']].values * [1, 100, 100, 100],
+    marker=dict(color=np.where(effects['change'].values < 0, 'steelblue', 'red').tolist()),
+    hovertemplate=('%{y}: %{x:.2f} points<br>'
+                   '%{customdata[1]:.2f}% per day before, %{customdata[2]:.2f}% after<br>'
+                   'slowed in %{customdata[3]:.0f}% of %{customdata[0]:,.0f} counties<extra></extra>'))]
+
+  layout = dict(
+    title=f'Change in Growth Rate After {intervention}, {window} Days Before and After',
+    height=max(400, 16 * effects.shape[0] + 120),
+    margin=dict(l=120),
+    xaxis=dict(title=f'Change in daily growth of infections (% points), from {data.intervention_lag} days after'),
+    hovermode='closest')
+  return dict(data=fig_data, layout=layout)
+
+
+def get_intervention_effect_display(data):
+  return dcc.Graph(id='intervention-effect-display', figure=get_intervention_effect_figure(data))
+
+
+def get_correlations_table(data, page_size=15):
+  """Sortable table of the correlation of each county descriptor with each outcome, strongest first.
+
+  The table is sent whole, and sorted and filtered in the browser.
+
+  """
+  number = dict(type='numeric', format=Format(precision=3, scheme=Scheme.fixed))
+  columns = [dict(name=['', 'Descriptor'], id='descriptor'),
+             dict(name=['', 'Counties'], id='counties', type='numeric')]
+  for outcome in data.correlation_outcomes:
+    label = correlation_outcome_labels[outcome]
+    columns.append(dict(name=[label, 'r'], id=f'{outcome}_pearson', **number))
+    columns.append(dict(name=[label, 'rho'], id=f'{outcome}_spearman', **number))
+
+  # NaN is not json, and the cells are blank without a value
+  correlations = data.correlations.round(4)
+  correlations = correlations.astype(object).where(correlations.notna(), None)
+  return dash_table.DataTable(
+    id='correlations-table',
+    columns=columns,
+    data=correlations.to_dict('records'),
+    merge_duplicate_headers=True,
+    sort_action='native',
+    filter_action='native',
+    page_size=page_size,
+    style_cell=dict(textAlign='right'),
+    style_cell_conditional=[{'if': dict(column_id='descriptor'), 'textAlign': 'left', 'maxWidth': '400px',
+                             'overflow': 'hidden', 'textOverflow': 'ellipsis'}],
+    tooltip_data=[dict(descriptor=descriptor) for descriptor in data.correlations['descriptor']])
@@ -0,0 +1,154 @@
+"""Batch export of the timeseries figures, one file per county and format.
+
+The data is loaded once in the parent and inherited by a pool of forked workers. Each worker keeps its
+own image export engine (kaleido's chromium process, or orca's server) alive for all of its figures,
+so the engine starts once per worker rather than once per figure. Outputs newer than the source csv
+files are skipped.
+
+"""
+
+from os.path import join, exists, getmtime
+import os
+import time
+import multiprocessing as mp
+from plotly import graph_objects as go
+from plotly import io as pio
+
+from utils import elements
+
+formats = ['pdf', 'png', 'svg']
+
+default_interventions = [
+  'stay at home', 'restaurant dine-in',
+  'stay at home rollback', 'restaurant dine-in rollback']
+
+# set in each worker, by inheritance or by `_init_worker`
+_data = None
+_options = None
+
+
+def get_figure(data, fips, interventions=None):
+  """Get the daily infections figure for one county, as `plot_timeseries.py` exports it."""
+  data.selected_counties = [fips]
+  d = elements.get_timeseries_figure(
+    data, mode='Date', threshold=1, daily=True,
+    interventions=default_interventions if interventions is None else interventions)
+  fig = go.Figure(d['data'])
+  fig.update_layout(d['layout'])
+  return fig
+
+
+def get_fname(out_dir, fips, fmt):
+  return join(out_dir, f'infections_{fips}.{fmt}')
+
+
+def get_source_mtime(data):
+  """Get the time the source csv files were last modified."""
+  return max(getmtime(join(data.data_dir, fname)) for fname in data.source_files
+             if exists(join(data.data_dir, fname)))
+
+
+def read_fips_file(fname):
+  """Read FIPS codes from a file, one per line, ignoring blank lines and '#' comments."""
+  with open(fname) as file:
+    lines = [line.split('#')[0].strip() for line in file]
+  return [line.zfill(5) for line in lines if line]
+
+
+def get_cluster_fips(data, cluster):
+  """Get the FIPS codes of the counties in a cluster."""
+  return [fips for fips, label in data.fips_to_cluster_label.items() if str(label) == str(cluster)]
+
+
+def get_jobs(data, fips_codes, out_dir, fmts, force=False):
+  """List (fips, formats to write) for every county with an output missing or older than the data.
+
+  :returns: the jobs and the number of outputs skipped
+  :rtype: tuple
+
+  """
+  source_mtime = get_source_mtime(data)
+  jobs = []
+  skipped = 0
+  for fips in fips_codes:
+    todo = [fmt for fmt in fmts
+            if force or not exists(get_fname(out_dir, fips, fmt))
+            or getmtime(get_fname(out_dir, fips, fmt)) < source_mtime]
+    skipped += len(fmts) - len(todo)
+    if todo:
+      jobs.append((fips, todo))
+  return jobs, skipped
+
+
+def _init_worker(data_dir, output_dir, options):
+  global _data, _options
+  if _data is None:
+    # not forked, so load the data here, from the snapshot if there is one
+    from utils.data import DashboardData
+    _data = DashboardData.load(data_dir=data_dir, output_dir=output_dir)
+  _options = options
+
+  # start this worker's engine now, so it is reused by every figure after
+  pio.to_image(go.Figure(), format='png', engine=options['engine'])
+
+
+def _export(job):
+  fips, fmts = job
+  t = time.perf_counter()
+  fig = get_figure(_data, fips, interventions=_options['interventions'])
+  fnames = []
+  for fmt in fmts:
+    fname = get_fname(_options['out_dir'], fips, fmt)
+    fig.write_image(fname, format=fmt, height=_options['height'], width=_options['width'],
+                    scale=_options['scale'], engine=_options['engine'])
+    fnames.append(fname)
+  return fips, fnames, time.perf_counter() - t
+
+
+def export_figures(data, fips_codes, out_dir='.', fmts=('pdf',), processes=None, force=False,
+                   interventions=None, height=500, width=800, scale=5, engine='auto'):
+  """Export the timeseries figure of each county in a pool of workers.
+
+  :param data: the `DashboardData`, shared with the workers.
+  :param fips_codes: counties to export.
+  :param out_dir: directory for the figures.
+  :param fmts: any of 'pdf', 'png' and 'svg'.
+  :param processes: number of workers. Defaults to the number of cores.
+  :param force: export even the figures that are up to date.
+  :param engine: plotly image export engine.
+  :returns: dict with the files written, the number skipped and the wall time.
+  :rtype: dict
+
+  """
+  global _data
+  for fmt in fmts:
+    if fmt not in formats:
+      raise ValueError(f'bad format: {fmt}')
+  if not exists(out_dir):
+    os.makedirs(out_dir)
+
+  unknown = [fips for fips in fips_codes if fips not in data.fips_to_county_name]
+  if unknown:
+    raise ValueError(f'unknown counties: {", ".join(unknown)}')
+
+  t = time.perf_counter()
+  jobs, skipped = get_jobs(data, fips_codes, out_dir, fmts, force=force)
+  processes = min(processes or os.cpu_count(), len(jobs))
+  options = dict(out_dir=out_dir, interventions=interventions, height=height, width=width, scale=scale,
+                 engine=engine)
+  fnames = []
+  if jobs:
+    if 'fork' in mp.get_all_start_methods():
+      context = mp.get_context('fork')
+      _data = data
+    else:
+      context = mp.get_context()
+    try:
+      with context.Pool(processes, initializer=_init_worker,
+                        initargs=(data.data_dir, data.output_dir, options)) as pool:
+        for fips, written, seconds in pool.imap_unordered(_export, jobs):
+          print(f'{fips}: {seconds:.2f}s, wrote {", ".join(written)}')
+          fnames += written
+    finally:
+      _data = None
+  return dict(written=fnames, skipped=skipped, processes=processes, wall_s=time.perf_counter() - t)
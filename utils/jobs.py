@@ -0,0 +1,274 @@
+"""Background jobs that re-embed and re-cluster the counties on a chosen set of features.
+
+Fitting UMAP and the Gaussian mixture takes seconds, so the dashboard never does it in a callback.
+`EmbeddingJobs.submit` queues a fit and returns at once. Each fit runs in its own process, started by
+a background thread that waits on it, so it never holds the serving process's GIL. The callbacks poll
+`status` for progress, and `get` returns the result once it is ready. Results are cached by feature set,
+in memory and in the output directory, so choosing the same features again is instant.
+
+Several worker processes can serve the dashboard, and each has its own `EmbeddingJobs`. They share
+the results through the output directory, and a fit is claimed with a `{key}.running` file holding
+its stage, so a poll that reaches another worker reports the fit's progress rather than starting it
+again.
+
+A fit can also be run by hand:
+```sh
+python -m utils.jobs input.npz output/embeddings/{key}.npz
+```
+
+"""
+
+from os.path import join, exists, dirname, abspath
+import os
+import sys
+import json
+import time
+import queue
+import tempfile
+import argparse
+import hashlib
+import threading
+import subprocess
+import numpy as np
+
+# stages a fit reports, in order
+stages = ['queued', 'embedding', 'clustering']
+
+
+class EmbeddingJobs(object):
+  """Queue of re-embedding jobs, and a cache of their results keyed by feature set.
+
+  :param data: the `DashboardData`. Its own embedding is cached under its selected features.
+  :param cache_dir: directory for the results. Defaults to 'embeddings' in the output directory.
+  :param max_workers: number of fits to run at once.
+
+  """
+  # the fewest counties and features worth embedding
+  min_counties = 10
+  min_features = 2
+
+  def __init__(self, data, cache_dir=None, max_workers=1):
+    self.data = data
+    self.cache_dir = join(data.output_dir, 'embeddings') if cache_dir is None else cache_dir
+    self.max_workers = max_workers
+    self.results = {}
+    self.jobs = {}
+    self.lock = threading.Lock()
+    self.queue = queue.Queue()
+    self.threads = []
+    self.results[self.get_key(data.selected_features)] = data.get_embedding()
+
+  def get_key(self, features):
+    """Get the cache key of a feature set, which doesn't depend on the order of the features."""
+    h = hashlib.sha1(self.data.source_hash.encode())
+    h.update('\n'.join(sorted(features)).encode())
+    return h.hexdigest()[:16]
+
+  def _load(self, key):
+    fname = join(self.cache_dir, f'{key}.npz')
+    if not exists(fname):
+      return None
+    saved = np.load(fname)
+    return self.data.get_embedding(saved['fips_codes'], saved['embedding'], saved['cluster_labels'])
+
+  def _get_result(self, key):
+    """Get a finished result, from memory or else from the output directory, where another worker may
+    have written it."""
+    with self.lock:
+      result = self.results.get(key)
+    if result is None:
+      result = self._load(key)
+      if result is not None:
+        with self.lock:
+          result = self.results.setdefault(key, result)
+    return result
+
+  def _get_claim_fname(self, key):
+    return join(self.cache_dir, f'{key}.running')
+
+  def _read_claim(self, key):
+    """Get the stage of the fit on `key` claimed by any process, or None if no live process has."""
+    try:
+      with open(self._get_claim_fname(key)) as file:
+        claim = json.load(file)
+    except FileNotFoundError:
+      return None
+    except ValueError:
+      # just created, and not written yet
+      return dict(stage='queued', submitted=time.time(), error=None)
+    try:
+      os.kill(claim['pid'], 0)
+    except ProcessLookupError:
+      return None
+    except PermissionError:
+      pass
+    return claim
+
+  def _write_claim(self, key, job):
+    fname = self._get_claim_fname(key)
+    fd, tmp_fname = tempfile.mkstemp(dir=self.cache_dir, prefix=f'{key}.', suffix='.running.tmp')
+    with os.fdopen(fd, 'w') as file:
+      json.dump(dict(pid=os.getpid(), stage=job['stage'], submitted=job['submitted'], error=job['error']), file)
+    os.replace(tmp_fname, fname)
+
+  def _claim(self, key, job):
+    """Claim the fit on `key` for this process, unless a live process already has.
+
+    :returns: whether this process got it
+    :rtype: bool
+
+    """
+    fname = self._get_claim_fname(key)
+    while True:
+      try:
+        os.close(os.open(fname, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        break
+      except FileExistsError:
+        if self._read_claim(key) is not None:
+          return False
+        # the process that claimed it is gone
+        try:
+          os.remove(fname)
+        except FileNotFoundError:
+          pass
+    self._write_claim(key, job)
+    return True
+
+  def submit(self, features):
+    """Queue a fit on `features`, unless it is cached, already queued, or claimed by another worker.
+
+    A fit that failed isn't tried again.
+
+    :returns: the feature set's key
+    :rtype: str
+
+    """
+    features = sorted(features)
+    key = self.get_key(features)
+    with self.lock:
+      if key in self.jobs:
+        return key
+    if self._get_result(key) is not None:
+      return key
+
+    with self.lock:
+      if key in self.jobs:
+        return key
+      job = dict(features=features, stage='queued', submitted=time.time(), error=None)
+      x = self.data.get_normalized_features(features)
+      if len(features) < self.min_features or x.shape[0] < self.min_counties:
+        job.update(stage='failed', error=f'needs {self.min_features} features and {self.min_counties} '
+                   f'counties with all of them, got {len(features)} and {x.shape[0]}')
+        self.jobs[key] = job
+        return key
+
+      if not exists(self.cache_dir):
+        os.makedirs(self.cache_dir, exist_ok=True)
+      if not self._claim(key, job):
+        return key
+      self.jobs[key] = job
+
+      # named for this process, so fits of the same features elsewhere don't share it
+      fd, job['input_fname'] = tempfile.mkstemp(dir=self.cache_dir, prefix=f'{key}.', suffix='.input.npz')
+      os.close(fd)
+      np.savez(job['input_fname'],
+               x=x.values, fips_codes=np.array(x.index, dtype=str), num_clusters=self.data.num_clusters,
+               n_neighbors=self.data.reducer.n_neighbors, min_dist=self.data.reducer.min_dist)
+      if len(self.threads) < self.max_workers:
+        thread = threading.Thread(target=self._work, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+    self.queue.put(key)
+    return key
+
+  def _work(self):
+    while True:
+      key = self.queue.get()
+      job = self.jobs[key]
+      try:
+        self._run(key, job)
+      except Exception as e:
+        # the failed claim stays, so the other workers report it too rather than fitting again
+        with self.lock:
+          job.update(stage='failed', error=repr(e))
+        self._write_claim(key, job)
+      finally:
+        os.remove(job['input_fname'])
+
+  def _run(self, key, job):
+    output_fname = join(self.cache_dir, f'{key}.npz')
+    # stderr goes to the same pipe, so a child writing many warnings can't fill a pipe nobody reads
+    process = subprocess.Popen(
+      [sys.executable, '-m', 'utils.jobs', job['input_fname'], output_fname],
+      cwd=dirname(dirname(abspath(__file__))), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    last_line = None
+    for line in process.stdout:
+      if line.strip() in stages:
+        with self.lock:
+          job['stage'] = line.strip()
+        self._write_claim(key, job)
+      elif line.strip():
+        last_line = line.strip()
+    if process.wait() != 0:
+      raise RuntimeError(last_line if last_line is not None else f'exit code {process.returncode}')
+
+    result = self._load(key)
+    with self.lock:
+      self.results[key] = result
+      del self.jobs[key]
+    os.remove(self._get_claim_fname(key))
+
+  def status(self, features):
+    """Get the progress of the fit on `features`.
+
+    :returns: dict with the 'stage' (None if it was never submitted, then 'queued', 'embedding',
+      'clustering', and 'done' or 'failed'), the seconds since it was submitted, and any error.
+    :rtype: dict
+
+    """
+    key = self.get_key(features)
+    with self.lock:
+      job = self.jobs.get(key)
+    if self._get_result(key) is not None:
+      return dict(stage='done', elapsed_s=None, error=None)
+    if job is None:
+      # it may be running in another worker
+      job = self._read_claim(key)
+      if job is None:
+        return dict(stage=None, elapsed_s=None, error=None)
+    return dict(stage=job['stage'], elapsed_s=time.time() - job['submitted'], error=job['error'])
+
+  def get(self, features):
+    """Get the embedding on `features`, as `DashboardData.get_embedding` packages it, or None if it
+    isn't ready. Never waits for a fit."""
+    return self._get_result(self.get_key(features))
+
+
+def main(*, input_fname, output_fname):
+  # a single fit, reporting each stage on stdout for `EmbeddingJobs`
+  import umap
+  from sklearn.mixture import GaussianMixture
+
+  inputs = np.load(input_fname)
+  x = inputs['x']
+  print('embedding', flush=True)
+  reducer = umap.UMAP(n_neighbors=int(inputs['n_neighbors']), min_dist=float(inputs['min_dist']))
+  embedding = reducer.fit_transform(x)
+  print('clustering', flush=True)
+  cluster_labels = GaussianMixture(n_components=int(inputs['num_clusters'])).fit_predict(x)
+
+  # written under a temporary name first, so a partial result is never loaded, unique to this process
+  fd, tmp_fname = tempfile.mkstemp(dir=dirname(abspath(output_fname)), suffix='.tmp.npz')
+  os.close(fd)
+  np.savez(tmp_fname, fips_codes=inputs['fips_codes'], embedding=embedding, cluster_labels=cluster_labels)
+  os.replace(tmp_fname, output_fname)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('input_fname', help='npz file with the normalized features and fit parameters')
+  parser.add_argument('output_fname', help='npz file to write the embedding and clustering to')
+  args = parser.parse_args()
+
+  main(**args.__dict__)
@@ -0,0 +1,158 @@
+"""Per-county lookups backed by arrays rather than dicts.
+
+A `FipsLookup` is a read-only mapping from FIPS code to value, like the dicts it replaces, but it stores
+the codes as integers and the values as one array. Codes are looked up through a dense table from the
+integer code to the row, so a lookup parses the code and indexes two arrays. Keys may be given as the
+zero-padded strings the figures and callbacks use, or as integers, and iterating yields the strings.
+
+"""
+
+from collections.abc import Mapping
+import datetime as dt
+import numpy as np
+
+
+def format_fips(code):
+  """Format an integer FIPS code as the zero-padded string used in the geojson and the figures."""
+  return f'{int(code):05d}'
+
+
+class FipsLookup(Mapping):
+  """Read-only mapping from FIPS code to value.
+
+  :param fips_codes: the codes, as strings or integers.
+  :param values: one value per code.
+  :param convert: applied to each value looked up, e.g. `str` to store labels as small integers but
+    return them as strings.
+
+  """
+  def __init__(self, fips_codes, values, convert=None):
+    self.codes = np.asarray(fips_codes).astype(np.int32)
+    self.values = np.asarray(values)
+    if self.codes.shape[0] != self.values.shape[0]:
+      raise ValueError(f'got {self.codes.shape[0]} codes and {self.values.shape[0]} values')
+    self.convert = convert
+    self.rows = np.full(self.codes.max() + 1 if self.codes.size else 0, -1,
+                        dtype=np.int16 if self.codes.size < 2 ** 15 else np.int32)
+    self.rows[self.codes] = np.arange(self.codes.size)
+
+  def _row(self, fips):
+    try:
+      code = int(fips)
+    except (TypeError, ValueError):
+      raise KeyError(fips)
+    if not 0 <= code < self.rows.shape[0] or self.rows[code] < 0:
+      raise KeyError(fips)
+    return self.rows[code]
+
+  def __getitem__(self, fips):
+    value = self.values[self._row(fips)]
+    return value if self.convert is None else self.convert(value)
+
+  def __contains__(self, fips):
+    try:
+      self._row(fips)
+    except KeyError:
+      return False
+    return True
+
+  def __iter__(self):
+    return (format_fips(code) for code in self.codes)
+
+  def __len__(self):
+    return self.codes.shape[0]
+
+  def lookup(self, fips_codes):
+    """Look up many codes at once.
+
+    :param fips_codes: codes, as strings or integers.
+    :returns: the values, without `convert` applied
+    :rtype: np.ndarray
+
+    """
+    codes = np.asarray(fips_codes).astype(np.int32)
+    valid = (codes >= 0) & (codes < self.rows.shape[0])
+    rows = np.full(codes.shape, -1, dtype=self.rows.dtype)
+    rows[valid] = self.rows[codes[valid]]
+    if (rows < 0).any():
+      raise KeyError(format_fips(codes[rows < 0][0]))
+    return self.values[rows]
+
+  @property
+  def nbytes(self):
+    # object values (strings) are counted by reference, as they are shared with the tables
+    return self.codes.nbytes + self.values.nbytes + self.rows.nbytes
+
+
+class AnnotationLookup(Mapping):
+  """Read-only mapping from (FIPS code, intervention) to the annotation marking it on a timeseries figure.
+
+  Rather than keeping a dict per annotation, stores the date, position and value of each as arrays over
+  counties and interventions, and builds the dict when it is looked up. Each lookup returns a new dict.
+
+  :param fips_codes: the counties, one per row.
+  :param interventions: the intervention keys, one per column.
+  :param threshold: whether x is the number of days since the county passed the threshold, rather than
+    the date.
+  :param kwargs: properties shared by every annotation.
+
+  """
+  def __init__(self, fips_codes, interventions, threshold=False, **kwargs):
+    self.rows = FipsLookup(fips_codes, np.arange(len(fips_codes), dtype=np.int32))
+    self.interventions = list(interventions)
+    self.columns = {intervention: j for j, intervention in enumerate(self.interventions)}
+    self.threshold = threshold
+    self.kwargs = kwargs
+
+    shape = (len(fips_codes), len(self.interventions))
+    self.present = np.zeros(shape, dtype=bool)
+    self.dates = np.zeros(shape, dtype=np.int32)    # proleptic Gregorian ordinals
+    self.x = np.zeros(shape, dtype=np.int32)        # only used with `threshold`
+    self.xidx = np.zeros(shape, dtype=np.int32)
+    self.y = np.zeros(shape, dtype=np.float32)
+
+  def set(self, fips, intervention, date, xidx, y, x=0):
+    i, j = self.rows[fips], self.columns[intervention]
+    self.present[i, j] = True
+    self.dates[i, j] = date.toordinal()
+    self.x[i, j] = x
+    self.xidx[i, j] = xidx
+    self.y[i, j] = y
+
+  def _index(self, key):
+    try:
+      fips, intervention = key
+    except (TypeError, ValueError):
+      raise KeyError(key)
+    j = self.columns.get(intervention)
+    if j is None or fips not in self.rows:
+      raise KeyError(key)
+    i = self.rows[fips]
+    if not self.present[i, j]:
+      raise KeyError(key)
+    return i, j
+
+  def __getitem__(self, key):
+    i, j = self._index(key)
+    date = dt.date.fromordinal(int(self.dates[i, j]))
+    annotation = dict(
+      x=int(self.x[i, j]) if self.threshold else date.isoformat(),
+      xidx=int(self.xidx[i, j]),
+      y=float(self.y[i, j]),
+      text=date.strftime('%b %d'))
+    annotation.update(self.kwargs)
+    return annotation
+
+  def __contains__(self, key):
+    try:
+      self._index(key)
+    except KeyError:
+      return False
+    return True
+
+  def __iter__(self):
+    for i, j in zip(*self.present.nonzero()):
+      yield format_fips(self.rows.codes[i]), self.interventions[j]
+
+  def __len__(self):
+    return int(self.present.sum())
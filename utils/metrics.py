@@ -0,0 +1,250 @@
+"""Latency, payload size and cache metrics for the dashboard, exported in the Prometheus text format.
+
+Nothing is recorded until `Metrics.install` is called, so an uninstrumented app pays nothing. Once
+installed, every Dash callback is timed with its serialized payload size (the json Dash sends back),
+every figure builder is timed, and each request to the Dash endpoints is timed with its size on the
+wire. `/metrics` serves the histograms along with the hit rates of any registered caches, and a trace
+log can record one json line per request.
+
+"""
+
+import time
+import json
+import bisect
+import threading
+import functools
+import flask
+
+
+class Histogram(object):
+  """Cumulative histogram in the Prometheus style.
+
+  :param buckets: sorted upper bounds. An implicit +Inf bucket is added.
+
+  """
+  def __init__(self, buckets):
+    self.buckets = list(buckets)
+    self.counts = [0] * (len(self.buckets) + 1)
+    self.sum = 0.
+    self.count = 0
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def quantile(self, q):
+    """Estimate a quantile as the upper bound of the bucket it falls in."""
+    if self.count == 0:
+      return float('nan')
+    rank = q * self.count
+    total = 0
+    for bound, count in zip(self.buckets + [float('inf')], self.counts):
+      total += count
+      if total >= rank:
+        return bound
+    return float('inf')
+
+
+def format_labels(labels):
+  return ','.join(f'{k}="{v}"' for k, v in labels)
+
+
+def format_value(value):
+  return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class Metrics(object):
+  """Registry of histograms and caches.
+
+  Histograms are keyed by metric name and a sorted tuple of label pairs.
+
+  """
+  latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+  size_buckets = (1e2, 1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+
+  descriptions = {
+    'dashboard_callback_duration_seconds': 'Time to run a Dash callback and serialize its output.',
+    'dashboard_callback_payload_bytes': 'Size of the serialized callback output.',
+    'dashboard_figure_duration_seconds': 'Time to build a figure in utils.elements.',
+    'dashboard_request_duration_seconds': 'Time to handle a request to a Dash endpoint.',
+    'dashboard_response_bytes': 'Size of the response body on the wire, after compression.',
+  }
+
+  paths = {'/_dash-layout', '/_dash-dependencies', '/_dash-update-component'}
+
+  def __init__(self):
+    self.enabled = False
+    self.histograms = {}
+    self.caches = {}
+    self.lock = threading.Lock()
+    self.trace_file = None
+    self.trace_lock = threading.Lock()
+
+  def observe(self, name, value, buckets, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with self.lock:
+      histogram = self.histograms.get(key)
+      if histogram is None:
+        histogram = self.histograms[key] = Histogram(buckets)
+      histogram.observe(value)
+
+  def register_cache(self, name, stats):
+    """Export a cache's hit rate.
+
+    :param name: label for the cache.
+    :param stats: function returning a dict with at least 'hits' and 'misses'.
+
+    """
+    self.caches[name] = stats
+
+  def timed(self, func, name, label):
+    """Wrap `func` to record its latency in the histogram `name`, labelled `label=func.__name__`."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      t = time.perf_counter()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        self.observe(name, time.perf_counter() - t, self.latency_buckets, **{label: func.__name__})
+    return wrapper
+
+  def instrument_figures(self, module, prefix='get_', suffix='_figure'):
+    """Time every figure builder in `module`, e.g. `utils.elements`.
+
+    Functions are replaced on the module, so calls through the module, and calls between its
+    functions, are both timed.
+
+    """
+    for name in dir(module):
+      func = getattr(module, name)
+      if name.startswith(prefix) and name.endswith(suffix) and callable(func):
+        setattr(module, name, self.timed(func, 'dashboard_figure_duration_seconds', 'figure'))
+
+  def instrument_callbacks(self, app):
+    """Time every Dash callback and record the size of the json it returns.
+
+    Dash looks callbacks up in `app.callback_map` on each request, so wrapping them there includes
+    the serialization of the figure.
+
+    """
+    for output, spec in app.callback_map.items():
+      if 'callback' not in spec:
+        continue
+      spec['callback'] = self._wrap_callback(spec['callback'], output)
+
+  def _wrap_callback(self, func, output):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      t = time.perf_counter()
+      payload = func(*args, **kwargs)
+      self.observe('dashboard_callback_duration_seconds', time.perf_counter() - t,
+                   self.latency_buckets, output=output)
+      self.observe('dashboard_callback_payload_bytes', len(payload), self.size_buckets, output=output)
+      return payload
+    return wrapper
+
+  def install(self, app, modules=(), trace_log=None, path='/metrics'):
+    """Instrument a dash app and serve the metrics.
+
+    :param app: the dash app. Install after all the callbacks are defined.
+    :param modules: modules whose figure builders should be timed.
+    :param trace_log: optional file to append one json line per request to.
+    :param path: route for the metrics.
+
+    """
+    self.enabled = True
+    self.instrument_callbacks(app)
+    for module in modules:
+      self.instrument_figures(module)
+    if trace_log is not None:
+      self.trace_file = open(trace_log, 'a', buffering=1)
+
+    # time requests from before any other hook (which may answer from a cache) to after all of
+    # them (which may compress the response)
+    server = app.server
+    server.before_request_funcs.setdefault(None, []).insert(0, self._before_request)
+    server.after_request_funcs.setdefault(None, []).insert(0, self._after_request)
+    server.add_url_rule(path, 'metrics', self.serve)
+
+  def _before_request(self):
+    if flask.request.path in self.paths:
+      flask.g.metrics_start = time.perf_counter()
+
+  def _after_request(self, response):
+    start = flask.g.get('metrics_start')
+    if start is None:
+      return response
+
+    duration = time.perf_counter() - start
+    output = None
+    if flask.request.path == '/_dash-update-component':
+      output = (flask.request.get_json(silent=True) or {}).get('output')
+    labels = dict(path=flask.request.path) if output is None else dict(path=flask.request.path, output=output)
+    nbytes = 0 if response.direct_passthrough else len(response.get_data())
+    self.observe('dashboard_request_duration_seconds', duration, self.latency_buckets, **labels)
+    self.observe('dashboard_response_bytes', nbytes, self.size_buckets, **labels)
+
+    if self.trace_file is not None:
+      line = json.dumps(dict(
+        time=time.time(),
+        path=flask.request.path,
+        output=output,
+        status=response.status_code,
+        duration_ms=1000 * duration,
+        bytes=nbytes,
+        encoding=response.headers.get('Content-Encoding'),
+        cached=flask.g.get('cached', False)))
+      with self.trace_lock:
+        self.trace_file.write(line + '\n')
+    return response
+
+  def render(self):
+    """Render all the metrics in the Prometheus text format."""
+    with self.lock:
+      histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets))
+                          for key, h in self.histograms.items())
+
+    lines = []
+    seen = set()
+    for (name, labels), (counts, total, count, buckets) in histograms:
+      if name not in seen:
+        seen.add(name)
+        lines.append(f'# HELP {name} {self.descriptions.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+      cumulative = 0
+      for bound, c in zip(list(buckets) + [float('inf')], counts):
+        cumulative += c
+        bucket_labels = format_labels(labels + (('le', format_value(bound)),))
+        lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+      lines.append(f'{name}_sum{{{format_labels(labels)}}} {format_value(total)}')
+      lines.append(f'{name}_count{{{format_labels(labels)}}} {count}')
+
+    if self.caches:
+      stats = {cache: func() for cache, func in sorted(self.caches.items())}
+      for kind, help_text in [('hits', 'Requests answered from the cache.'),
+                              ('misses', 'Requests that missed the cache.')]:
+        lines.append(f'# HELP dashboard_cache_{kind}_total {help_text}')
+        lines.append(f'# TYPE dashboard_cache_{kind}_total counter')
+        for cache, s in stats.items():
+          lines.append(f'dashboard_cache_{kind}_total{{cache="{cache}"}} {s[kind]}')
+      lines.append('# HELP dashboard_cache_hit_ratio Fraction of requests answered from the cache.')
+      lines.append('# TYPE dashboard_cache_hit_ratio gauge')
+      for cache, s in stats.items():
+        total = s['hits'] + s['misses']
+        lines.append(f'dashboard_cache_hit_ratio{{cache="{cache}"}} {s["hits"] / total if total else 0.}')
+    return '\n'.join(lines) + '\n'
+
+  def serve(self):
+    return flask.Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+  def summary(self):
+    """Get the count, mean and estimated median and p95 for each histogram, e.g. for a benchmark report."""
+    with self.lock:
+      return [dict(name=name, labels=dict(labels), count=h.count, mean=h.sum / h.count if h.count else None,
+                   p50=h.quantile(0.5), p95=h.quantile(0.95))
+              for (name, labels), h in sorted(self.histograms.items())]
+
+
+# the dashboard's registry
+metrics = Metrics()
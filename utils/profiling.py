@@ -0,0 +1,222 @@
+"""Phase-level timeline of the dashboard's startup.
+
+`DashboardData` records each phase of its construction (csv parsing, gradients, annotations,
+embedding, clustering, the geojson) with a `StartupProfiler`: wall time, resident memory and the
+change in allocated Python blocks. Optionally, it also traces the peak memory allocated within each
+phase with `tracemalloc`, and dumps a cProfile of each phase.
+
+"""
+
+from os.path import join, exists
+import os
+import re
+import sys
+import time
+import json
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+
+def get_rss():
+  """Get the current resident set size of this process, in bytes, or None if it isn't available."""
+  try:
+    with open('/proc/self/statm') as file:
+      return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, ValueError, IndexError):
+    return None
+
+
+def get_peak_rss():
+  """Get the peak resident set size of this process so far, in bytes."""
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # kilobytes on linux, bytes on macOS
+  return peak if sys.platform == 'darwin' else 1024 * peak
+
+
+def get_size(obj, seen=None):
+  """Estimate the bytes held by an object and everything it references.
+
+  :param obj: any object. Tables and arrays are measured with `memory_usage(deep=True)` and `nbytes`,
+    containers and objects by walking what they hold.
+  :param seen: ids of objects already counted, which count as 0. Updated in place.
+  :returns: bytes
+  :rtype: int
+
+  """
+  if seen is None:
+    seen = set()
+  if id(obj) in seen:
+    return 0
+  seen.add(id(obj))
+
+  if isinstance(obj, pd.DataFrame):
+    return int(obj.memory_usage(deep=True).sum())
+  if isinstance(obj, (pd.Series, pd.Index)):
+    return int(obj.memory_usage(deep=True))
+  if isinstance(obj, np.ndarray):
+    size = obj.nbytes
+    if obj.dtype == object:
+      size += sum(get_size(x, seen) for x in obj.flat)
+    return size
+  if hasattr(obj, 'get_arrays'):
+    # sklearn's trees
+    return sum(get_size(a, seen) for a in obj.get_arrays())
+
+  size = sys.getsizeof(obj)
+  if isinstance(obj, dict):
+    size += sum(get_size(k, seen) + get_size(v, seen) for k, v in obj.items())
+  elif isinstance(obj, (list, tuple, set, frozenset)):
+    size += sum(get_size(x, seen) for x in obj)
+  elif hasattr(obj, '__dict__'):
+    size += get_size(vars(obj), seen)
+  return size
+
+
+class StartupProfiler(object):
+  """Record a timeline of (possibly nested) phases.
+
+  :param track_allocations: trace the peak memory allocated in each phase with tracemalloc, which slows
+    everything down.
+  :param cprofile_dir: if given, dump a cProfile of each phase here. A nested phase is left out of its
+    parent's profile.
+
+  """
+  def __init__(self, track_allocations=False, cprofile_dir=None):
+    self.track_allocations = track_allocations
+    self.cprofile_dir = cprofile_dir
+    self.phases = []
+    self.stack = []
+    self.finished = False
+    self.start = time.perf_counter()
+
+    if self.cprofile_dir is not None and not exists(self.cprofile_dir):
+      os.makedirs(self.cprofile_dir)
+    if self.track_allocations and not tracemalloc.is_tracing():
+      tracemalloc.start()
+
+  @contextmanager
+  def phase(self, name):
+    """Record the enclosed code as a phase of the timeline.
+
+    Does nothing once the profiler is finished, so code that runs both at startup and later only
+    shows up once.
+
+    """
+    if self.finished:
+      yield
+      return
+
+    index = len(self.phases)
+    record = dict(name=name, depth=len(self.stack), start_s=time.perf_counter() - self.start)
+    self.phases.append(record)
+    parent_profile = self.stack[-1].get('profile') if self.stack else None
+    if parent_profile is not None:
+      parent_profile.disable()
+    if self.cprofile_dir is not None:
+      record['profile'] = cProfile.Profile()
+    if self.track_allocations:
+      # python < 3.9 can't reset the peak, so only the net allocation is traced there
+      if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+      traced_start, _ = tracemalloc.get_traced_memory()
+
+    self.stack.append(record)
+    blocks = sys.getallocatedblocks()
+    rss = get_rss()
+    t = time.perf_counter()
+    if 'profile' in record:
+      record['profile'].enable()
+    try:
+      yield
+    finally:
+      if 'profile' in record:
+        record['profile'].disable()
+      record['wall_s'] = time.perf_counter() - t
+      record['rss_bytes'] = get_rss()
+      record['rss_delta_bytes'] = None if rss is None else record['rss_bytes'] - rss
+      record['peak_rss_bytes'] = get_peak_rss()
+      record['allocated_blocks'] = sys.getallocatedblocks() - blocks
+      if self.track_allocations:
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        if not hasattr(tracemalloc, 'reset_peak'):
+          traced_peak = traced
+        # a nested phase resets the peak, so it hands its own peak up to the parent
+        traced_peak = max(traced_peak, record.pop('child_traced_peak', 0))
+        record['traced_peak_bytes'] = traced_peak - traced_start
+      self.stack.pop()
+      if self.track_allocations and self.stack:
+        self.stack[-1]['child_traced_peak'] = max(self.stack[-1].get('child_traced_peak', 0), traced_peak)
+
+      profile = record.pop('profile', None)
+      if profile is not None:
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_')
+        record['cprofile'] = join(self.cprofile_dir, f'{index:02d}_{slug}.prof')
+        profile.dump_stats(record['cprofile'])
+      if parent_profile is not None:
+        parent_profile.enable()
+
+  def record(self, name, started, wall_s, thread=None):
+    """Record a phase timed elsewhere, e.g. on another thread, nested under the current phase.
+
+    Memory isn't recorded, as it is shared with whatever ran at the same time.
+
+    :param started: `time.perf_counter()` when the phase started.
+
+    """
+    if self.finished:
+      return
+    self.phases.append(dict(
+      name=name, depth=len(self.stack), start_s=started - self.start, wall_s=wall_s, thread=thread,
+      rss_bytes=None, rss_delta_bytes=None, peak_rss_bytes=None, allocated_blocks=None))
+
+  def finish(self):
+    """Stop recording phases."""
+    self.finished = True
+    if self.track_allocations:
+      tracemalloc.stop()
+
+  def as_dict(self):
+    return dict(
+      total_s=sum(p['wall_s'] for p in self.phases if p['depth'] == 0 and 'wall_s' in p),
+      peak_rss_bytes=get_peak_rss(),
+      phases=self.phases)
+
+  def to_json(self, fname=None):
+    """Get the timeline as json, and write it to `fname` if given."""
+    s = json.dumps(self.as_dict(), indent=2)
+    if fname is not None:
+      with open(fname, 'w') as file:
+        file.write(s)
+    return s
+
+  def table(self):
+    """Format the timeline as a table, with nested phases indented under their parents."""
+    mb = 1 / 2 ** 20
+    header = f"{'phase':44s} {'wall':>9s} {'rss':>9s} {'+rss':>9s} {'peak rss':>9s} {'+blocks':>10s}"
+    if self.track_allocations:
+      header += f" {'traced':>9s}"
+    lines = [header, '-' * len(header)]
+    for p in self.phases:
+      if 'wall_s' not in p:
+        continue
+      name = '  ' * p['depth'] + p['name']
+      line = (f"{name[:44]:44s} {p['wall_s']:8.3f}s "
+              + ' '.join(f'{b * mb:7.1f}MB' if b is not None else f"{'-':>9s}"
+                         for b in [p['rss_bytes'], p['rss_delta_bytes'], p['peak_rss_bytes']])
+              + (f" {p['allocated_blocks']:10,d}" if p['allocated_blocks'] is not None else f" {'-':>10s}"))
+      if self.track_allocations:
+        line += f" {p['traced_peak_bytes'] * mb:7.1f}MB" if 'traced_peak_bytes' in p else f" {'-':>9s}"
+      lines.append(line)
+    lines.append('-' * len(header))
+    lines.append(f"{'total':44s} {self.as_dict()['total_s']:8.3f}s")
+    return '\n'.join(lines)
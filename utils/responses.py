@@ -0,0 +1,231 @@
+"""Compression and ETag revalidation for the dashboard's Flask responses.
+
+Layout and callback payloads above a size threshold are compressed with brotli (when the package is
+installed) or gzip. Every payload gets an ETag derived from the data version and, for callbacks, the
+callback inputs, so a repeat request can be answered with a 304 or from the cache of encoded bodies
+without running the callback again.
+
+"""
+
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import flask
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+
+def get_etag(version, key):
+  """Get the ETag for a payload.
+
+  :param version: the data version, e.g. `DashboardData.version`.
+  :param key: bytes identifying the payload within that version.
+  :returns: the (unquoted) entity tag
+  :rtype: str
+
+  """
+  h = hashlib.sha1(version.encode())
+  h.update(key)
+  return h.hexdigest()[:32]
+
+
+def get_callback_key(body, include_trigger=False):
+  """Get the part of a `/_dash-update-component` request body that determines its response.
+
+  `changedPropIds` is left out, since it only records which input triggered the request, unless the
+  callback's response depends on that too.
+
+  :param body: the parsed request json.
+  :param include_trigger: include `changedPropIds`.
+  :returns: canonical bytes for the output, inputs and state.
+  :rtype: bytes
+
+  """
+  key = [body.get('output'), body.get('inputs'), body.get('state')]
+  if include_trigger:
+    key.append(sorted(body.get('changedPropIds') or []))
+  return json.dumps(key, sort_keys=True).encode()
+
+
+def get_accepted_encodings(accept_encoding):
+  """Parse the Accept-Encoding request header, ignoring q-values."""
+  return {e.split(';')[0].strip() for e in accept_encoding.split(',')}
+
+
+def compress(body, accept_encoding, gzip_level=6, brotli_quality=5):
+  """Compress a response body with the best encoding the client accepts.
+
+  :param body: bytes to compress.
+  :param accept_encoding: value of the Accept-Encoding request header.
+  :returns: (compressed body, encoding), with encoding None if the client accepts neither.
+  :rtype: tuple
+
+  """
+  accepted = get_accepted_encodings(accept_encoding)
+  if brotli is not None and 'br' in accepted:
+    return brotli.compress(body, quality=brotli_quality), 'br'
+  elif 'gzip' in accepted:
+    return gzip.compress(body, compresslevel=gzip_level), 'gzip'
+  else:
+    return body, None
+
+
+class CompressedResponses(object):
+  """Compress and validate the dashboard's json responses.
+
+  Pass `compress=False` to `dash.Dash` so responses aren't compressed twice.
+
+  :param server: the flask server, e.g. `app.server`.
+  :param version: the data version, e.g. `data.version`.
+  :param threshold: minimum body size, in bytes, worth compressing.
+  :param cacheable_outputs: callback outputs (like 'timeseries-store.data') which depend only on
+    their inputs and the data version. They get an ETag, their encoded responses are kept, and a
+    repeat request skips the callback. The layout, which is fixed once the app starts, is always
+    cached.
+  :param trigger_outputs: those of `cacheable_outputs` whose response also depends on which input
+    triggered the callback (through `dash.callback_context.triggered`), which are cached by trigger too.
+  :param max_entries: maximum number of responses to keep.
+
+  """
+  layout_path = '/_dash-layout'
+  callback_path = '/_dash-update-component'
+  paths = {layout_path, callback_path, '/_dash-dependencies'}
+
+  def __init__(self, server, version, threshold=1024, cacheable_outputs=None, trigger_outputs=None,
+               max_entries=512):
+    self.version = version
+    self.threshold = threshold
+    self.cacheable_outputs = set() if cacheable_outputs is None else set(cacheable_outputs)
+    self.trigger_outputs = set() if trigger_outputs is None else set(trigger_outputs)
+    self.max_entries = max_entries
+    self.cache = OrderedDict()  # etag -> {encoding: body}
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.bytes_in = 0
+    self.bytes_out = 0
+
+    server.before_request(self._before_request)
+    server.after_request(self._after_request)
+
+  def _before_request(self):
+    request = flask.request
+    if request.path not in self.paths:
+      return None
+    flask.g.compress = True
+
+    # callbacks that depend on server state (like the selected county) get no validator
+    if request.path == self.callback_path:
+      body = request.get_json(silent=True) or {}
+      if body.get('output') not in self.cacheable_outputs:
+        return None
+      output = body.get('output')
+      etag = get_etag(self.version, get_callback_key(body, include_trigger=output in self.trigger_outputs))
+    else:
+      # the layout and dependencies are fixed once the app starts
+      etag = get_etag(self.version, request.path.encode())
+    flask.g.etag = etag
+
+    if request.if_none_match.contains(etag):
+      self.hits += 1
+      flask.g.cached = True
+      return self._not_modified(etag)
+
+    with self.lock:
+      bodies = self.cache.get(etag)
+      if bodies is not None:
+        self.cache.move_to_end(etag)
+    if bodies is not None:
+      self.hits += 1
+      flask.g.cached = True
+      return self._cached_response(etag, bodies)
+    self.misses += 1
+    return None
+
+  def _after_request(self, response):
+    if (not flask.g.get('compress')
+        or response.status_code != 200
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers):
+      return response
+
+    body = response.get_data()
+    etag = flask.g.get('etag')
+    if etag is not None:
+      response.set_etag(etag)
+      response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+
+    if etag is not None:
+      with self.lock:
+        self.cache[etag] = {None: body}
+        while len(self.cache) > self.max_entries:
+          self.cache.popitem(last=False)
+
+    if len(body) >= self.threshold:
+      compressed, encoding = compress(body, flask.request.headers.get('Accept-Encoding', ''))
+      if encoding is not None:
+        self.bytes_in += len(body)
+        self.bytes_out += len(compressed)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag is not None:
+          with self.lock:
+            bodies = self.cache.get(etag)
+            if bodies is not None:
+              bodies[encoding] = compressed
+    return response
+
+  def _not_modified(self, etag):
+    response = flask.Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+  def _cached_response(self, etag, bodies):
+    """Build the response for a cached callback, compressing it for a new encoding if needed."""
+    body = bodies[None]
+    encoding = None
+    if len(body) >= self.threshold:
+      accept_encoding = flask.request.headers.get('Accept-Encoding', '')
+      accepted = get_accepted_encodings(accept_encoding)
+      encoding = next((e for e in bodies if e is not None and e in accepted), None)
+      if encoding is None:
+        compressed, encoding = compress(body, accept_encoding)
+        if encoding is not None:
+          bodies[encoding] = compressed
+      if encoding is not None:
+        body = bodies[encoding]
+
+    response = flask.Response(body, mimetype='application/json')
+    if encoding is not None:
+      response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+
+    # the cached response is already encoded, so leave it alone in `_after_request`
+    flask.g.compress = False
+    return response
+
+  def stats(self):
+    """Get the cache hit rate and the compression savings so far.
+
+    :returns: dict of counts
+    :rtype: dict
+
+    """
+    total = self.hits + self.misses
+    return dict(
+      hits=self.hits,
+      misses=self.misses,
+      hit_rate=self.hits / total if total > 0 else 0.,
+      entries=len(self.cache),
+      bytes_in=self.bytes_in,
+      bytes_out=self.bytes_out)
@@ -0,0 +1,196 @@
+"""Fast json encoding of figures and Dash responses.
+
+Dash encodes every callback response and the layout with plotly's `PlotlyJSONEncoder`, which tries a
+series of conversions on each numpy array, pandas series and plotly object in Python, and then parses
+and re-encodes the whole result to replace NaNs. `dumps` encodes the same payloads with orjson, which
+writes numpy arrays natively, and only falls back to Python for what orjson doesn't know. Without
+orjson installed, it uses `PlotlyJSONEncoder`. The output is the same json either way, except that
+orjson writes float32 arrays in the shortest form that reads back as the same float32, where plotly
+writes them with all the digits of the float64 they widen to.
+
+Parts of a payload that never change, like the county boundaries, can be encoded once with
+`preserialize` and spliced into each payload that contains them.
+
+`typed_array` packs a numeric array into base64, for the browser to unpack into a typed array.
+
+`install(app)` makes a Dash app encode its callback responses and its layout with `dumps`.
+
+"""
+
+import json
+import base64
+import functools
+import collections
+import itertools
+import numpy as np
+import pandas as pd
+import plotly
+import flask
+
+import dash
+from dash.exceptions import PreventUpdate
+from dash._utils import stringify_id
+from dash import _validate
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+if orjson is not None:
+  options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class Preserialized(object):
+  """A part of a payload encoded once, and spliced into every payload holding it.
+
+  Plotly's encoder sees the original object, through `to_plotly_json`.
+
+  """
+  _tokens = itertools.count()
+
+  def __init__(self, obj):
+    self.obj = obj
+    self.json = dumps(obj)
+    self.token = f'__preserialized_{next(self._tokens)}__'
+
+  def to_plotly_json(self):
+    return self.obj
+
+
+_preserialized = {}
+
+
+def preserialize(obj):
+  """Encode `obj` once, or get it as it was encoded before.
+
+  :param obj: anything that doesn't change for the life of the process, e.g. the geojson.
+  :rtype: Preserialized
+
+  """
+  entry = _preserialized.get(id(obj))
+  if entry is None or entry.obj is not obj:
+    entry = _preserialized[id(obj)] = Preserialized(obj)
+  return entry
+
+
+def typed_array(a, dtype=None):
+  """Pack a numeric array as base64 of its bytes, which is about a third the size of the json list
+  for float32 values, and unpacks straight into a typed array (see `unpackTypedArrays` in
+  `assets/clientside.js`).
+
+  :param a: 1-D numeric array.
+  :param dtype: the dtype to pack it as, e.g. 'f4', 'u1'. Defaults to the array's own.
+  :returns: dict with the little-endian `dtype` code, e.g. 'f4', and the base64 `bdata`
+  :rtype: dict
+
+  """
+  a = np.ascontiguousarray(a, dtype=dtype)
+  a = a.astype(a.dtype.newbyteorder('<'), copy=False)
+  return dict(dtype=a.dtype.str[1:], bdata=base64.b64encode(a.tobytes()).decode('ascii'))
+
+
+def _default(obj, spliced):
+  # only called for what orjson can't encode itself
+  if isinstance(obj, Preserialized):
+    spliced[obj.token] = obj
+    return obj.token
+  if isinstance(obj, np.ndarray):
+    if obj.dtype.kind in 'biuf' and obj.dtype != np.float16:
+      return np.ascontiguousarray(obj)
+    return obj.tolist()
+  if isinstance(obj, (pd.Series, pd.Index)):
+    return np.asarray(obj)
+  if isinstance(obj, np.generic):
+    return obj.item()
+  if obj is pd.NaT:
+    return None
+  if isinstance(obj, pd.Timestamp):
+    return obj.isoformat()
+  if hasattr(obj, 'to_plotly_json'):
+    # plotly figures and traces, and dash components
+    return obj.to_plotly_json()
+  raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class _PlotlyEncoder(plotly.utils.PlotlyJSONEncoder):
+  # for when orjson isn't installed
+  def __init__(self, *args, spliced=None, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.spliced = spliced
+
+  def default(self, obj):
+    if isinstance(obj, Preserialized):
+      self.spliced[obj.token] = obj
+      return obj.token
+    return super().default(obj)
+
+
+def dumps(obj):
+  """Encode `obj` as json, like `PlotlyJSONEncoder`.
+
+  NaN and infinite values become null. Numpy arrays, pandas series, plotly objects, dash components
+  and `Preserialized` parts may appear anywhere.
+
+  :rtype: bytes
+
+  """
+  spliced = {}
+  if orjson is not None:
+    encoded = orjson.dumps(obj, default=functools.partial(_default, spliced=spliced), option=options)
+  else:
+    encoded = json.dumps(obj, cls=_PlotlyEncoder, spliced=spliced).encode()
+  for token, part in spliced.items():
+    encoded = encoded.replace(f'"{token}"'.encode(), part.json)
+  return encoded
+
+
+def _encode_callback(func, multi, callback_id):
+  # what dash's own callback wrapper does, with the same validation, but encoding with `dumps`
+  @functools.wraps(func)
+  def add_context(*args, **kwargs):
+    output_spec = kwargs.pop('outputs_list')
+    output_value = func(*args, **kwargs)
+    if isinstance(output_value, type(dash.no_update)):
+      raise PreventUpdate
+    if not multi:
+      output_value, output_spec = [output_value], [output_spec]
+    _validate.validate_multi_return(output_spec, output_value, callback_id)
+
+    component_ids = collections.defaultdict(dict)
+    for value, spec in zip(output_value, output_spec):
+      if isinstance(value, type(dash.no_update)):
+        continue
+      # pattern-matching outputs have a list of values and specs
+      for value_i, spec_i in (zip(value, spec) if isinstance(spec, list) else [(value, spec)]):
+        if not isinstance(value_i, type(dash.no_update)):
+          component_ids[stringify_id(spec_i['id'])][spec_i['property']] = value_i
+    if not component_ids:
+      raise PreventUpdate
+
+    try:
+      return dumps({'response': component_ids, 'multi': True})
+    except TypeError:
+      # orjson's errors are TypeErrors too. This raises dash's InvalidCallbackReturnValue, naming the
+      # value that can't be encoded
+      _validate.fail_callback_output(output_value, callback_id)
+      raise
+  return add_context
+
+
+def install(app):
+  """Encode a dash app's callback responses and layout with `dumps`.
+
+  :param app: the dash app. Install after all the callbacks are defined, and before anything else
+    that wraps them, like `metrics.install`.
+
+  """
+  for output, spec in app.callback_map.items():
+    if 'callback' not in spec:
+      continue
+    spec['callback'] = _encode_callback(spec['callback'].__wrapped__, output.startswith('..'), output)
+
+  def serve_layout():
+    return flask.Response(dumps(app._layout_value()), mimetype='application/json')
+
+  app.server.view_functions[app.config.routes_pathname_prefix + '_dash-layout'] = serve_layout
@@ -0,0 +1,152 @@
+"""Warm-start snapshots of a fully built `DashboardData`.
+
+A snapshot is a directory holding:
+- one `.npy` file per large numeric array, which is memory-mapped on load rather than read. Those are
+  the embedding and the numeric columns of every table with enough of them (the timeseries and
+  gradient matrices, the county descriptors), in their most common dtype;
+- `objects.pkl`, with everything else (the remaining columns, lookups, annotations, the geojson);
+- `manifest.json`, with the snapshot format version, the hash of the source csv files and the data
+  version. It is written last, so a partial snapshot is never loaded.
+
+A snapshot is stale when its format version or source hash don't match, and then the data is built
+from the csv files again.
+
+"""
+
+from os.path import join, exists
+import os
+import json
+import time
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+
+# bump this whenever the attributes of `DashboardData` or the layout of a snapshot change
+format_version = 12
+
+manifest_file = 'manifest.json'
+objects_file = 'objects.pkl'
+
+# attributes that belong to one process, or are only needed to build the data, and aren't saved
+excluded = {'profiler', 'reducer', 'clusterer'}
+
+# tables with fewer bytes of numeric columns than this are pickled whole
+min_mapped_bytes = 1 << 16
+
+
+def get_mapped_columns(df):
+  """Get a mask of the columns of a table worth memory-mapping, or None if it isn't one.
+
+  These are the numeric columns of whichever dtype takes the most space, so they can be stored as one
+  array.
+
+  """
+  if not isinstance(df, pd.DataFrame):
+    return None
+  sizes = {}
+  for dtype in df.dtypes:
+    if isinstance(dtype, np.dtype) and dtype.kind in 'iuf':
+      sizes[dtype] = sizes.get(dtype, 0) + dtype.itemsize * df.shape[0]
+  if not sizes or max(sizes.values()) < min_mapped_bytes:
+    return None
+  dtype = max(sizes, key=sizes.get)
+  return (df.dtypes == dtype).values
+
+
+def save_snapshot(data, snapshot_dir):
+  """Write a snapshot of `data`, replacing any snapshot already in `snapshot_dir`.
+
+  :param data: a `DashboardData`.
+  :param snapshot_dir: directory to write to.
+  :returns: the manifest
+  :rtype: dict
+
+  """
+  tmp_dir = snapshot_dir.rstrip('/') + '.tmp'
+  if exists(tmp_dir):
+    shutil.rmtree(tmp_dir)
+  os.makedirs(tmp_dir)
+
+  arrays = {}    # attribute name -> 'ndarray' or 'frame'
+  objects = {}
+  for name, value in vars(data).items():
+    if name in excluded:
+      continue
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+      np.save(join(tmp_dir, f'{name}.npy'), value)
+      arrays[name] = 'ndarray'
+    elif get_mapped_columns(value) is not None:
+      mask = get_mapped_columns(value)
+      np.save(join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(value.loc[:, mask].values))
+      others = [(j, column, value.iloc[:, j].values) for j, column in enumerate(value.columns) if not mask[j]]
+      objects[name] = dict(columns=value.columns[mask], others=others, index=value.index)
+      arrays[name] = 'frame'
+    else:
+      objects[name] = value
+
+  with open(join(tmp_dir, objects_file), 'wb') as file:
+    pickle.dump(objects, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+  manifest = dict(
+    format_version=format_version,
+    source_hash=data.source_hash,
+    version=data.version,
+    created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+    arrays=arrays)
+  with open(join(tmp_dir, manifest_file), 'w') as file:
+    json.dump(manifest, file, indent=2)
+
+  if exists(snapshot_dir):
+    shutil.rmtree(snapshot_dir)
+  os.rename(tmp_dir, snapshot_dir)
+  return manifest
+
+
+def read_manifest(snapshot_dir):
+  """Read a snapshot's manifest, or None if there's no complete snapshot there."""
+  fname = join(snapshot_dir, manifest_file)
+  if not exists(fname):
+    return None
+  with open(fname) as file:
+    return json.load(file)
+
+
+def is_fresh(manifest, source_hash):
+  """Check that a snapshot was written by this code, from the current source files."""
+  return (manifest is not None
+          and manifest.get('format_version') == format_version
+          and manifest.get('source_hash') == source_hash)
+
+
+def load_snapshot(cls, snapshot_dir, mmap_mode='r'):
+  """Load a snapshot without running `cls.__init__`.
+
+  :param cls: the class to instantiate, `DashboardData`.
+  :param snapshot_dir: directory with the snapshot.
+  :param mmap_mode: passed to `np.load` for the large arrays. 'r' maps them read-only, so the pages
+    are shared by every process loading the same snapshot.
+  :returns: the loaded object
+  :rtype: cls
+
+  """
+  manifest = read_manifest(snapshot_dir)
+  with open(join(snapshot_dir, objects_file), 'rb') as file:
+    objects = pickle.load(file)
+
+  for name, kind in manifest['arrays'].items():
+    values = np.load(join(snapshot_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+    if kind == 'frame':
+      meta = objects[name]
+      # build the numeric block as a view of the mapped array, then put the other columns back in place,
+      # each as its own block
+      df = pd.DataFrame(values, columns=meta['columns'], index=meta['index'], copy=False)
+      for j, column, column_values in meta['others']:
+        df.insert(j, column, column_values)
+      objects[name] = df
+    else:
+      objects[name] = values
+
+  data = cls.__new__(cls)
+  data.__dict__.update(objects)
+  return data
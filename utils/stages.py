@@ -0,0 +1,61 @@
+"""Run the independent stages of a computation concurrently, as a small dependency graph.
+
+Each stage is a function of no arguments and the names of the stages it depends on. A stage starts on
+a thread pool as soon as everything it depends on has finished, so stages that don't depend on each
+other overlap. Threads rather than processes, because the stages hand back large tables, which would
+otherwise be pickled between processes; csv parsing and the numpy and scipy kernels release the GIL
+for much of their work.
+
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def _run(name, func, start):
+  t = time.perf_counter()
+  result = func()
+  return result, dict(name=name, start_s=t - start, wall_s=time.perf_counter() - t,
+                      thread=threading.current_thread().name)
+
+
+def run_stages(stages, max_workers=None, profiler=None):
+  """Run `stages` on a thread pool, each once the stages it depends on have finished.
+
+  :param stages: dict from a stage's name to (function, names of the stages it depends on). The
+    functions take no arguments.
+  :param max_workers: number of threads. 1 runs the stages one at a time, in the order given.
+  :param profiler: `StartupProfiler` to record the timing of each stage with.
+  :returns: the timing of each stage, in the order they finished, with the return value of each
+    stage by name
+  :rtype: tuple
+
+  """
+  for name, (_, dependencies) in stages.items():
+    for dependency in dependencies:
+      if dependency not in stages:
+        raise ValueError(f'stage {name} depends on unknown stage {dependency}')
+
+  start = time.perf_counter()
+  pending = dict(stages)
+  running = {}
+  results = {}
+  timings = []
+  with ThreadPoolExecutor(max_workers, thread_name_prefix='stage') as pool:
+    while pending or running:
+      for name, (func, dependencies) in list(pending.items()):
+        if all(dependency in results for dependency in dependencies):
+          running[pool.submit(_run, name, func, start)] = name
+          del pending[name]
+      if not running:
+        raise ValueError(f'stages depend on each other: {", ".join(pending)}')
+
+      done, _ = wait(running, return_when=FIRST_COMPLETED)
+      for future in done:
+        name = running.pop(future)
+        results[name], timing = future.result()
+        timings.append(timing)
+        if profiler is not None:
+          profiler.record(name, start + timing['start_s'], timing['wall_s'], thread=timing['thread'])
+  return timings, results